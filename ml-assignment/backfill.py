@@ -0,0 +1,140 @@
+"""
+Point-in-time feature backfill: one contract history, many as-of dates.
+
+`ContractHistory` validates and sorts an applicant's contracts once per
+feature; `features(as_of_dates)` then answers every as-of date with vectorized
+searchsorted over the sorted dates. Only records dated on or before the as-of
+date are visible, so nothing from the as-of date's future leaks in:
+
+    count_in_window  claims with claim_date in [as_of - window, as_of]
+    sum              loans with contract_date <= as_of (prefix sums)
+    days_since_max   latest contract_date <= as_of
+    claim sentinels  claims with claim_date <= as_of
+
+Records without the date that places them in time are never visible. As of an
+application's own date the result equals `calculate_features`, unless the
+history holds contracts dated after it (which `calculate_features` counts).
+
+Usage:
+    python backfill.py --history contracts.json --as-of 2023-01-01,2023-07-01 --output features.csv
+    python backfill.py --input ml-assignment/data.csv --id 2925211.0 --as-of-file dates.txt
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from dates import parse_application_day
+from feature_registry import CLAIM_DATE_FIELD, CLAIM_FIELD, FeatureRegistry, default_registry
+from ingestion import ContractColumns
+
+
+class ContractHistory:
+    """An applicant's contract history, pre-sorted for point-in-time feature queries"""
+
+    def __init__(self, contracts: Union[ContractColumns, Iterable[dict]],
+                 registry: Optional[FeatureRegistry] = None):
+        self.registry = registry or default_registry()
+        columns = ContractColumns.from_contracts(
+            contracts if isinstance(contracts, ContractColumns) else list(contracts))
+        self.size = columns.size
+
+        claim_days = [day for claim, day in zip(columns[CLAIM_FIELD], columns[CLAIM_DATE_FIELD])
+                      if claim != '' and day is not None]
+        self.claim_days = np.sort(np.array(claim_days, dtype=np.int64))
+
+        # Per feature: sorted dates of the matching contracts, plus prefix sums for sums
+        self.days: Dict[str, np.ndarray] = {}
+        self.prefix: Dict[str, np.ndarray] = {}
+        for spec in self.registry.specs:
+            date_field = spec.date_field
+            if date_field is None:
+                raise ValueError(f"{spec.name}: no date field places its contracts in time")
+            values, dates = columns[spec.field], columns[date_field]
+            rows = [k for k in range(columns.size)
+                    if values[k] is not None and dates[k] is not None and spec.matches(columns, k)]
+            days = np.array([dates[k] for k in rows], dtype=np.int64)
+            order = np.argsort(days, kind='stable')
+            self.days[spec.name] = days[order]
+            if spec.aggregation == 'sum':
+                amounts = np.array([values[k] for k in rows], dtype=np.float64)[order]
+                self.prefix[spec.name] = np.concatenate(([0.0], np.cumsum(amounts)))
+
+    def features(self, as_of_dates: Iterable[Any]) -> Dict[str, np.ndarray]:
+        """{feature: values}, one value per as-of date (timestamps; the wall-clock date is used)"""
+        as_of = np.array([parse_application_day(value) for value in as_of_dates], dtype=np.int64)
+        has_claims = np.searchsorted(self.claim_days, as_of, side='right') > 0
+        features = {}
+        for spec in self.registry.specs:
+            if spec.if_no_claims is None:
+                missing = np.full(as_of.shape, spec.if_missing)
+            else:
+                missing = np.where(has_claims, spec.if_missing, spec.if_no_claims)
+            days = self.days[spec.name]
+            visible = np.searchsorted(days, as_of, side='right')
+            if spec.aggregation == 'count_in_window':
+                count = visible - np.searchsorted(days, as_of - int(spec.window_days), side='left')
+                features[spec.name] = np.where(count > 0, count, missing)
+            elif spec.aggregation == 'sum':
+                features[spec.name] = np.where(visible > 0, self.prefix[spec.name][visible], missing)
+            else:
+                latest = days[np.maximum(visible - 1, 0)] if days.size else np.zeros_like(as_of)
+                features[spec.name] = np.where(visible > 0, as_of - latest, missing)
+        return features
+
+
+def backfill_features(contracts: Union[ContractColumns, Iterable[dict]], as_of_dates: List[Any],
+                      registry: Optional[FeatureRegistry] = None) -> pd.DataFrame:
+    """One row per as-of date: as_of_date plus every registered feature"""
+    history = ContractHistory(contracts, registry)
+    return pd.DataFrame({'as_of_date': list(as_of_dates), **history.features(as_of_dates)})
+
+
+def _read_as_of(args: argparse.Namespace) -> List[str]:
+    dates = [d.strip() for value in args.as_of or [] for d in value.split(',') if d.strip()]
+    if args.as_of_file:
+        with open(args.as_of_file) as f:
+            dates += [line.strip() for line in f if line.strip()]
+    if not dates:
+        raise SystemExit("No as-of dates given; use --as-of and/or --as-of-file")
+    return dates
+
+
+def _read_history(args: argparse.Namespace) -> List[dict]:
+    if args.history:
+        with open(args.history) as f:
+            contracts = json.load(f)
+    else:
+        df = pd.read_csv(args.input, dtype=str, keep_default_na=False)
+        rows = df[df['id'] == args.id]
+        if rows.empty:
+            raise SystemExit(f"No application with id {args.id} in {args.input}")
+        contracts_json = rows['contracts'].iloc[0]
+        contracts = json.loads(contracts_json) if contracts_json else []
+    return [c for c in contracts if isinstance(c, dict)]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Point-in-time features for one contract history at many as-of dates")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--history', help="JSON file with the contracts list")
+    source.add_argument('--id', help="take the history of this application id from --input")
+    parser.add_argument('--input', default='ml-assignment/data.csv', help="applications CSV used with --id")
+    parser.add_argument('--as-of', action='append', help="as-of dates, comma-separated (repeatable)")
+    parser.add_argument('--as-of-file', help="file with one as-of date per line")
+    parser.add_argument('--output', default=None, help="features CSV to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = backfill_features(_read_history(args), _read_as_of(args))
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Wrote {len(results)} rows to {args.output}")
+    else:
+        results.to_csv(sys.stdout, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Micro-benchmarks for the feature hot path, with JSON baselines.
+
+Synthetic applications are built by resampling real contracts from
+ml-assignment/data.csv, so banks, amounts, empty values and the spread of
+claim/contract dates before the application date follow the real data. Sizes
+range from 0 to 10k contracts per application.
+
+Timed cases:
+    main.calculate_features          dict kernel over decoded contracts
+    main.calculate_typed_features    typed kernel over validated columns
+    data_analysis.calculate_features JSON decode + registry kernel
+    validate.ApplicationRequest      request body -> validated model
+    dates.parse_day (cold / warm)    contract date parsing, memo cleared or full
+    dates.parse_application_day      one application timestamp
+    data_analysis.calculate_features_batch  the whole of data.csv, vectorized
+
+Usage:
+    python benchmark.py                                   # run and print
+    python benchmark.py --save benchmark_baseline.json    # record a baseline
+    python benchmark.py --compare benchmark_baseline.json --threshold 0.2
+
+--compare exits with status 1 when any case is slower than its baseline by
+more than the threshold (a fraction: 0.2 = 20%). Baselines are only
+comparable on the same machine and Python version.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import data_analysis
+import json_codec
+import main
+from dates import clear_date_cache, parse_application_day, parse_day
+from ingestion import ContractColumns
+
+DATA_CSV = 'ml-assignment/data.csv'
+SIZES = (0, 10, 100, 1000, 10000)
+QUICK_SIZES = (0, 10, 100, 1000)
+APPLICATION_DATE = '2024-02-12 19:24:29.135000+00:00'
+DATE_FIELDS = ('claim_date', 'contract_date')
+
+
+class ContractSampler:
+    """Draws contracts from data.csv with their dates re-anchored to a new application date"""
+
+    def __init__(self, path: str = DATA_CSV, seed: int = 0):
+        self.random = random.Random(seed)
+        self.pool: List[Tuple[dict, Dict[str, int]]] = []
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        for application_date, contracts_json in zip(df['application_date'], df['contracts']):
+            app_day = parse_application_day(application_date)
+            for contract in data_analysis.load_contracts(contracts_json):
+                offsets = {}
+                for name in DATE_FIELDS:
+                    day = parse_day(contract.get(name))
+                    if day is not None:
+                        offsets[name] = app_day - day
+                self.pool.append((contract, offsets))
+        if not self.pool:
+            raise ValueError(f"No contracts found in {path}")
+
+    def contracts(self, n: int, application_date: str = APPLICATION_DATE) -> List[dict]:
+        app_day = parse_application_day(application_date)
+        sampled = []
+        for contract, offsets in self.random.choices(self.pool, k=n):
+            contract = dict(contract)
+            for name, offset in offsets.items():
+                contract[name] = date.fromordinal(app_day - offset).strftime('%d.%m.%Y')
+            sampled.append(contract)
+        return sampled
+
+
+def time_case(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """Per-call timings in microseconds: best and median of `repeat` rounds"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return {
+        "best_us": round(min(rounds) * 1e6, 3),
+        "median_us": round(statistics.median(rounds) * 1e6, 3),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def build_cases(sizes=SIZES, data_path: str = DATA_CSV) -> Dict[str, Callable[[], Any]]:
+    """Benchmark name -> zero-argument callable"""
+    sampler = ContractSampler(data_path)
+    cases: Dict[str, Callable[[], Any]] = {}
+    for n in sizes:
+        contracts = sampler.contracts(n)
+        contracts_json = json.dumps(contracts)
+        columns = ContractColumns.from_contracts(contracts)
+        body = json_codec.dumps({"id": "bench", "application_date": APPLICATION_DATE, "contracts": contracts})
+        dates = [c.get(name) for c in contracts for name in DATE_FIELDS]
+
+        def cold_parse(dates=dates):
+            clear_date_cache()
+            for value in dates:
+                parse_day(value)
+
+        def warm_parse(dates=dates):
+            for value in dates:
+                parse_day(value)
+
+        cases[f"main.calculate_features[{n}]"] = lambda c=contracts: main.calculate_features(APPLICATION_DATE, c)
+        cases[f"main.calculate_typed_features[{n}]"] = \
+            lambda c=columns: main.calculate_typed_features(APPLICATION_DATE, c)
+        cases[f"data_analysis.calculate_features[{n}]"] = \
+            lambda s=contracts_json: data_analysis.calculate_features(APPLICATION_DATE, s)
+        cases[f"validate.ApplicationRequest[{n}]"] = lambda b=body: main.ApplicationRequest.model_validate_json(b)
+        if n:
+            cases[f"dates.parse_day.cold[{n}]"] = cold_parse
+            cases[f"dates.parse_day.warm[{n}]"] = warm_parse
+
+    cases["dates.parse_application_day"] = lambda: parse_application_day(APPLICATION_DATE)
+    frame = pd.read_csv(data_path, dtype=str)
+    cases[f"data_analysis.calculate_features_batch[{len(frame)} rows]"] = \
+        lambda: data_analysis.calculate_features_batch(frame)
+    return cases
+
+
+def run(cases: Dict[str, Callable[[], Any]], repeat: int = 5, min_time: float = 0.05,
+        pattern: Optional[str] = None) -> Dict[str, Any]:
+    results = {}
+    for name, fn in cases.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = time_case(fn, repeat, min_time)
+        print(f"{name:<60} best {results[name]['best_us']:>12.1f} us   "
+              f"median {results[name]['median_us']:>12.1f} us")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "json_backend": json_codec.BACKEND,
+            "recorded": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Names of cases whose best time regressed by more than threshold"""
+    regressions = []
+    print(f"\n{'case':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<60} {'-':>12} {result['best_us']:>12.1f}      new")
+            continue
+        change = result["best_us"] / base["best_us"] - 1 if base["best_us"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<60} {base['best_us']:>12.1f} {result['best_us']:>12.1f} {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the feature hot path")
+    parser.add_argument('--data', default=DATA_CSV, help="source of realistic contracts")
+    parser.add_argument('--quick', action='store_true', help="sizes up to 1k contracts and fewer rounds")
+    parser.add_argument('--filter', default=None, help="only run cases whose name contains this text")
+    parser.add_argument('--repeat', type=int, default=None, help="timing rounds per case")
+    parser.add_argument('--save', default=None, help="write results to this JSON baseline")
+    parser.add_argument('--compare', default=None, help="compare against this JSON baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed slowdown before a case fails the comparison (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    repeat = args.repeat or (3 if args.quick else 5)
+    current = run(build_cases(sizes, args.data), repeat=repeat,
+                  min_time=0.02 if args.quick else 0.05, pattern=args.filter)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,433 @@
+"""
+Columnar Parquet / Arrow IPC storage for the offline pipeline.
+
+A dataset is a directory with two files in the same format:
+
+    applications.<ext>  row, id, application_date, application_day
+    contracts.<ext>     row, contract_id, bank, claim_id, summa, loan_summa,
+                        claim_date, contract_date, and <field>_present for
+                        each of the four typed fields
+
+with one contracts row per contract, sorted by `row` (the position of the
+owning application). Dates are date32 and amounts float64, so a run never
+decodes JSON or parses date strings again. A null, empty or zero amount, a
+non-numeric amount, and an empty or unparseable date are stored as null, so
+they are never counted or summed. The boolean <field>_present columns keep
+whether the raw value was non-empty, which is what a feature's `required`
+filter tests: an unparseable contract_date still makes a loan count towards
+disb_bank_loan_wo_tbc, exactly as in the CSV path. An unparseable
+application_date is stored as a null application_day and that application's
+features are left empty. Columns are read through memory mapping, and only the
+ones the registered features need are read. Features are computed chunk by
+chunk: since contracts are sorted by `row`, a chunk of applications owns the
+next contiguous run of contracts, so memory stays flat for any dataset size.
+
+pyarrow is an optional dependency, needed only for this module.
+
+Usage:
+    python columnar_io.py convert --input ml-assignment/data.csv --output data_parquet
+    python columnar_io.py features --input data_parquet --output feature_results.parquet
+    python data_analysis.py --input data_parquet
+"""
+import argparse
+import os
+import time
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = None
+
+from batch_runner import DEFAULT_CHUNK_SIZE, read_chunks
+from dates import parse_day
+from data_analysis import (EPOCH_ORDINAL, application_ordinals, evaluate_features, load_contracts,
+                           without_invalid_rows)
+from feature_registry import (AMOUNT_FIELDS, DATE_FIELDS, TEXT_FIELDS, TYPED_FIELDS, default_registry,
+                              presence_field, window_registry)
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Parquet/Arrow support needs pyarrow: pip install pyarrow")
+
+
+def applications_schema() -> "pa.Schema":
+    return pa.schema([
+        ('row', pa.int64()),
+        ('id', pa.string()),
+        ('application_date', pa.string()),
+        ('application_day', pa.date32()),
+    ])
+
+
+def contracts_schema() -> "pa.Schema":
+    return pa.schema(
+        [('row', pa.int64())]
+        + [(name, pa.string()) for name in TEXT_FIELDS]
+        + [(name, pa.float64()) for name in AMOUNT_FIELDS]
+        + [(name, pa.date32()) for name in DATE_FIELDS]
+        + [(presence_field(name), pa.bool_()) for name in TYPED_FIELDS]
+    )
+
+
+def detect_format(path: str) -> str:
+    """Format of a dataset directory or features file, from its file extension"""
+    for fmt, ext in FORMATS.items():
+        if path.endswith(ext) or os.path.exists(os.path.join(path, 'contracts' + ext)):
+            return fmt
+    raise ValueError(f"Cannot tell the format of {path}; expected {' or '.join(FORMATS.values())} files")
+
+
+# --- writing ---------------------------------------------------------------
+
+def _amount(value) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _date(value) -> Optional[date]:
+    day = parse_day(value)
+    return None if day is None else date.fromordinal(day)
+
+
+class _TableWriter:
+    """Append record batches to one Parquet or Arrow IPC file"""
+
+    def __init__(self, path: str, schema: "pa.Schema", fmt: str):
+        self.fmt = fmt
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(path, schema)
+        else:
+            self._sink = pa.OSFile(path, 'wb')
+            self._writer = ipc.new_file(self._sink, schema)
+
+    def write(self, table: "pa.Table") -> None:
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        self._writer.close()
+        if self.fmt != 'parquet':
+            self._sink.close()
+
+
+def convert_csv(input_path: str, output_dir: str, fmt: str = 'parquet',
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, int]:
+    """One-time conversion of the CSV layout (contracts as JSON strings) to a columnar dataset
+
+    Returns (applications, contracts) written.
+    """
+    _require_pyarrow()
+    ext = FORMATS[fmt]
+    os.makedirs(output_dir, exist_ok=True)
+    app_schema, contract_schema = applications_schema(), contracts_schema()
+    applications = _TableWriter(os.path.join(output_dir, 'applications' + ext), app_schema, fmt)
+    contracts = _TableWriter(os.path.join(output_dir, 'contracts' + ext), contract_schema, fmt)
+
+    n_apps = n_contracts = 0
+    try:
+        for chunk in read_chunks(input_path, chunk_size):
+            rows = np.arange(n_apps, n_apps + len(chunk))
+            app_dates = chunk['application_date'].tolist()
+            app_days, valid = application_ordinals(app_dates)
+            applications.write(pa.table({
+                'row': rows,
+                'id': chunk['id'].tolist(),
+                'application_date': app_dates,
+                'application_day': pa.array((app_days - EPOCH_ORDINAL).astype(np.int32), mask=~valid)
+                .cast(pa.date32()),
+            }, schema=app_schema))
+
+            owners, flat = [], []
+            for row, contracts_json in zip(rows, chunk['contracts']):
+                parsed = load_contracts(contracts_json)
+                owners.extend([row] * len(parsed))
+                flat.extend(parsed)
+            columns = {'row': owners}
+            columns.update({name: [_text(c.get(name, '')) for c in flat] for name in TEXT_FIELDS})
+            columns.update({name: [_amount(c.get(name, '')) for c in flat] for name in AMOUNT_FIELDS})
+            columns.update({name: [_date(c.get(name, '')) for c in flat] for name in DATE_FIELDS})
+            columns.update({presence_field(name): [bool(c.get(name, '')) for c in flat] for name in TYPED_FIELDS})
+            contracts.write(pa.table(columns, schema=contract_schema))
+
+            n_apps += len(chunk)
+            n_contracts += len(flat)
+    finally:
+        applications.close()
+        contracts.close()
+    return n_apps, n_contracts
+
+
+def write_features(results: pd.DataFrame, path: str, fmt: Optional[str] = None) -> None:
+    """Write a features frame as Parquet or Arrow IPC"""
+    write_feature_chunks([results], path, fmt)
+
+
+def write_feature_chunks(chunks: Iterable[pd.DataFrame], path: str, fmt: Optional[str] = None) -> int:
+    """Write features frames one after another to a .parquet, .arrow or .csv file; returns the rows written"""
+    rows = 0
+    if (fmt or os.path.splitext(path)[1].lstrip('.')) == 'csv':
+        with open(path, 'w', newline='') as out:
+            for results in chunks:
+                results.to_csv(out, index=False, header=rows == 0)
+                rows += len(results)
+        return rows
+    _require_pyarrow()
+    fmt = fmt or detect_format(path)
+    writer = schema = None
+    try:
+        for results in chunks:
+            table = pa.Table.from_pandas(results, preserve_index=False)
+            if writer is None:
+                schema = table.schema.remove_metadata()
+                writer = _TableWriter(path, schema, fmt)
+            # Columns with empty values (nullable ints) and without share one Arrow type
+            writer.write(table.cast(schema))
+            rows += len(results)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+# --- reading ---------------------------------------------------------------
+
+def read_table(path: str, columns: List[str]) -> "pa.Table":
+    """Memory-mapped read of only `columns` from a Parquet or Arrow IPC file"""
+    _require_pyarrow()
+    if path.endswith(FORMATS['parquet']):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    # The table's buffers point into the map, so it stays open as long as they live
+    source = pa.memory_map(path, 'r')
+    return ipc.open_file(source).read_all().select(columns)
+
+
+def read_schema(path: str) -> "pa.Schema":
+    """Schema of a Parquet or Arrow IPC file, without reading its data"""
+    _require_pyarrow()
+    if path.endswith(FORMATS['parquet']):
+        return pq.read_schema(path)
+    with pa.memory_map(path, 'r') as source:
+        return ipc.open_file(source).schema
+
+
+def iter_table(path: str, columns: List[str], batch_size: int) -> Iterator["pa.Table"]:
+    """Memory-mapped read of `columns` from a Parquet or Arrow IPC file, a batch of rows at a time
+
+    Parquet files are read in batches of batch_size rows; Arrow IPC files one
+    record batch (one conversion chunk) at a time.
+    """
+    _require_pyarrow()
+    if path.endswith(FORMATS['parquet']):
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size, columns=columns):
+            yield pa.Table.from_batches([batch])
+        return
+    reader = ipc.open_file(pa.memory_map(path, 'r'))
+    for i in range(reader.num_record_batches):
+        yield pa.Table.from_batches([reader.get_batch(i)]).select(columns)
+
+
+def _rebatch(tables: Iterable["pa.Table"], size: int) -> Iterator["pa.Table"]:
+    """Tables of exactly `size` rows (the last one shorter), from tables of any size"""
+    pending, rows = [], 0
+    for table in tables:
+        while table.num_rows:
+            take = min(size - rows, table.num_rows)
+            pending.append(table.slice(0, take))
+            rows += take
+            table = table.slice(take)
+            if rows == size:
+                yield pa.concat_tables(pending)
+                pending, rows = [], 0
+    if rows:
+        yield pa.concat_tables(pending)
+
+
+def _dataset_paths(dataset_dir: str, fields: List[str]) -> Tuple[str, str]:
+    """(applications, contracts) file paths of a dataset whose contracts table has `fields`"""
+    ext = FORMATS[detect_format(dataset_dir)]
+    available = set(contracts_schema().names)
+    missing = [name for name in fields if name not in available]
+    if missing:
+        raise ValueError(f"Contracts table has no column(s) {missing}")
+    path = os.path.join(dataset_dir, 'contracts' + ext)
+    stored = read_schema(path).names
+    outdated = [name for name in fields if name not in stored]
+    if outdated:
+        # e.g. datasets converted before the presence columns existed
+        raise ValueError(f"{path} has no column(s) {outdated}; convert the CSV again")
+    return os.path.join(dataset_dir, 'applications' + ext), path
+
+
+def iter_dataset(dataset_dir: str, fields: List[str],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple["pa.Table", "ArrowContractTable"]]:
+    """(applications, contracts) of a dataset, chunk_size applications at a time
+
+    Contracts are stored sorted by `row`, so each chunk's contracts are the
+    next contiguous run of the contracts file; only one chunk is held at once.
+    """
+    applications_path, path = _dataset_paths(dataset_dir, fields)
+    columns = ['row', *fields]
+    empty = pa.schema([contracts_schema().field(name) for name in columns]).empty_table()
+    batches = iter_table(path, columns, chunk_size)
+    carry: Optional["pa.Table"] = None
+    app_tables = iter_table(applications_path, ['row', 'id', 'application_date', 'application_day'], chunk_size)
+    for applications in _rebatch(app_tables, chunk_size):
+        app_rows = applications.column('row')
+        first, end = app_rows[0].as_py(), app_rows[-1].as_py() + 1
+        parts = [empty]
+        while True:
+            if carry is None:
+                carry = next(batches, None)
+                if carry is None:
+                    break
+            rows = carry.column('row').to_numpy()
+            if rows.size and (rows[0] < first or np.any(rows[1:] < rows[:-1])):
+                raise ValueError(f"{path} is not sorted by row; convert the CSV again")
+            cut = int(np.searchsorted(rows, end))
+            parts.append(carry.slice(0, cut))
+            if cut < len(rows):
+                carry = carry.slice(cut)
+                break
+            carry = None
+        yield applications, ArrowContractTable(pa.concat_tables(parts), first_row=first)
+
+
+def _day_ordinals(column: "pa.ChunkedArray") -> np.ndarray:
+    return column.cast(pa.int32()).fill_null(0).to_numpy().astype(np.int64) + EPOCH_ORDINAL
+
+
+class ArrowContractTable:
+    """ContractTable interface over a typed, pre-exploded contracts table
+
+    The contracts belong to the applications starting at `first_row`.
+    """
+
+    def __init__(self, contracts: "pa.Table", first_row: int = 0):
+        rows = contracts.column('row').to_numpy()
+        if rows.size and np.any(rows[1:] < rows[:-1]):
+            contracts = contracts.sort_by('row')
+            rows = contracts.column('row').to_numpy()
+        self.contracts = contracts
+        # Positions within the chunk of applications starting at first_row
+        self.app_idx = rows - first_row
+        self.size = len(rows)
+        self._views: Dict = {}
+
+    def _view(self, kind, name, build):
+        key = (kind, name)
+        if key not in self._views:
+            self._views[key] = build(self.contracts.column(name))
+        return self._views[key]
+
+    def truthy(self, name):
+        if name in TYPED_FIELDS:
+            # Raw presence, not parse success: an unparseable date is still present
+            return self._view('truthy', presence_field(name), lambda column: column.fill_null(False)
+                              .to_numpy(zero_copy_only=False))
+        return self._view('truthy', name, lambda column: pc.not_equal(column, '')
+                          .fill_null(False).to_numpy(zero_copy_only=False))
+
+    def isin(self, name, excluded):
+        def build(column):
+            values = pa.array([v for v in excluded if v is not None], type=column.type)
+            # is_in answers False, not null, for a null value, so match nulls explicitly
+            matched = pc.is_in(column, value_set=values)
+            if None in excluded:
+                matched = pc.or_(matched, pc.is_null(column))
+            return matched.to_numpy(zero_copy_only=False)
+        return self._view(('isin', excluded), name, build)
+
+    def not_empty(self, name):
+        # JSON null is not '', so it counts as present
+        return self._view('not_empty', name, lambda column: pc.not_equal(column, '')
+                          .fill_null(True).to_numpy(zero_copy_only=False))
+
+    def days(self, name):
+        return self._view('days', name, lambda column: (
+            _day_ordinals(column), column.is_valid().to_numpy(zero_copy_only=False)))
+
+    def amounts(self, name):
+        return self._view('amounts', name, lambda column: (
+            column.fill_null(0.0).to_numpy(), column.is_valid().to_numpy(zero_copy_only=False)))
+
+
+def dataset_features(registry, applications: "pa.Table", table: ArrowContractTable) -> pd.DataFrame:
+    """Features of one chunk of a dataset (see iter_dataset)"""
+    app_day = applications.column('application_day')
+    valid = app_day.is_valid().to_numpy(zero_copy_only=False)
+    features = evaluate_features(registry, table, _day_ordinals(app_day))
+    return pd.DataFrame({
+        'id': applications.column('id').to_numpy(zero_copy_only=False),
+        'application_date': applications.column('application_date').to_numpy(zero_copy_only=False),
+        **{name: without_invalid_rows(values, valid) for name, values in features.items()},
+    })
+
+
+def iter_features_dataset(dataset_dir: str, registry=None,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Features of a columnar dataset, one frame per chunk of applications"""
+    registry = registry or default_registry()
+    for applications, table in iter_dataset(dataset_dir, registry.typed_input_fields, chunk_size):
+        yield dataset_features(registry, applications, table)
+
+
+def calculate_features_dataset(dataset_dir: str, registry=None,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """Features for every application of a columnar dataset, in one frame"""
+    registry = registry or default_registry()
+    chunks = list(iter_features_dataset(dataset_dir, registry, chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=['id', 'application_date', *registry.names])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Columnar (Parquet / Arrow IPC) offline feature pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help="convert the CSV layout to a columnar dataset directory")
+    convert.add_argument('--input', default='ml-assignment/data.csv')
+    convert.add_argument('--output', required=True, help="dataset directory to create")
+    convert.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    convert.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    features = commands.add_parser('features', help="calculate features from a columnar dataset")
+    features.add_argument('--input', required=True, help="dataset directory")
+    features.add_argument('--output', required=True, help="features file (.parquet, .arrow or .csv)")
+    features.add_argument('--claim-windows', action='store_true',
+                          help="add the 7/30/90/180/365-day claim counts, overall and without TBC banks")
+    features.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="applications per chunk")
+
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    if args.command == 'convert':
+        n_apps, n_contracts = convert_csv(args.input, args.output, args.format, args.chunk_size)
+        print(f"Converted {n_apps} applications / {n_contracts} contracts to {args.output}")
+    else:
+        chunks = iter_features_dataset(args.input, window_registry() if args.claim_windows else None,
+                                       args.chunk_size)
+        rows = write_feature_chunks(chunks, args.output)
+        print(f"Wrote {rows} rows to {args.output}")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,201 +1,489 @@
 import pandas as pd
 import json
+import os
 import numpy as np
 from datetime import datetime, timedelta
 from collections import Counter
 import warnings
 warnings.filterwarnings('ignore')
 
-def parse_date(date_str):
-    """Parse date string in DD.MM.YYYY format"""
-    if not date_str or pd.isna(date_str) or date_str == "":
+from dates import parse_day, parse_application_day
+from feature_registry import CLAIM_FIELD, TYPED_FIELDS, default_registry, presence_field
+from profiling import install_signal_handler, profiled_call, profiler, write_report
+from streaming_stats import BoundedCounter, QuantileSketch, RunningStats, date_shape
+
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+def load_contracts(contracts_json):
+    """Decode a contracts JSON string, keeping only dict entries"""
+    if pd.isna(contracts_json) or contracts_json == "":
+        return []
+    try:
+        contracts = json.loads(contracts_json)
+    except json.JSONDecodeError:
+        return []
+    return [c for c in contracts if isinstance(c, dict)]
+
+def calculate_features(application_date, contracts_json, registry=None):
+    """Calculate features for a single application"""
+    registry = registry or default_registry()
+    return registry.calculate(parse_application_day(application_date), load_contracts(contracts_json))
+
+def _application_day(value):
+    """parse_application_day, or None when the date is missing or unparsable"""
+    try:
+        return parse_application_day(value)
+    except (ValueError, TypeError, OverflowError):
         return None
+
+def application_ordinals(application_dates):
+    """Convert application dates to day ordinals (wall-clock date, timezone dropped)
+
+    Returns (ordinals, valid): a missing or unparsable date is not valid and
+    its ordinal is 0, so one bad row doesn't fail the rest of the batch.
+    """
+    dates = pd.Series(application_dates)
     try:
-        return datetime.strptime(date_str, '%d.%m.%Y')
+        parsed = pd.to_datetime(dates, format='ISO8601')
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_localize(None)
+        valid = parsed.notna().values
+        days = parsed.values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        return np.where(valid, days, 0), valid
+    except (ValueError, TypeError, AttributeError, OverflowError):
+        # Mixed offsets or non-ISO strings: parse each distinct value on its own
+        codes, uniques = pd.factorize(dates, use_na_sentinel=False)
+        parsed = [_application_day(v) for v in uniques]
+        ordinals = np.fromiter((0 if day is None else day for day in parsed), dtype=np.int64, count=len(parsed))
+        valid = np.fromiter((day is not None for day in parsed), dtype=bool, count=len(parsed))
+        return ordinals[codes], valid[codes]
+
+def _amount(value):
+    """float(value), or None when the value is empty or not numeric"""
+    if not value:
+        return None
+    try:
+        return float(value)
     except ValueError:
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%d')
-        except ValueError:
-            return None
+        return None
 
-def calculate_features(application_date, contracts_json):
-    """Calculate features for a single application"""
-    features = {}
-    
-    # Parse application date
-    app_date = pd.to_datetime(application_date)
-    if app_date.tz is not None:
-        app_date = app_date.tz_localize(None)  # Remove timezone info
-    
-    # Parse contracts
-    if pd.isna(contracts_json) or contracts_json == "":
-        contracts = []
-    else:
-        try:
-            contracts = json.loads(contracts_json)
-            # Ensure all contracts are dictionaries
-            contracts = [c for c in contracts if isinstance(c, dict)]
-        except json.JSONDecodeError:
-            contracts = []
-    
-    # Feature 1: tot_claim_cnt_l180d
-    # Number of claims made in the 180 days before the application_date
-    claim_count = 0
-    for contract in contracts:
-        claim_date_str = contract.get('claim_date', '')
-        if claim_date_str and claim_date_str != "":
-            claim_date = parse_date(claim_date_str)
-            if claim_date:
-                days_diff = (app_date - claim_date).days
-                if 0 <= days_diff <= 180:
-                    claim_count += 1
-    
-    features['tot_claim_cnt_l180d'] = claim_count if claim_count > 0 else -3
-    
-    # Feature 2: disb_bank_loan_wo_tbc
-    # Sum of disbursed loans exposure without TBC loans
-    excluded_banks = ['LIZ', 'LOM', 'MKO', 'SUG', '', None]
-    total_loan_exposure = 0
-    has_loans = False
-    
-    for contract in contracts:
-        bank = contract.get('bank', '')
-        loan_summa = contract.get('loan_summa', '')
-        contract_date = contract.get('contract_date', '')
-        
-        # Check if it's a valid loan (contract_date not null and bank not excluded)
-        if contract_date and contract_date != "" and bank not in excluded_banks:
-            if loan_summa and loan_summa != "":
-                try:
-                    loan_amount = float(loan_summa)
-                    total_loan_exposure += loan_amount
-                    has_loans = True
-                except ValueError:
-                    pass
-    
-    if has_loans:
-        features['disb_bank_loan_wo_tbc'] = total_loan_exposure
+class ContractTable:
+    """All contracts of a batch of applications flattened into columns
+
+    `app_idx` holds the position of each contract's application; raw field
+    values are kept as lists and typed views (truthiness, day ordinals,
+    amounts) are derived once per field on first use.
+    """
+
+    def __init__(self, contracts_column, fields):
+        flat = []
+        counts = np.zeros(len(contracts_column), dtype=np.int64)
+        for i, contracts_json in enumerate(contracts_column):
+            contracts = load_contracts(contracts_json)
+            counts[i] = len(contracts)
+            flat.extend(contracts)
+
+        self.size = len(flat)
+        self.app_idx = np.repeat(np.arange(len(contracts_column)), counts)
+        self.columns = {name: [c.get(name, '') for c in flat] for name in fields}
+        self._views = {}
+
+    def _view(self, kind, name, build):
+        key = (kind, name)
+        if key not in self._views:
+            self._views[key] = build(self.columns[name])
+        return self._views[key]
+
+    def truthy(self, name):
+        return self._view('truthy', name, lambda values: np.fromiter(
+            (bool(v) for v in values), dtype=bool, count=self.size))
+
+    def isin(self, name, excluded):
+        return self._view(('isin', excluded), name, lambda values: np.fromiter(
+            (v in excluded for v in values), dtype=bool, count=self.size))
+
+    def not_empty(self, name):
+        return self._view('not_empty', name, lambda values: np.fromiter(
+            (v != '' for v in values), dtype=bool, count=self.size))
+
+    def days(self, name):
+        """(day ordinals, valid mask); each distinct date string is parsed once"""
+        def build(values):
+            codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+            unique_days = np.zeros(len(uniques), dtype=np.int64)
+            unique_valid = np.zeros(len(uniques), dtype=bool)
+            for k, value in enumerate(uniques):
+                day = parse_day(value)
+                if day is not None:
+                    unique_days[k] = day
+                    unique_valid[k] = True
+            return unique_days[codes], unique_valid[codes]
+        return self._view('days', name, build)
+
+    def amounts(self, name):
+        """(float amounts, valid mask) for empty-or-numeric fields"""
+        def build(values):
+            parsed = [_amount(v) for v in values]
+            valid = np.fromiter((a is not None for a in parsed), dtype=bool, count=self.size)
+            amount = np.fromiter((0.0 if a is None else a for a in parsed), dtype=np.float64, count=self.size)
+            return amount, valid
+        return self._view('amounts', name, build)
+
+def _segment_max(app_idx, values, mask, size):
+    """Per-application maximum of `values` where `mask` holds (app_idx must be sorted)"""
+    result = np.zeros(size, dtype=np.int64)
+    found = np.zeros(size, dtype=bool)
+    idx = app_idx[mask]
+    if idx.size:
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        result[idx[starts]] = np.maximum.reduceat(values[mask], starts)
+        found[idx[starts]] = True
+    return result, found
+
+def _filter_mask(spec, table):
+    """Contracts passing a spec's required/exclude filters"""
+    mask = np.ones(table.size, dtype=bool)
+    for name in spec.required:
+        mask &= table.truthy(name)
+    for name, excluded in spec.exclude:
+        mask &= ~table.isin(name, excluded)
+    return mask
+
+def _with_missing(spec, value, found, has_claims):
+    if spec.if_no_claims is None:
+        missing = spec.if_missing
     else:
-        # Check if there are any claims at all
-        has_claims = any(contract.get('claim_id', '') != '' for contract in contracts)
-        features['disb_bank_loan_wo_tbc'] = -1 if not has_claims else -3
-    
-    # Feature 3: day_sinlastloan
-    # Number of days since last loan
-    last_loan_date = None
-    
-    for contract in contracts:
-        summa = contract.get('summa', '')
-        contract_date_str = contract.get('contract_date', '')
-        
-        if summa and summa != "" and contract_date_str and contract_date_str != "":
-            contract_date = parse_date(contract_date_str)
-            if contract_date:
-                if last_loan_date is None or contract_date > last_loan_date:
-                    last_loan_date = contract_date
-    
-    if last_loan_date:
-        days_since_last_loan = (app_date - last_loan_date).days
-        features['day_sinlastloan'] = days_since_last_loan
+        missing = np.where(has_claims, spec.if_missing, spec.if_no_claims)
+    return np.where(found, value, missing)
+
+def _evaluate_spec(spec, table, app_day, has_claims, size):
+    """Vectorized evaluation of one FeatureSpec over every application in the table"""
+    app_idx = table.app_idx
+    mask = _filter_mask(spec, table)
+
+    if spec.aggregation == 'count_in_window':
+        day, valid = table.days(spec.field)
+        age = app_day[app_idx] - day
+        mask &= valid & (age >= 0) & (age <= spec.window_days)
+        value = np.bincount(app_idx[mask], minlength=size)
+        found = value > 0
+    elif spec.aggregation == 'sum':
+        amount, valid = table.amounts(spec.field)
+        mask &= valid
+        # bincount returns ints when nothing is selected; sums are always floats
+        value = np.bincount(app_idx[mask], weights=amount[mask], minlength=size).astype(np.float64)
+        found = np.bincount(app_idx[mask], minlength=size) > 0
     else:
-        # Check if there are any claims at all
-        has_claims = any(contract.get('claim_id', '') != '' for contract in contracts)
-        features['day_sinlastloan'] = -1 if not has_claims else -3
-    
-    return features
-
-def analyze_data():
-    """Analyze the data structure and calculate features"""
-    # Read the data
-    df = pd.read_csv('ml-assignment/data.csv')
-    
-    print("Data Analysis Report")
-    print("=" * 50)
-    print(f"Data shape: {df.shape}")
-    print(f"Column names: {df.columns.tolist()}")
-    print(f"Null values in contracts: {df['contracts'].isnull().sum()}")
-    
-    # Analyze contract structure
-    all_contracts = []
-    for i, contracts in enumerate(df['contracts']):
-        if pd.notna(contracts) and contracts.strip():
-            try:
-                contracts_list = json.loads(contracts)
-                # Only add dict contracts
-                all_contracts.extend([c for c in contracts_list if isinstance(c, dict)])
-            except json.JSONDecodeError:
+        day, valid = table.days(spec.field)
+        last_day, found = _segment_max(app_idx, day, mask & valid, size)
+        value = app_day - last_day
+
+    return _with_missing(spec, value, found, has_claims)
+
+def _evaluate_window_group(specs, table, app_day, has_claims, size):
+    """count_in_window specs that differ only in window, answered from one sort
+
+    Matching contracts are sorted once by (application, age) as a single
+    composite key; each window is then two searchsorted calls per application.
+    """
+    spec = specs[0]
+    longest = max(s.window_days for s in specs)
+    day, valid = table.days(spec.field)
+    age = app_day[table.app_idx] - day
+    mask = _filter_mask(spec, table) & valid & (age >= 0) & (age <= longest)
+    stride = longest + 1
+    keys = np.sort(table.app_idx[mask].astype(np.int64) * stride + age[mask])
+    base = np.arange(size, dtype=np.int64) * stride
+    start = np.searchsorted(keys, base, side='left')
+    results = {}
+    for s in specs:
+        value = np.searchsorted(keys, base + s.window_days, side='right') - start
+        results[s.name] = _with_missing(s, value, value > 0, has_claims)
+    return results
+
+def evaluate_features(registry, table, app_day):
+    """Evaluate every registered feature over a contract table
+
+    `table` is any object with the ContractTable interface (app_idx, size and
+    the typed views); `app_day` holds one day ordinal per application.
+    """
+    size = len(app_day)
+    # Shared sentinel input: does the application have any claim at all
+    has_claims = np.bincount(table.app_idx[table.not_empty(CLAIM_FIELD)], minlength=size) > 0
+    groups = {}
+    for spec in registry.specs:
+        if spec.window_group is not None:
+            groups.setdefault(spec.window_group, []).append(spec)
+    results = {}
+    for specs in groups.values():
+        if len(specs) > 1:
+            results.update(_evaluate_window_group(specs, table, app_day, has_claims, size))
+    return {spec.name: results[spec.name] if spec.name in results
+            else _evaluate_spec(spec, table, app_day, has_claims, size)
+            for spec in registry.specs}
+
+def without_invalid_rows(values, valid):
+    """A feature column with the rows of invalid applications left empty
+
+    Integer features become nullable integers, so the valid rows keep
+    their integer values; float features use NaN.
+    """
+    if valid.all():
+        return values
+    if values.dtype.kind == 'f':
+        return np.where(valid, values, np.nan)
+    return pd.arrays.IntegerArray(values.astype(np.int64), ~valid)
+
+def calculate_features_batch(df, registry=None):
+    """Calculate features for every application in `df` at once
+
+    Vectorized equivalent of calling `calculate_features` row by row: all
+    contracts are flattened into one columnar table and each registered
+    feature is a segment reduction over the owning application index.
+    Applications whose application_date is missing or unparsable get empty
+    feature values; the rest of the batch is scored as usual.
+    """
+    registry = registry or default_registry()
+    table = ContractTable(df['contracts'].tolist(), registry.input_fields)
+    app_day, valid = application_ordinals(df['application_date'].tolist())
+    features = evaluate_features(registry, table, app_day)
+
+    return pd.DataFrame({
+        'id': df['id'].values,
+        'application_date': df['application_date'].values,
+        **{name: without_invalid_rows(values, valid) for name, values in features.items()},
+    })
+
+class AnalysisReport:
+    """Streaming accumulators behind the analyze_data report
+
+    Memory is bounded by the counter capacities and the sample sizes, not by
+    the number of applications or contracts seen.
+    """
+
+    def __init__(self, feature_names, samples=5):
+        self.samples = samples
+        self.rows = 0
+        self.columns = []
+        self.null_contracts = 0
+        self.total_contracts = 0
+        self.fields = BoundedCounter()
+        self.banks = BoundedCounter()
+        self.date_shapes = {name: BoundedCounter() for name in ('claim_date', 'contract_date')}
+        self.date_samples = {name: [] for name in self.date_shapes}
+        self.features = {name: (RunningStats(), QuantileSketch()) for name in feature_names}
+
+    def update_applications(self, chunk):
+        """Fold the contract structure of one chunk of applications in"""
+        if not self.columns:
+            self.columns = chunk.columns.tolist()
+        self.rows += len(chunk)
+        self.null_contracts += int(chunk['contracts'].isnull().sum())
+        for contracts_json in chunk['contracts']:
+            if pd.isna(contracts_json) or not contracts_json.strip():
                 continue
-    
-    print(f"Total contracts across all rows: {len(all_contracts)}")
-    
-    # Analyze contract fields
-    if all_contracts:
-        print("\nContract fields analysis:")
-        all_fields = set()
-        for contract in all_contracts:
-            if isinstance(contract, dict):
-                all_fields.update(contract.keys())
+            contracts = load_contracts(contracts_json)
+            self.total_contracts += len(contracts)
+            for contract in contracts:
+                self.fields.update(contract.keys())
+                bank = contract.get('bank', '')
+                if bank:
+                    self.banks.update((bank,))
+                for name, shapes in self.date_shapes.items():
+                    value = contract.get(name, '')
+                    if value:
+                        shapes.update((date_shape(str(value)),))
+                        if len(self.date_samples[name]) < self.samples:
+                            self.date_samples[name].append(value)
+
+    def update_dataset(self, applications, contracts):
+        """Fold the structure of one chunk of a columnar dataset in (see columnar_io.py)
+
+        `contracts` holds only the columns the features read; dates are
+        already typed, so their samples and formats are the stored ISO dates.
+        Applications without contracts count as null contracts.
+        """
+        if not self.columns:
+            self.columns = applications.column_names
+        rows = applications.column('row').to_numpy()
+        owners = contracts.column('row').to_numpy()
+        self.rows += len(rows)
+        self.null_contracts += int(np.count_nonzero(np.bincount(owners - rows[0], minlength=len(rows)) == 0))
+        self.total_contracts += len(owners)
+        # A typed field may be read only through its presence column
+        fields = {presence_field(name): name for name in TYPED_FIELDS}
+        for name in dict.fromkeys(fields.get(n, n) for n in contracts.column_names if n != 'row'):
+            if presence_field(name) in contracts.column_names:
+                present = contracts.column(presence_field(name)).to_numpy(zero_copy_only=False)
+            elif name in TYPED_FIELDS:
+                # Without its presence column only parsed values are known
+                present = contracts.column(name).is_valid().to_numpy(zero_copy_only=False)
             else:
-                print(f"Warning: Contract is not a dict: {type(contract)} - {contract}")
-        
-        print(f"All contract fields: {all_fields}")
-        
-        # Analyze banks
-        banks = [contract.get('bank', '') for contract in all_contracts if contract.get('bank', '')]
-        print(f"Unique banks: {sorted(set(banks))}")
-        
-        # Analyze date formats
-        dates = [contract.get('claim_date', '') for contract in all_contracts if contract.get('claim_date', '')]
-        print(f"Sample claim_dates: {dates[:5]}")
-        
-        contract_dates = [contract.get('contract_date', '') for contract in all_contracts if contract.get('contract_date', '')]
-        print(f"Sample contract_dates: {contract_dates[:5]}")
-    
-    # Calculate features for first few rows
-    print("\nFeature Calculation Examples:")
-    print("=" * 50)
-    
-    for i in range(min(5, len(df))):
-        row = df.iloc[i]
-        if pd.notna(row['contracts']) and row['contracts'].strip():
-            features = calculate_features(row['application_date'], row['contracts'])
-            print(f"Row {i} (ID: {row['id']}):")
-            for feature, value in features.items():
-                print(f"  {feature}: {value}")
+                present = np.fromiter((bool(v) for v in contracts.column(name).to_pylist()),
+                                      dtype=bool, count=len(owners))
+            if present.any():
+                self.fields.update((name,), int(present.sum()))
+        if 'bank' in contracts.column_names:
+            for item in contracts.column('bank').value_counts().to_pylist():
+                if item['values']:
+                    self.banks.update((item['values'],), item['counts'])
+        for name, shapes in self.date_shapes.items():
+            if name not in contracts.column_names:
+                continue
+            dates = contracts.column(name).drop_null()
+            if len(dates):
+                shapes.update(('DDDD-DD-DD',), len(dates))
+                samples = self.date_samples[name]
+                samples += [d.isoformat() for d in dates.slice(0, self.samples - len(samples)).to_pylist()]
+
+    def update_features(self, results):
+        """Fold one chunk of feature results in"""
+        for name, (stats, sketch) in self.features.items():
+            column = results[name]
+            # Empty values (unparsable application dates) are skipped as NaN
+            values = (column.astype('float64') if column.hasnans else column).tolist()
+            stats.update(values)
+            sketch.update(values)
+
+    @staticmethod
+    def _approximate(counter):
+        return "" if counter.exact else f" (approximate, top {counter.capacity})"
+
+    def print_structure(self):
+        print(f"Data shape: ({self.rows}, {len(self.columns)})")
+        print(f"Column names: {self.columns}")
+        print(f"Null values in contracts: {self.null_contracts}")
+        print(f"Total contracts across all rows: {self.total_contracts}")
+        if self.total_contracts:
+            print("\nContract fields analysis:")
+            print(f"All contract fields{self._approximate(self.fields)}: {set(self.fields.keys())}")
+            print(f"Unique banks{self._approximate(self.banks)}: {sorted(self.banks.keys())}")
+            for name, shapes in self.date_shapes.items():
+                print(f"Sample {name}s: {self.date_samples[name]}")
+                print(f"{name} formats{self._approximate(shapes)}: {dict(shapes.most_common())}")
+
+    def print_features(self):
+        print("\nFeature Statistics:")
+        print("=" * 50)
+        for name, (stats, sketch) in self.features.items():
+            print(f"{name}:")
+            print(f"  Mean: {stats.mean:.2f}")
+            print(f"  Median (approx.): {sketch.median:.2f}")
+            print(f"  Min: {stats.min}")
+            print(f"  Max: {stats.max}")
+            print(f"  Special values (-1, -3): {stats.negative}")
             print()
-    
-    # Calculate features for all rows
-    print("Calculating features for all rows...")
-    feature_results = []
-    
-    for i, row in df.iterrows():
-        features = calculate_features(row['application_date'], row['contracts'])
-        result = {
-            'id': row['id'],
-            'application_date': row['application_date'],
-            **features
-        }
-        feature_results.append(result)
-    
-    # Create results DataFrame
-    results_df = pd.DataFrame(feature_results)
-    
-    print("\nFeature Statistics:")
+
+def analyze_data(input_path='ml-assignment/data.csv', output_path='feature_results.csv',
+                 chunk_size=10000, job_dir=None):
+    """Analyze the data structure and calculate features, one chunk at a time
+
+    Features are written to output_path as each chunk is done and the report
+    is accumulated in bounded memory (see streaming_stats.py), so the input
+    may be larger than RAM. input_path is an applications CSV or a columnar
+    dataset directory (see columnar_io.py). With job_dir each chunk's features
+    are checkpointed (see partitioned_job.py): a rerun reuses the chunks
+    already done and output_path is merged from them at the end. Returns the
+    AnalysisReport.
+    """
+    from batch_runner import read_chunks  # imports this module
+    from partitioned_job import PartitionedJob
+
+    registry = default_registry()
+    report = AnalysisReport(registry.names)
+    columnar = os.path.isdir(input_path)
+    if columnar and job_dir is not None:
+        raise ValueError("job_dir needs an applications CSV input, not a columnar dataset")
+
+    print("Data Analysis Report")
+    print("=" * 50)
+    print("Calculating features chunk by chunk...")
+
+    examples = []
+    # Same settings as batch_runner without --claim-windows, so the two can share a job
+    job = None if job_dir is None else PartitionedJob(job_dir, input_path, chunk_size, {"claim_windows": False})
+
+    def process(chunk, index=None):
+        report.update_applications(chunk)
+        # Feature calculation examples from the first rows with contracts
+        for i, row in chunk.head(5).iterrows():
+            if i < 5 and pd.notna(row['contracts']) and row['contracts'].strip():
+                if _application_day(row['application_date']) is not None:
+                    examples.append((i, row['id'], calculate_features(row['application_date'], row['contracts'])))
+        if job is not None and job.is_done(index):
+            results = job.read(index)
+        else:
+            results = calculate_features_batch(chunk, registry)
+            if job is not None:
+                job.write(index, results)
+        report.update_features(results)
+        return results
+
+    def process_dataset(applications, table):
+        from columnar_io import dataset_features
+        report.update_dataset(applications, table.contracts)
+        results = dataset_features(registry, applications, table)
+        # Feature calculation examples from the first rows with contracts
+        start = report.rows - len(results)
+        with_contracts = np.bincount(table.app_idx, minlength=len(results)) > 0
+        for i in range(min(len(results), max(0, 5 - start))):
+            features = {name: results[name].iloc[i] for name in registry.names}
+            if with_contracts[i] and not pd.isna(list(features.values())).any():
+                examples.append((start + i, results['id'].iloc[i], features))
+        report.update_features(results)
+        return results
+
+    if columnar:
+        from columnar_io import iter_dataset  # pyarrow, only needed for datasets
+        chunks = iter_dataset(input_path, registry.typed_input_fields, chunk_size)
+    else:
+        chunks = ((chunk,) for chunk in read_chunks(input_path, chunk_size))
+
+    # Each chunk is one profiled call while a profiling session runs (SIGUSR1)
+    if job is None:
+        with open(output_path, 'w', newline='') as out:
+            for args in chunks:
+                results = profiled_call(process_dataset if columnar else process, *args)
+                results.to_csv(out, index=False, header=report.rows == len(results))
+    else:
+        reused = job.done
+        for index, chunk in job.partitions():
+            profiled_call(process, chunk, index)
+        job.merge(output_path)
+        if reused:
+            print(f"Reused {reused} finished partitions from {job_dir}")
+
+    report.print_structure()
+
+    print("\nFeature Calculation Examples:")
     print("=" * 50)
-    for feature in ['tot_claim_cnt_l180d', 'disb_bank_loan_wo_tbc', 'day_sinlastloan']:
-        print(f"{feature}:")
-        print(f"  Mean: {results_df[feature].mean():.2f}")
-        print(f"  Median: {results_df[feature].median():.2f}")
-        print(f"  Min: {results_df[feature].min()}")
-        print(f"  Max: {results_df[feature].max()}")
-        print(f"  Special values (-1, -3): {(results_df[feature] < 0).sum()}")
+    for i, application_id, features in examples:
+        print(f"Row {i} (ID: {application_id}):")
+        for feature, value in features.items():
+            print(f"  {feature}: {value}")
         print()
-    
-    # Save results
-    results_df.to_csv('feature_results.csv', index=False)
-    print("Results saved to feature_results.csv")
-    
-    return results_df
+
+    report.print_features()
+    print(f"Results saved to {output_path}")
+
+    return report
 
 if __name__ == "__main__":
-    results = analyze_data() 
\ No newline at end of file
+    # SIGUSR1 profiles the next PROFILE_SIGNAL_SECONDS; PROFILE_SECONDS profiles from the start
+    install_signal_handler()
+    if os.environ.get('PROFILE_SECONDS'):
+        profiler.start(seconds=float(os.environ['PROFILE_SECONDS']), on_done=write_report)
+    import argparse
+    parser = argparse.ArgumentParser(description="Data analysis report and features for an applications file")
+    parser.add_argument('--input', default='ml-assignment/data.csv',
+                        help="applications CSV (id, application_date, contracts), or a Parquet / Arrow "
+                             "dataset directory made by columnar_io.py convert")
+    parser.add_argument('--output', default='feature_results.csv', help="features CSV to write")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="applications per chunk")
+    parser.add_argument('--job-dir', default=None,
+                        help="checkpoint each chunk here; rerunning with the same directory resumes the run "
+                             "(CSV input only)")
+    args = parser.parse_args()
+    results = analyze_data(args.input, args.output, args.chunk_size, args.job_dir)
+    # A session still running when the run ends is cut short so its report is written
+    profiler.stop()
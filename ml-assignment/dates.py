@@ -0,0 +1,108 @@
+"""
+Shared date parsing for the feature service and the offline analysis.
+
+Contract dates are parsed straight to integer day ordinals (``date.toordinal()``),
+so "days between" is a plain integer subtraction. Contract dates repeat heavily
+across applications, so parsed values are memoized in a bounded LRU cache.
+"""
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+# Distinct date strings kept in the memo; a few decades of days fit comfortably
+DATE_CACHE_SIZE = 65536
+
+_failures = 0
+# parse_day runs on executor threads; taken only when a parse fails
+_failures_lock = threading.Lock()
+
+
+def _fixed_width_day(value: str) -> Optional[int]:
+    """Parse DD.MM.YYYY or YYYY-MM-DD without strptime; None if the layout doesn't match"""
+    if value[2] == '.' and value[5] == '.':
+        day, month, year = value[0:2], value[3:5], value[6:10]
+    elif value[4] == '-' and value[7] == '-':
+        year, month, day = value[0:4], value[5:7], value[8:10]
+    else:
+        return None
+    digits = day + month + year
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    return date(int(year), int(month), int(day)).toordinal()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_day_cached(value: str) -> Optional[int]:
+    if len(value) == 10:
+        try:
+            day = _fixed_width_day(value)
+        except ValueError:
+            # Well-formed but impossible, e.g. 31.02.2020
+            return None
+        if day is not None:
+            return day
+    # Non-padded values such as 1.2.2020 go through the slow path
+    for fmt in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).toordinal()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_day(value: Any) -> Optional[int]:
+    """Parse a contract date (DD.MM.YYYY, or YYYY-MM-DD) to a day ordinal, None if empty or invalid"""
+    global _failures
+    if not value or value.__class__ is not str:
+        return None
+    day = _parse_day_cached(value)
+    if day is None:
+        with _failures_lock:
+            _failures += 1
+    return day
+
+
+def parse_date(value: Any) -> Optional[datetime]:
+    """Parse a contract date to a datetime (midnight), None if empty or invalid"""
+    day = parse_day(value)
+    return None if day is None else datetime.fromordinal(day)
+
+
+def parse_application_day(value: Any) -> int:
+    """Day ordinal of an application timestamp's wall-clock date
+
+    Timezone offsets are dropped rather than converted, matching
+    ``pd.to_datetime(value).tz_localize(None)``. ISO 8601 strings take the
+    fast path; anything else falls back to pandas' flexible parser.
+    """
+    if value.__class__ is str:
+        try:
+            return datetime.fromisoformat(value).toordinal()
+        except ValueError:
+            pass
+    import pandas as pd
+    parsed = pd.to_datetime(value)
+    if parsed is pd.NaT:
+        raise ValueError(f"Invalid application_date: {value!r}")
+    return parsed.toordinal()
+
+
+def date_parse_stats() -> Dict[str, int]:
+    """Counters for the contract date memo: cache hits/misses, failed parses and current size"""
+    info = _parse_day_cached.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "failures": _failures,
+        "cached": info.currsize,
+        "maxsize": info.maxsize,
+    }
+
+
+def clear_date_cache() -> None:
+    """Drop memoized dates and reset the counters"""
+    global _failures
+    _parse_day_cached.cache_clear()
+    with _failures_lock:
+        _failures = 0
@@ -0,0 +1,137 @@
+"""
+Off-loop execution of CPU-bound feature work with backpressure.
+
+`FeatureExecutor` runs a function inline on the event loop, on a thread pool or
+on a process pool. At most `max_in_flight` calls run at once and at most
+`max_queue` wait for a slot; further calls are rejected immediately with
+`OverloadedError` instead of piling up. Each call has a deadline covering both
+the wait and the run; when it passes the caller gets `DeadlineExceededError`.
+The slot stays taken until the work actually finishes, because threads and
+worker processes can't be interrupted.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+MODES = ('inline', 'thread', 'process')
+
+
+class OverloadedError(Exception):
+    """Raised when every slot is busy and the wait queue is full"""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call did not finish within its deadline"""
+
+
+class FeatureExecutor:
+
+    def __init__(self, mode: str = 'thread', workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, max_queue: int = 100,
+                 timeout: Optional[float] = 30.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown execution mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers
+        self.max_queue = max_queue
+        self.timeout = timeout or None
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls) -> "FeatureExecutor":
+        """Configure from FEATURE_EXECUTOR, FEATURE_WORKERS, FEATURE_MAX_IN_FLIGHT, FEATURE_MAX_QUEUE, FEATURE_TIMEOUT"""
+        env = os.environ.get
+        return cls(
+            mode=env('FEATURE_EXECUTOR', 'thread'),
+            workers=int(env('FEATURE_WORKERS', '0')) or None,
+            max_in_flight=int(env('FEATURE_MAX_IN_FLIGHT', '0')) or None,
+            max_queue=int(env('FEATURE_MAX_QUEUE', '100')),
+            timeout=float(env('FEATURE_TIMEOUT', '30')),
+        )
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self.mode == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='features')
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, block: bool = False,
+                  timeout: Any = ...) -> Any:
+        """Run fn(*args) under the in-flight limit and deadline
+
+        block=True waits for a slot even when the queue is full (for callers
+        that already stream their own backpressure, like the batch endpoint).
+        timeout overrides the default deadline; None means no deadline.
+        """
+        if self.mode == 'inline':
+            self.completed += 1
+            return fn(*args)
+
+        timeout = self.timeout if timeout is ... else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        # Counted synchronously: semaphore.locked() lags behind callers not yet scheduled
+        if self.in_flight + self.queued >= self.max_in_flight + self.max_queue and not block:
+            self.rejected += 1
+            raise OverloadedError(f"{self.in_flight} requests in flight and {self.queued} queued")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise DeadlineExceededError("timed out waiting for a free worker") from None
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise DeadlineExceededError(f"feature computation exceeded {timeout}s") from None
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _release(self, future: asyncio.Future) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self._slots.release()
+        if not future.cancelled():
+            future.exception()  # retrieved by the awaiting caller, or dropped after a timeout
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
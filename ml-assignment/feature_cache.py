@@ -0,0 +1,133 @@
+"""
+In-process, content-addressed cache for feature results.
+
+Entries are keyed by a hash of the normalized (application_date, contracts)
+payload, bounded by entry count (LRU) and a time-to-live. Concurrent requests
+for the same key are coalesced so the computation runs once and every caller
+receives its result.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+_MISSING = object()
+
+
+def payload_key(application_date: Any, contracts: Any, variant: str = '') -> str:
+    """Content hash of an application's scoring inputs
+
+    Contracts given as a JSON string (CSV shape) are hashed as sent, so a hit
+    never needs to decode them; decoded contracts are hashed in canonical form
+    (sorted keys, compact separators). The two shapes never share a key.
+    `variant` names the feature set computed, so e.g. responses with the
+    optional claim windows never share a key with the default ones.
+    """
+    if isinstance(contracts, str):
+        shape, body = 's', contracts.strip()
+    else:
+        shape, body = 'j', json.dumps(contracts, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.blake2b(digest_size=16)
+    if variant:
+        shape = f"{shape}:{variant}"
+    digest.update(f"{shape}|{application_date}|".encode())
+    digest.update(body.encode())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """LRU + TTL cache with single-flight computation of missing entries
+
+    Not thread-safe: use it from the event loop thread only.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: str) -> Any:
+        """Cached value for key, or _MISSING; expired entries are dropped on access"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it at most once across concurrent callers"""
+        if not self.enabled:
+            return await compute()
+
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+            raise
+        finally:
+            del self._inflight[key]
+        self.put(key, value)
+        future.set_result(value)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
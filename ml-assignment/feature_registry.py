@@ -0,0 +1,417 @@
+"""
+Declarative feature registry.
+
+Each feature is a `FeatureSpec`: the contract field it aggregates, the fields
+that must be present, value filters (e.g. the excluded bank list), the
+aggregation and its sentinel values. A `FeatureRegistry` compiles all of its
+specs into a single generated function that walks the contracts exactly once,
+so adding a feature adds a few lines to the loop body rather than another pass.
+
+The feature list and descriptions come from ``ml-assignment/features.csv``;
+the logic column there is prose, so the executable rules live in `FEATURE_SPECS`.
+"""
+import csv
+import os
+from bisect import bisect_right
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from dates import parse_day
+
+FEATURES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ml-assignment', 'features.csv')
+
+# Field whose presence marks a contract as a claim; drives the -1/-3 sentinels
+CLAIM_FIELD = 'claim_id'
+# Date that places a claim in time, for point-in-time (as-of) evaluation
+CLAIM_DATE_FIELD = 'claim_date'
+
+AGGREGATIONS = ('count_in_window', 'sum', 'days_since_max')
+
+# Typed contract schema shared by the typed kernel, API ingestion and columnar
+# storage: dates are day ordinals, amounts floats, and None means empty or
+# unparseable. Each typed field also has a presence column (presence_field)
+# recording whether the raw value was non-empty, because the `required`
+# filters follow the dict kernel, where an unparseable date or amount is
+# still present
+DATE_FIELDS = ('claim_date', 'contract_date')
+AMOUNT_FIELDS = ('summa', 'loan_summa')
+TEXT_FIELDS = ('contract_id', 'bank', 'claim_id')
+TYPED_FIELDS = DATE_FIELDS + AMOUNT_FIELDS
+
+
+def presence_field(name: str) -> str:
+    """Column of the typed schema holding whether typed field `name` was non-empty (truthy) as sent"""
+    return f"{name}_present"
+
+
+PRESENCE_FIELDS = tuple(presence_field(name) for name in TYPED_FIELDS)
+
+EXCLUDED_BANKS = ('LIZ', 'LOM', 'MKO', 'SUG', '', None)
+
+# Windows (days) of the optional claim-count feature family
+CLAIM_WINDOWS = (7, 30, 90, 180, 365)
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """Declarative definition of one contract-level feature
+
+    aggregation:
+        count_in_window -- contracts whose `field` date lies 0..window_days before the application
+        sum             -- sum of float(`field`) over matching contracts
+        days_since_max  -- days from the latest `field` date to the application
+    required: fields that must be non-empty for a contract to count
+    exclude:  (field, values) pairs; contracts whose field is in values are skipped
+    if_missing: value when nothing matched
+    if_no_claims: value when nothing matched and the application has no claims at all
+    """
+    name: str
+    aggregation: str
+    field: str
+    required: Tuple[str, ...] = ()
+    exclude: Tuple[Tuple[str, Tuple[Any, ...]], ...] = ()
+    window_days: Optional[int] = None
+    if_missing: int = -3
+    if_no_claims: Optional[int] = None
+    description: str = ""
+
+    def __post_init__(self):
+        if self.aggregation not in AGGREGATIONS:
+            raise ValueError(f"{self.name}: unknown aggregation {self.aggregation!r}")
+        if self.aggregation == 'count_in_window' and self.window_days is None:
+            raise ValueError(f"{self.name}: count_in_window needs window_days")
+
+    @property
+    def input_fields(self) -> Tuple[str, ...]:
+        fields = [self.field, *self.required, *(name for name, _ in self.exclude)]
+        return tuple(dict.fromkeys(fields))
+
+    @property
+    def typed_input_fields(self) -> Tuple[str, ...]:
+        """input_fields in the typed schema: required typed fields are read as their presence columns"""
+        required = [presence_field(name) if name in TYPED_FIELDS else name for name in self.required]
+        fields = [self.field, *required, *(name for name, _ in self.exclude)]
+        return tuple(dict.fromkeys(fields))
+
+    @property
+    def window_group(self) -> Optional[Tuple[Any, ...]]:
+        """Count specs sharing this key differ only in window and are answered from one sorted list"""
+        if self.aggregation != 'count_in_window':
+            return None
+        return (self.field, self.required, self.exclude)
+
+    @property
+    def date_field(self) -> Optional[str]:
+        """Date that places a matching contract in time: the field itself, else the first required date"""
+        if self.field in DATE_FIELDS:
+            return self.field
+        return next((name for name in self.required if name in DATE_FIELDS), None)
+
+    def matches(self, columns: Mapping[str, list], k: int) -> bool:
+        """Whether contract k of typed columns passes the required/exclude filters (typed kernel semantics)"""
+        for name in self.required:
+            if not columns[presence_field(name) if name in TYPED_FIELDS else name][k]:
+                return False
+        for name, values in self.exclude:
+            if columns[name][k] in values:
+                return False
+        return True
+
+
+FEATURE_SPECS: Tuple[FeatureSpec, ...] = (
+    FeatureSpec(
+        name='tot_claim_cnt_l180d',
+        aggregation='count_in_window',
+        field='claim_date',
+        window_days=180,
+        if_missing=-3,
+    ),
+    FeatureSpec(
+        name='disb_bank_loan_wo_tbc',
+        aggregation='sum',
+        field='loan_summa',
+        required=('contract_date',),
+        exclude=(('bank', EXCLUDED_BANKS),),
+        if_missing=-3,
+        if_no_claims=-1,
+    ),
+    FeatureSpec(
+        name='day_sinlastloan',
+        aggregation='days_since_max',
+        field='contract_date',
+        required=('summa',),
+        if_missing=-3,
+        if_no_claims=-1,
+    ),
+)
+
+
+def claim_window_specs(windows: Iterable[int] = CLAIM_WINDOWS) -> Tuple[FeatureSpec, ...]:
+    """Claim counts over each window, overall (tot_claim_cnt_l{w}d) and without TBC banks (..._wo_tbc)"""
+    specs = []
+    for suffix, exclude, scope in (('', (), 'all banks'),
+                                   ('_wo_tbc', (('bank', EXCLUDED_BANKS),), 'excluding TBC banks')):
+        for window in windows:
+            specs.append(FeatureSpec(
+                name=f'tot_claim_cnt_l{window}d{suffix}',
+                aggregation='count_in_window',
+                field='claim_date',
+                exclude=exclude,
+                window_days=window,
+                if_missing=-3,
+                description=f"Number of claims in the {window} days before the application ({scope})",
+            ))
+    return tuple(specs)
+
+
+class FeatureRegistry:
+    """An ordered set of feature specs that compiles into one fused contracts loop"""
+
+    def __init__(self, specs: Iterable[FeatureSpec]):
+        self.specs: List[FeatureSpec] = list(specs)
+        names = [spec.name for spec in self.specs]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate feature names in registry: {names}")
+        self._kernels: Dict[bool, Callable[..., Dict[str, Any]]] = {}
+        self.sources: Dict[str, str] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Compiled kernels are exec'd functions and don't pickle; a copy recompiles on first use
+        state = dict(self.__dict__)
+        state['_kernels'] = {}
+        return state
+
+    @property
+    def names(self) -> List[str]:
+        return [spec.name for spec in self.specs]
+
+    @property
+    def input_fields(self) -> List[str]:
+        """Every contract field read by any feature, claim marker included"""
+        fields = [CLAIM_FIELD]
+        for spec in self.specs:
+            fields.extend(spec.input_fields)
+        return list(dict.fromkeys(fields))
+
+    @property
+    def typed_input_fields(self) -> List[str]:
+        """Every typed-schema column read by the typed kernel, claim marker included"""
+        fields = [CLAIM_FIELD]
+        for spec in self.specs:
+            fields.extend(spec.typed_input_fields)
+        return list(dict.fromkeys(fields))
+
+    def _compile(self, typed: bool) -> Callable[..., Dict[str, Any]]:
+        if typed not in self._kernels:
+            kind = 'typed' if typed else 'dict'
+            source, namespace = _generate_kernel(self.specs, typed=typed)
+            exec(compile(source, f'<feature_registry:{kind}>', 'exec'), namespace)
+            self.sources[kind] = source
+            self._kernels[typed] = namespace['kernel']
+        return self._kernels[typed]
+
+    def compile(self) -> Callable[..., Dict[str, Any]]:
+        """Return `kernel(app_day, contracts) -> {feature: value}` evaluating every spec in one pass
+
+        Given a list as `sentinels`, the kernel appends the names of the
+        features answered with their missing value (nothing matched).
+        """
+        return self._compile(typed=False)
+
+    def compile_typed(self) -> Callable[..., Dict[str, Any]]:
+        """Like `compile`, over typed contract columns ({field: values}) instead of raw dicts"""
+        return self._compile(typed=True)
+
+    def calculate(self, app_day: int, contracts: Iterable[dict]) -> Dict[str, Any]:
+        return self.compile()(app_day, contracts)
+
+
+def _generate_kernel(specs: List[FeatureSpec], typed: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """Build the source of the fused kernel and the namespace it runs in
+
+    The dict kernel reads raw contract dicts, where "present" means truthy and
+    dates/amounts are parsed on the fly. The typed kernel reads the columns of
+    the typed contract schema, where dates are day ordinals, amounts floats and
+    None means empty or unparseable; a required typed field is tested on its
+    presence column, so both kernels agree on malformed values.
+    """
+    needs_claims = any(spec.if_no_claims is not None for spec in specs)
+    fields = [name for spec in specs for name in (spec.typed_input_fields if typed else spec.input_fields)]
+    if needs_claims:
+        fields.append(CLAIM_FIELD)
+    var = {name: f"f{i}" for i, name in enumerate(dict.fromkeys(fields))}
+    namespace: Dict[str, Any] = {'parse_day': parse_day}
+
+    def present(name: str) -> str:
+        if typed and name in TYPED_FIELDS:
+            return var[presence_field(name)]
+        return var[name]
+
+    # Count specs with the same field and filters but several windows share one
+    # sorted list of ages, answered per window with a bisect after the loop
+    groups: Dict[Any, List[int]] = {}
+    for i, spec in enumerate(specs):
+        if spec.window_group is not None:
+            groups.setdefault(spec.window_group, []).append(i)
+    shared = {key: members for key, members in groups.items() if len(members) > 1}
+    if shared:
+        namespace['bisect_right'] = bisect_right
+
+    init = []
+    body = []
+    post = []
+    result = []
+    fallbacks = []
+    for i, spec in enumerate(specs):
+        acc = f"acc{i}"
+        value = var[spec.field]
+        if typed:
+            expected = AMOUNT_FIELDS if spec.aggregation == 'sum' else DATE_FIELDS
+            if spec.field not in expected:
+                raise ValueError(f"{spec.name}: {spec.aggregation} over untyped field {spec.field!r}")
+        conditions = [present(name) for name in spec.required]
+        for j, (name, values) in enumerate(spec.exclude):
+            namespace[f"excl{i}_{j}"] = tuple(values)
+            conditions.append(f"{var[name]} not in excl{i}_{j}")
+        day = value if typed else "day"
+        parse = [] if typed else [f"day = parse_day({value})"]
+
+        if spec.window_group in shared:
+            members = shared[spec.window_group]
+            ages = f"ages{members[0]}"
+            post.append(f"{acc} = bisect_right({ages}, {int(spec.window_days)})")
+            found, final = f"{acc} > 0", acc
+            if i == members[0]:
+                longest = max(int(specs[k].window_days) for k in members)
+                init.append(f"{ages} = []")
+                post.insert(len(post) - 1, f"{ages}.sort()")
+                block = parse + [
+                    f"if {day} is not None and 0 <= app_day - {day} <= {longest}:",
+                    f"    {ages}.append(app_day - {day})",
+                ]
+                label = ", ".join(specs[k].name for k in members)
+            else:
+                block, label = None, None
+        elif spec.aggregation == 'count_in_window':
+            init.append(f"{acc} = 0")
+            block = parse + [
+                f"if {day} is not None and 0 <= app_day - {day} <= {int(spec.window_days)}:",
+                f"    {acc} += 1",
+            ]
+            found, final = f"{acc} > 0", acc
+        elif spec.aggregation == 'sum':
+            init += [f"{acc} = 0", f"found{i} = False"]
+            # Typed: parsed (truthy and numeric); dict: truthy here, numeric checked by float()
+            conditions.append(f"{value} is not None" if typed else value)
+            if typed:
+                block = [f"{acc} += {value}", f"found{i} = True"]
+            else:
+                block = [
+                    "try:",
+                    f"    {acc} += float({value})",
+                    f"    found{i} = True",
+                    "except ValueError:",
+                    "    pass",
+                ]
+            found, final = f"found{i}", acc
+        else:
+            init.append(f"{acc} = None")
+            block = parse + [
+                f"if {day} is not None and ({acc} is None or {day} > {acc}):",
+                f"    {acc} = {day}",
+            ]
+            found, final = f"{acc} is not None", f"app_day - {acc}"
+
+        if spec.window_group not in shared:
+            label = spec.name
+        if block is not None:
+            body.append(f"# {label}")
+            if conditions:
+                body.append(f"if {' and '.join(conditions)}:")
+                block = ["    " + line for line in block]
+            body += block
+
+        if spec.if_no_claims is None:
+            missing = repr(spec.if_missing)
+        else:
+            missing = f"({spec.if_missing!r} if has_claims else {spec.if_no_claims!r})"
+        result.append(f"{spec.name!r}: {final} if {found} else {missing},")
+        fallbacks += [f"if not ({found}):", f"    sentinels.append({spec.name!r})"]
+
+    loop = []
+    if not typed:
+        loop.append("get = contract.get")
+        loop += [f"{name} = get({field_name!r}, '')" for field_name, name in var.items()]
+    if needs_claims:
+        loop += [f"if {var[CLAIM_FIELD]} != '':", "    has_claims = True"]
+    loop += body
+
+    if typed:
+        lines = ["def kernel(app_day, columns, sentinels=None):"]
+        targets = "".join(f"{name}, " for name in var.values())
+        sources = ", ".join(f"columns[{field_name!r}]" for field_name in var)
+        header = f"    for {targets.rstrip()} in zip({sources}):"
+    else:
+        lines = ["def kernel(app_day, contracts, sentinels=None):"]
+        header = "    for contract in contracts:"
+    lines += ["    " + line for line in (["has_claims = False"] if needs_claims else []) + init]
+    lines.append(header)
+    lines += ["        " + line for line in loop]
+    lines += ["    " + line for line in post]
+    lines += ["    if sentinels is not None:"] + ["        " + line for line in fallbacks]
+    lines += ["    return {"] + ["        " + line for line in result] + ["    }"]
+    return "\n".join(lines) + "\n", namespace
+
+
+def read_feature_table(path: str = FEATURES_CSV) -> List[Dict[str, str]]:
+    """Read the feature definitions table (No, Feature, Logic, If missing value)"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row for row in csv.DictReader(f) if row.get('Feature')]
+
+
+def load_registry(path: Optional[str] = None,
+                  specs: Iterable[FeatureSpec] = FEATURE_SPECS) -> FeatureRegistry:
+    """Registry of the features listed in features.csv, in file order, with their descriptions
+
+    Without an explicit path the bundled features.csv is used when present and
+    all declared specs otherwise. Every feature in the table must have a spec.
+    """
+    by_name = {spec.name: spec for spec in specs}
+    if path is None:
+        if not os.path.exists(FEATURES_CSV):
+            return FeatureRegistry(by_name.values())
+        path = FEATURES_CSV
+
+    selected = []
+    for row in read_feature_table(path):
+        name = row['Feature'].strip()
+        if name not in by_name:
+            raise ValueError(f"Feature {name!r} in {path} has no declarative spec")
+        description = row.get('Logic', '').strip().splitlines()[0] if row.get('Logic') else ''
+        description = description.replace('Description:', '').strip()
+        selected.append(replace(by_name[name], description=description))
+    return FeatureRegistry(selected)
+
+
+_default_registry: Optional[FeatureRegistry] = None
+
+
+def default_registry() -> FeatureRegistry:
+    """Process-wide registry loaded from the bundled features.csv"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = load_registry()
+    return _default_registry
+
+
+_window_registry: Optional[FeatureRegistry] = None
+
+
+def window_registry() -> FeatureRegistry:
+    """The default features followed by the claim-count window family (CLAIM_WINDOWS)"""
+    global _window_registry
+    if _window_registry is None:
+        base = default_registry()
+        extra = [spec for spec in claim_window_specs() if spec.name not in base.names]
+        _window_registry = FeatureRegistry([*base.specs, *extra])
+    return _window_registry
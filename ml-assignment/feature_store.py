@@ -0,0 +1,230 @@
+"""
+Incremental per-applicant feature store for repeat applications.
+
+A returning applicant sends only the contracts that are new since their last
+application. For each registered feature the store keeps just enough state to
+answer it for any application date:
+
+    count_in_window  sorted day ordinals of the matching contracts; the
+                     window count is two bisects, O(log n)
+    sum              running total and whether any contract matched
+    days_since_max   latest matching day
+
+plus whether the applicant has any claim, for the -1/-3 sentinels. The state
+lives in SQLite (one row per applicant, one packed day array per window
+feature), so it survives restarts and is shared by every worker process on the
+host. Contracts go through the same typed validation as `/calculate-features`
+and the results match the feature kernels over the full history.
+
+Contracts are appended as given and there is no de-duplication: resending one
+counts it twice. Pass `replace=True` to rebuild an applicant from a full
+history instead.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from dates import parse_application_day
+from feature_registry import CLAIM_FIELD, FeatureRegistry, default_registry
+from ingestion import ContractColumns
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS applicants (
+    applicant_id TEXT PRIMARY KEY,
+    has_claims INTEGER NOT NULL,
+    totals TEXT NOT NULL,
+    contracts INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS window_days (
+    applicant_id TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    days BLOB NOT NULL,
+    PRIMARY KEY (applicant_id, feature)
+) WITHOUT ROWID;
+"""
+
+
+class ApplicantState:
+    """Aggregated contract history of one applicant"""
+
+    __slots__ = ('has_claims', 'contracts', 'days', 'totals')
+
+    def __init__(self, has_claims: bool = False, contracts: int = 0,
+                 days: Optional[Dict[str, array]] = None, totals: Optional[Dict[str, Any]] = None):
+        self.has_claims = has_claims
+        self.contracts = contracts
+        # count_in_window: sorted day ordinals
+        self.days: Dict[str, array] = days or {}
+        # sum: [total, found]; days_since_max: latest day or None
+        self.totals: Dict[str, Any] = totals or {}
+
+
+def registry_fingerprint(registry: FeatureRegistry) -> str:
+    """Identifies the feature definitions a store's state was built for"""
+    specs = [(s.name, s.aggregation, s.field, s.required, s.exclude, s.window_days) for s in registry.specs]
+    return hashlib.blake2b(repr(specs).encode(), digest_size=16).hexdigest()
+
+
+class FeatureStore:
+    """SQLite-backed per-applicant feature state; safe to share between threads"""
+
+    def __init__(self, path: str, registry: Optional[FeatureRegistry] = None):
+        self.registry = registry or default_registry()
+        # Rejects specs the typed contract schema can't express
+        self.registry.compile_typed()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._check_registry()
+
+    def _check_registry(self) -> None:
+        fingerprint = registry_fingerprint(self.registry)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'registry'").fetchone()
+        if row is None:
+            self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('registry', ?)", (fingerprint,))
+        elif row[0] != fingerprint:
+            raise ValueError(f"Feature store {self.path} was built for different feature definitions; "
+                             "rebuild it or point FEATURE_STORE_PATH at a new file")
+
+    # --- state persistence -------------------------------------------------
+
+    def _load(self, applicant_id: str) -> ApplicantState:
+        row = self._conn.execute(
+            "SELECT has_claims, totals, contracts FROM applicants WHERE applicant_id = ?", (applicant_id,)
+        ).fetchone()
+        if row is None:
+            return ApplicantState()
+        days = {}
+        for feature, blob in self._conn.execute(
+                "SELECT feature, days FROM window_days WHERE applicant_id = ?", (applicant_id,)):
+            days[feature] = array('i')
+            days[feature].frombytes(blob)
+        return ApplicantState(bool(row[0]), row[2], days, json.loads(row[1]))
+
+    def _save(self, applicant_id: str, state: ApplicantState) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO applicants VALUES (?, ?, ?, ?, ?)",
+            (applicant_id, int(state.has_claims), json.dumps(state.totals), state.contracts, time.time()))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO window_days VALUES (?, ?, ?)",
+            [(applicant_id, feature, days.tobytes()) for feature, days in state.days.items()])
+
+    # --- state updates and queries -----------------------------------------
+
+    def _apply(self, state: ApplicantState, columns: ContractColumns) -> None:
+        """Fold new contracts into state"""
+        claims = columns[CLAIM_FIELD]
+        if any(value != '' for value in claims):
+            state.has_claims = True
+        for spec in self.registry.specs:
+            values = columns[spec.field]
+            matched = [values[k] for k in range(columns.size)
+                       if values[k] is not None and spec.matches(columns, k)]
+            if spec.aggregation == 'count_in_window':
+                if matched:
+                    state.days[spec.name] = array('i', sorted([*state.days.get(spec.name, ()), *matched]))
+            elif spec.aggregation == 'sum':
+                total, found = state.totals.get(spec.name, (0, False))
+                # Added one by one, in history order, so rounding matches the kernels
+                for value in matched:
+                    total += value
+                state.totals[spec.name] = [total, found or bool(matched)]
+            else:
+                latest = state.totals.get(spec.name)
+                if matched:
+                    latest = max(matched) if latest is None else max(latest, *matched)
+                state.totals[spec.name] = latest
+        state.contracts += columns.size
+
+    def _features(self, state: ApplicantState, app_day: int,
+                  sentinels: Optional[List[str]] = None) -> Dict[str, Any]:
+        features = {}
+        for spec in self.registry.specs:
+            if spec.if_no_claims is not None and not state.has_claims:
+                missing = spec.if_no_claims
+            else:
+                missing = spec.if_missing
+            if spec.aggregation == 'count_in_window':
+                days = state.days.get(spec.name, ())
+                value = bisect_right(days, app_day) - bisect_left(days, app_day - int(spec.window_days))
+                found = value > 0
+            elif spec.aggregation == 'sum':
+                value, found = state.totals.get(spec.name, (0, False))
+            else:
+                latest = state.totals.get(spec.name)
+                found = latest is not None
+                value = app_day - latest if found else None
+            features[spec.name] = value if found else missing
+            if sentinels is not None and not found:
+                sentinels.append(spec.name)
+        return features
+
+    def _update(self, applicant_id: str, contracts: Union[ContractColumns, Iterable[dict]],
+                replace: bool) -> ApplicantState:
+        columns = ContractColumns.from_contracts(
+            contracts if isinstance(contracts, ContractColumns) else list(contracts))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = ApplicantState() if replace else self._load(applicant_id)
+                if replace:
+                    self._conn.execute("DELETE FROM window_days WHERE applicant_id = ?", (applicant_id,))
+                if columns.size or replace:
+                    self._apply(state, columns)
+                    self._save(applicant_id, state)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def add_contracts(self, applicant_id: str, contracts: Union[ContractColumns, Iterable[dict]],
+                      replace: bool = False) -> None:
+        """Record an applicant's new contracts (or, with replace, their full history)"""
+        self._update(applicant_id, contracts, replace)
+
+    def score(self, applicant_id: str, application_date: str,
+              new_contracts: Union[ContractColumns, Iterable[dict]] = (),
+              replace: bool = False, sentinels: Optional[List[str]] = None) -> Dict[str, Any]:
+        """add_contracts, then the applicant's features as of application_date
+
+        Given a list as `sentinels`, the names of the features answered with
+        their missing value are appended to it.
+        """
+        app_day = parse_application_day(application_date)
+        return self._features(self._update(applicant_id, new_contracts, replace), app_day, sentinels)
+
+    def calculate_features(self, applicant_id: str, application_date: str) -> Dict[str, Any]:
+        """Features of an applicant's stored history as of application_date"""
+        app_day = parse_application_day(application_date)
+        with self._lock:
+            state = self._load(applicant_id)
+        return self._features(state, app_day)
+
+    def delete(self, applicant_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM window_days WHERE applicant_id = ?", (applicant_id,))
+            self._conn.execute("DELETE FROM applicants WHERE applicant_id = ?", (applicant_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            applicants, contracts = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(contracts), 0) FROM applicants").fetchone()
+        return {"path": self.path, "applicants": applicants, "contracts": contracts}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
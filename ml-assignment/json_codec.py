@@ -0,0 +1,32 @@
+"""
+JSON encode/decode with the fastest backend available.
+
+orjson is used when installed (an optional dependency); otherwise the stdlib
+json module. Both raise a json.JSONDecodeError subclass on malformed input.
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """Decode a JSON document from bytes or str"""
+    if not isinstance(data, (bytes, bytearray, str)):
+        # Same as the stdlib: wrong input type is a TypeError, not a decode error
+        raise TypeError(f"the JSON object must be str, bytes or bytearray, not {type(data).__name__}")
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
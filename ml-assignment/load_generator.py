@@ -0,0 +1,305 @@
+"""
+Load-testing harness for the scoring endpoints.
+
+Drives `/calculate-features` and `/calculate-features-from-json` with the
+applications in ml-assignment/data.csv and reports latency percentiles
+(p50/p95/p99/max), throughput and error rate per endpoint and load level.
+
+Targets:
+    in-process (default)  the FastAPI app called directly through ASGI, no server
+    --spawn               a local `python main.py` started on a free port
+    --url URL             an already running server
+
+Load models:
+    --concurrency 1,8,32  closed loop: N clients sending back to back
+    --rate 50,100,200     open loop: Poisson arrivals at R requests/s, whatever
+                          the response times. Latency is measured from each
+                          request's scheduled start, so a backed-up server
+                          shows up in the percentiles instead of hiding.
+
+Requests bypass the result cache (Cache-Control: no-cache) unless --cache is
+given. The HTTP targets (--spawn, --url) need httpx.
+
+Usage:
+    python load_generator.py --concurrency 1,4,16 --duration 5
+    python load_generator.py --rate 100,200 --spawn --workers 2 --json load_report.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+import json_codec
+
+DATA_CSV = 'ml-assignment/data.csv'
+ENDPOINTS = ('/calculate-features', '/calculate-features-from-json')
+LOAD_CLIENT = ('load-test', 0)
+
+
+def request_bodies(data_path: str = DATA_CSV) -> Dict[str, List[bytes]]:
+    """Encoded request bodies per endpoint, one per application in data.csv"""
+    df = pd.read_csv(data_path, dtype=str, keep_default_na=False)
+    bodies: Dict[str, List[bytes]] = {endpoint: [] for endpoint in ENDPOINTS}
+    for app_id, application_date, contracts_json in zip(df['id'], df['application_date'], df['contracts']):
+        contracts = json.loads(contracts_json) if contracts_json else []
+        bodies['/calculate-features'].append(json_codec.dumps({
+            "id": app_id, "application_date": application_date,
+            "contracts": [c for c in contracts if isinstance(c, dict)]}))
+        bodies['/calculate-features-from-json'].append(json_codec.dumps({
+            "id": app_id, "application_date": application_date, "contracts": contracts_json}))
+    return bodies
+
+
+# --- targets ---------------------------------------------------------------
+
+class InProcessTarget:
+    """The FastAPI app called through ASGI in this process"""
+
+    name = 'in-process'
+
+    def __init__(self, use_cache: bool = False):
+        import main
+        from startup import asgi_post
+        self.main = main
+        self.asgi_post = asgi_post
+        self.use_cache = use_cache
+
+    async def post(self, path: str, body: bytes) -> int:
+        return await self.asgi_post(self.main.app, path, body, self.use_cache, client=LOAD_CLIENT)
+
+    async def close(self) -> None:
+        self.main.feature_executor.shutdown()
+
+
+class HTTPTarget:
+    """A server reached over HTTP (keep-alive connection pool)"""
+
+    def __init__(self, base_url: str, use_cache: bool = False, max_connections: int = 256):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HTTP targets need httpx: pip install httpx") from None
+        self.name = base_url
+        self.headers = {"content-type": "application/json"}
+        if not use_cache:
+            self.headers["cache-control"] = "no-cache"
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    async def post(self, path: str, body: bytes) -> int:
+        response = await self.client.post(path, content=body, headers=self.headers)
+        return response.status_code
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def spawn_server(port: int, workers: int, timeout: float = 60.0) -> subprocess.Popen:
+    """Start `python main.py` on port and wait until /health answers 200"""
+    import httpx
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, 'main.py', '--host', '127.0.0.1', '--port', str(port),
+                               '--workers', str(workers)], cwd=here,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/health', timeout=1.0).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server did not become healthy within {timeout}s")
+
+
+# --- load models -----------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+
+    async def send(self, target: Any, path: str, body: bytes, scheduled: float) -> None:
+        if self.first_start is None:
+            self.first_start = scheduled
+        try:
+            status = await target.post(path, body)
+        except Exception as e:
+            status = type(e).__name__
+        end = time.perf_counter()
+        self.latencies.append(end - scheduled)
+        self.statuses[status] += 1
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+
+async def closed_loop(target: Any, path: str, bodies: List[bytes], concurrency: int,
+                      duration: float) -> Recorder:
+    recorder = Recorder()
+    stop_at = time.perf_counter() + duration
+
+    async def client(offset: int) -> None:
+        i = offset
+        while time.perf_counter() < stop_at:
+            await recorder.send(target, path, bodies[i % len(bodies)], time.perf_counter())
+            i += concurrency
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return recorder
+
+
+async def open_loop(target: Any, path: str, bodies: List[bytes], rate: float, duration: float,
+                    seed: int = 0) -> Recorder:
+    recorder = Recorder()
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    scheduled = started
+    tasks = []
+    i = 0
+    while scheduled < started + duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(recorder.send(target, path, bodies[i % len(bodies)], scheduled)))
+        i += 1
+        scheduled += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return recorder
+
+
+# --- reporting -------------------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder: Recorder, endpoint: str, model: str, level: float) -> Dict[str, Any]:
+    latencies = sorted(recorder.latencies)
+    total = len(latencies)
+    errors = sum(count for status, count in recorder.statuses.items()
+                 if not (isinstance(status, int) and status < 400))
+    elapsed = (recorder.last_end - recorder.first_start) if total else 0.0
+    return {
+        "endpoint": endpoint,
+        "model": model,
+        "level": level,
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1e3, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1e3, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1e3, 3),
+        "max_ms": round(latencies[-1] * 1e3, 3) if latencies else float('nan'),
+        "statuses": {str(status): count for status, count in recorder.statuses.items()},
+    }
+
+
+def print_row(row: Dict[str, Any]) -> None:
+    level = f"{row['model']}={row['level']:g}"
+    print(f"{row['endpoint']:<32} {level:<18} {row['requests']:>8} {row['throughput_rps']:>10.1f} "
+          f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f} "
+          f"{row['error_rate']:>7.2%}")
+
+
+async def run_load(target: Any, bodies: Dict[str, List[bytes]], endpoints: List[str],
+                   concurrency: List[int], rates: List[float], duration: float,
+                   warmup_requests: int = 20) -> List[Dict[str, Any]]:
+    print(f"Target: {target.name}")
+    print(f"{'endpoint':<32} {'load':<18} {'requests':>8} {'req/s':>10} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    rows = []
+    for endpoint in endpoints:
+        for body in bodies[endpoint][:warmup_requests]:
+            await target.post(endpoint, body)
+        for level in concurrency:
+            recorder = await closed_loop(target, endpoint, bodies[endpoint], level, duration)
+            rows.append(summarize(recorder, endpoint, 'concurrency', level))
+            print_row(rows[-1])
+        for level in rates:
+            recorder = await open_loop(target, endpoint, bodies[endpoint], level, duration)
+            rows.append(summarize(recorder, endpoint, 'rate', level))
+            print_row(rows[-1])
+    return rows
+
+
+def _levels(text: Optional[str], kind: type) -> List[Any]:
+    return [kind(value) for value in text.split(',') if value.strip()] if text else []
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Latency / throughput load test for the scoring endpoints")
+    parser.add_argument('--data', default=DATA_CSV, help="applications to send (cycled)")
+    parser.add_argument('--endpoint', choices=ENDPOINTS, action='append',
+                        help="endpoint to test (repeatable; default: both)")
+    parser.add_argument('--concurrency', default=None, help="closed-loop client counts, e.g. 1,8,32")
+    parser.add_argument('--rate', default=None, help="open-loop arrival rates in requests/s, e.g. 50,100")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per load level")
+    parser.add_argument('--cache', action='store_true', help="let requests hit the result cache")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--spawn', action='store_true', help="start a local server on a free port")
+    target.add_argument('--url', default=None, help="test an already running server")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes for --spawn")
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    concurrency = _levels(args.concurrency, int)
+    rates = _levels(args.rate, float)
+    if not concurrency and not rates:
+        concurrency = [1, 8]
+    bodies = request_bodies(args.data)
+
+    server = None
+    if args.spawn:
+        port = free_port()
+        server = spawn_server(port, args.workers)
+        args.url = f'http://127.0.0.1:{port}'
+
+    async def run() -> List[Dict[str, Any]]:
+        target = HTTPTarget(args.url, args.cache) if args.url else InProcessTarget(args.cache)
+        try:
+            return await run_load(target, bodies, args.endpoint or list(ENDPOINTS),
+                                  concurrency, rates, args.duration)
+        finally:
+            await target.close()
+
+    try:
+        rows = asyncio.run(run())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"target": args.url or 'in-process', "duration": args.duration, "results": rows}, f, indent=2)
+        print(f"\nWrote {args.json}")
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,49 @@
-from fastapi import FastAPI, HTTPException
+# Imported first: its load time marks process launch for the startup timings
+from startup import WARMUP_CLIENT, FirstResponseMiddleware, mark_imported, start_warm_up, startup_state
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Tuple
+import asyncio
+import hmac
 import json
-import pandas as pd
-from datetime import datetime
-import warnings
-warnings.filterwarnings('ignore')
+import os
+
+import json_codec
+from dates import date_parse_stats, parse_application_day
+from execution import DeadlineExceededError, FeatureExecutor, OverloadedError
+from feature_cache import FeatureCache, payload_key
+from feature_registry import default_registry, window_registry
+from ingestion import ContractColumns
+from metrics import CONTENT_TYPE, MetricsMiddleware, metrics
+from profiling import ProfilerBusyError, install_signal_handler, profiled_call, profiler
+from scoring_jobs import JobManager, JobNotFoundError, JobNotReadyError, input_format
+from server import worker_health
+from streaming_ingest import ApplicationStreamParser, StreamParseError
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Optional warm-up (API_WARMUP rounds); /health answers 503 until it is done
+    warmup = start_warm_up(app)
+    # SIGUSR1 profiles this worker for PROFILE_SIGNAL_SECONDS (see profiling.py)
+    install_signal_handler()
+    start_scoring_jobs()
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    if scoring_jobs is not None:
+        scoring_jobs.shutdown()
+    feature_executor.shutdown()
+    if _feature_store is not None:
+        _feature_store.close()
 
 app = FastAPI(
     title="ML Feature Engineering Service",
     description="A FastAPI service that calculates financial features from contract data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware to allow requests from the documentation server
@@ -22,115 +54,369 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(FirstResponseMiddleware)
+# Per-route latency histograms for /metrics; FEATURE_METRICS=0 turns all metrics off
+app.add_middleware(MetricsMiddleware, skip_clients=(WARMUP_CLIENT,))
+
+# Fused single-pass kernels for the features declared in features.csv
+feature_kernel = default_registry().compile()
+typed_feature_kernel = default_registry().compile_typed()
+
+# Result cache for the scoring endpoints; FEATURE_CACHE_SIZE=0 disables it
+feature_cache = FeatureCache(
+    maxsize=int(os.environ.get('FEATURE_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('FEATURE_CACHE_TTL', '300')),
+)
 
-class ContractData(BaseModel):
-    contract_id: Optional[str] = ""
-    bank: Optional[str] = ""
-    summa: Optional[str] = ""
-    loan_summa: Optional[str] = ""
-    claim_date: Optional[str] = ""
-    claim_id: Optional[str] = ""
-    contract_date: Optional[str] = ""
+# Optional per-applicant store for repeat applications (see feature_store.py);
+# opened lazily in whichever process computes features
+FEATURE_STORE_PATH = os.environ.get('FEATURE_STORE_PATH')
+_feature_store = None
+
+# Feature computation runs off the event loop with an in-flight limit, a
+# bounded wait queue and a per-request deadline (see execution.py)
+feature_executor = FeatureExecutor.from_env()
+# Body bytes of /calculate-features/stream handed to the executor at a time
+STREAM_FEED_BYTES = 1 << 16
+
+# Asynchronous scoring jobs (see scoring_jobs.py); set SCORING_JOBS_DIR to enable them.
+# Started in each server process, on workers of their own rather than feature_executor
+SCORING_JOBS_DIR = os.environ.get('SCORING_JOBS_DIR')
+scoring_jobs: Optional[JobManager] = None
+
+# Token for the /admin endpoints (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+metrics.gauge('feature_executor_in_flight', "Feature computations running", lambda: feature_executor.in_flight)
+metrics.gauge('feature_executor_queued', "Feature computations waiting for a slot", lambda: feature_executor.queued)
+metrics.gauge('feature_http_requests_in_flight', "HTTP requests being handled", lambda: metrics.http_in_flight)
+metrics.callback_counter('feature_date_parse_failures_total', "Non-empty contract dates that failed to parse",
+                         lambda: date_parse_stats()['failures'])
 
 class ApplicationRequest(BaseModel):
     id: Optional[str] = None
     application_date: str
-    contracts: List[ContractData]
+    # Validated in one step into typed columns (see ingestion.py)
+    contracts: ContractColumns
+
+class BackfillRequest(BaseModel):
+    id: Optional[str] = None
+    contracts: ContractColumns
+    as_of_dates: List[str]
 
 class FeatureResponse(BaseModel):
+    # With ?claim_windows=true the claim-count window family is appended
+    # (tot_claim_cnt_l{7,30,90,180,365}d and their _wo_tbc variants)
+    model_config = ConfigDict(extra='allow')
+
     id: Optional[str] = None
     application_date: str
     tot_claim_cnt_l180d: int
     disb_bank_loan_wo_tbc: float
     day_sinlastloan: int
 
-def parse_date(date_str: str) -> Optional[datetime]:
-    """Parse date string in DD.MM.YYYY format"""
-    if not date_str or date_str == "":
-        return None
-    try:
-        return datetime.strptime(date_str, '%d.%m.%Y')
-    except ValueError:
+def calculate_features(application_date: str, contracts: List[dict],
+                       claim_windows: bool = False) -> Dict[str, Any]:
+    """Calculate features for a single application in one pass over its contracts
+
+    With claim_windows the claim-count window family is computed too, in the
+    same pass (every window is answered from one sorted list of claim ages).
+    """
+    kernel = window_registry().compile() if claim_windows else feature_kernel
+    app_day = application_day(application_date)
+    sentinels = [] if metrics.enabled else None
+    with metrics.stage('features'):
+        features = kernel(app_day, contracts, sentinels)
+    metrics.record_features(features, len(contracts), sentinels or ())
+    return features
+
+def calculate_typed_features(application_date: str, contracts: ContractColumns,
+                             claim_windows: bool = False) -> Dict[str, Any]:
+    """calculate_features over already validated, typed contract columns"""
+    kernel = window_registry().compile_typed() if claim_windows else typed_feature_kernel
+    app_day = application_day(application_date)
+    sentinels = [] if metrics.enabled else None
+    with metrics.stage('features'):
+        features = kernel(app_day, contracts, sentinels)
+    metrics.record_features(features, len(contracts), sentinels or ())
+    return features
+
+def application_day(application_date: str) -> int:
+    """parse_application_day, timed and counted in the metrics"""
+    with metrics.stage('application_date'):
         try:
-            return datetime.strptime(date_str, '%Y-%m-%d')
-        except ValueError:
-            return None
-
-def calculate_features(application_date: str, contracts: List[dict]) -> Dict[str, Any]:
-    """Calculate features for a single application"""
-    features = {}
-    
-    # Parse application date
-    app_date = pd.to_datetime(application_date)
-    if app_date.tz is not None:
-        app_date = app_date.tz_localize(None)  # Remove timezone info
-    
-    # Feature 1: tot_claim_cnt_l180d
-    # Number of claims made in the 180 days before the application_date
-    claim_count = 0
-    for contract in contracts:
-        claim_date_str = contract.get('claim_date', '')
-        if claim_date_str and claim_date_str != "":
-            claim_date = parse_date(claim_date_str)
-            if claim_date:
-                days_diff = (app_date - claim_date).days
-                if 0 <= days_diff <= 180:
-                    claim_count += 1
-    
-    features['tot_claim_cnt_l180d'] = claim_count if claim_count > 0 else -3
-    
-    # Feature 2: disb_bank_loan_wo_tbc
-    # Sum of disbursed loans exposure without TBC loans
-    excluded_banks = ['LIZ', 'LOM', 'MKO', 'SUG', '', None]
-    total_loan_exposure = 0
-    has_loans = False
-    
-    for contract in contracts:
-        bank = contract.get('bank', '')
-        loan_summa = contract.get('loan_summa', '')
-        contract_date = contract.get('contract_date', '')
-        
-        # Check if it's a valid loan (contract_date not null and bank not excluded)
-        if contract_date and contract_date != "" and bank not in excluded_banks:
-            if loan_summa and loan_summa != "":
-                try:
-                    loan_amount = float(loan_summa)
-                    total_loan_exposure += loan_amount
-                    has_loans = True
-                except ValueError:
-                    pass
-    
-    if has_loans:
-        features['disb_bank_loan_wo_tbc'] = total_loan_exposure
-    else:
-        # Check if there are any claims at all
-        has_claims = any(contract.get('claim_id', '') != '' for contract in contracts)
-        features['disb_bank_loan_wo_tbc'] = -1 if not has_claims else -3
-    
-    # Feature 3: day_sinlastloan
-    # Number of days since last loan
-    last_loan_date = None
-    
-    for contract in contracts:
-        summa = contract.get('summa', '')
-        contract_date_str = contract.get('contract_date', '')
-        
-        if summa and summa != "" and contract_date_str and contract_date_str != "":
-            contract_date = parse_date(contract_date_str)
-            if contract_date:
-                if last_loan_date is None or contract_date > last_loan_date:
-                    last_loan_date = contract_date
-    
-    if last_loan_date:
-        days_since_last_loan = (app_date - last_loan_date).days
-        features['day_sinlastloan'] = days_since_last_loan
-    else:
-        # Check if there are any claims at all
-        has_claims = any(contract.get('claim_id', '') != '' for contract in contracts)
-        features['day_sinlastloan'] = -1 if not has_claims else -3
-    
+            return parse_application_day(application_date)
+        except (ValueError, TypeError):
+            metrics.parse_failures.inc('application_date')
+            raise
+
+def calculate_json_features(application_date: str, contracts_json: Any,
+                            claim_windows: bool = False) -> Dict[str, Any]:
+    """calculate_features for a CSV-style contracts JSON string"""
+    return calculate_features(application_date, parse_contracts_json(contracts_json), claim_windows)
+
+def feature_store():
+    """The process's FeatureStore, opened on first use"""
+    global _feature_store
+    if _feature_store is None:
+        from feature_store import FeatureStore
+        _feature_store = FeatureStore(FEATURE_STORE_PATH)
+    return _feature_store
+
+def calculate_applicant_features(applicant_id: str, application_date: str, contracts: ContractColumns,
+                                 replace: bool) -> Dict[str, Any]:
+    """Add an applicant's new contracts to the feature store and score the application"""
+    sentinels = [] if metrics.enabled else None
+    with metrics.stage('feature_store'):
+        features = feature_store().score(applicant_id, application_date, contracts, replace=replace,
+                                         sentinels=sentinels)
+    metrics.record_features(features, len(contracts), sentinels or ())
     return features
 
+def calculate_backfill(contracts: ContractColumns, as_of_dates: List[str]) -> List[Dict[str, Any]]:
+    """Point-in-time features of one contract history at each as-of date"""
+    from backfill import ContractHistory  # numpy, only needed by this endpoint
+    features = {name: values.tolist() for name, values in ContractHistory(contracts).features(as_of_dates).items()}
+    return [{"as_of_date": as_of, **{name: values[i] for name, values in features.items()}}
+            for i, as_of in enumerate(as_of_dates)]
+
+def parse_contracts_json(contracts_json: Any) -> List[dict]:
+    """Decode a CSV-style contracts JSON string, keeping only dict entries"""
+    if not contracts_json or contracts_json == "":
+        return []
+    with metrics.stage('contracts_decode'):
+        try:
+            contracts = json_codec.loads(contracts_json)
+            # Ensure all contracts are dictionaries
+            return [c for c in contracts if isinstance(c, dict)]
+        except json.JSONDecodeError:
+            metrics.parse_failures.inc('contracts_json')
+            return []
+
+def json_application_inputs(data: Dict[str, Any]) -> Tuple[str, Any]:
+    """(application_date, raw contracts JSON) of a CSV-style application"""
+    application_date = data.get('application_date')
+    if not application_date:
+        raise ValueError("application_date is required")
+    return application_date, data.get('contracts', '')
+
+def extra_features(features: Dict[str, Any]) -> Dict[str, Any]:
+    """Optional features beyond the FeatureResponse fields (the claim-count windows), in registry order"""
+    return {name: value for name, value in features.items() if name not in FeatureResponse.model_fields}
+
+def build_feature_response(application_id: Optional[str], application_date: str,
+                           features: Dict[str, Any]) -> Dict[str, Any]:
+    """FeatureResponse as a plain dict, with the model's coercions but no validation pass"""
+    return {
+        "id": application_id,
+        "application_date": application_date,
+        "tot_claim_cnt_l180d": int(features['tot_claim_cnt_l180d']),
+        "disb_bank_loan_wo_tbc": float(features['disb_bank_loan_wo_tbc']),
+        "day_sinlastloan": int(features['day_sinlastloan']),
+        **{name: int(value) for name, value in extra_features(features).items()}
+    }
+
+def build_json_feature_response(application_id: Any, application_date: str,
+                                features: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": application_id,
+        "application_date": application_date,
+        "tot_claim_cnt_l180d": features['tot_claim_cnt_l180d'],
+        "disb_bank_loan_wo_tbc": features['disb_bank_loan_wo_tbc'],
+        "day_sinlastloan": features['day_sinlastloan'],
+        **extra_features(features)
+    }
+
+def features_for_application(request: ApplicationRequest) -> Dict[str, Any]:
+    """Calculate the feature response for a structured application"""
+    features = calculate_typed_features(request.application_date, request.contracts)
+    return build_feature_response(request.id, request.application_date, features)
+
+def features_for_json_application(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Calculate the feature response for a CSV-style application (contracts as a JSON string)"""
+    application_date, contracts_json = json_application_inputs(data)
+    features = calculate_json_features(application_date, contracts_json)
+    return build_json_feature_response(data.get('id'), application_date, features)
+
+def window_variant(claim_windows: bool) -> str:
+    """Cache variant of a scoring request's feature set"""
+    return 'claim_windows' if claim_windows else ''
+
+async def run_features(compute: Callable[..., Any], *args: Any, **options: Any) -> Any:
+    """feature_executor.run, under the profiler while a profiling session is running"""
+    if profiler.active:
+        return await feature_executor.run(profiled_call, compute, *args, **options)
+    return await feature_executor.run(compute, *args, **options)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Admin endpoints exist only with ADMIN_TOKEN set, and need it in X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def start_scoring_jobs() -> None:
+    """Open the jobs directory and start this process's job workers (SCORING_JOBS_DIR)"""
+    global scoring_jobs
+    if not SCORING_JOBS_DIR or scoring_jobs is not None:
+        return
+    scoring_jobs = JobManager.from_env(SCORING_JOBS_DIR, features_for_batch_record)
+    scoring_jobs.start()
+    jobs = scoring_jobs
+    metrics.gauge('feature_jobs_queued', "Scoring jobs waiting for a worker", lambda: jobs.store.count('queued'))
+    metrics.gauge('feature_jobs_running', "Scoring jobs being processed", lambda: jobs.store.count('running'))
+
+def require_scoring_jobs() -> JobManager:
+    if scoring_jobs is None:
+        raise HTTPException(status_code=404, detail="Scoring jobs are disabled; set SCORING_JOBS_DIR")
+    return scoring_jobs
+
+async def upload_job_input(jobs: JobManager, request: Request) -> Dict[str, Any]:
+    """Write a job's input to disk as it arrives (raw body, or the `file` field of a form) and queue it"""
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            raise ValueError("multipart job submissions need a `file` field")
+        upload = jobs.upload(input_format(file.content_type, file.filename))
+        try:
+            while chunk := await file.read(1 << 20):
+                await asyncio.to_thread(upload.write, chunk)
+        except BaseException:
+            upload.abort()
+            raise
+    else:
+        upload = jobs.upload(input_format(content_type))
+        try:
+            async for chunk in request.stream():
+                await asyncio.to_thread(upload.write, chunk)
+        except BaseException:
+            upload.abort()
+            raise
+    if upload.size == 0:
+        upload.abort()
+        raise ValueError("job input is empty")
+    return await asyncio.to_thread(jobs.submit, upload)
+
+def bypass_cache(cache_control: Optional[str]) -> bool:
+    """Honour `Cache-Control: no-cache` / `no-store` on scoring requests"""
+    return bool(cache_control) and ('no-cache' in cache_control or 'no-store' in cache_control)
+
+async def cached_features(application_date: str, contracts: Any, cache_control: Optional[str],
+                          compute: Callable[..., Dict[str, Any]], *args: Any,
+                          variant: str = '') -> Dict[str, Any]:
+    """Features from the result cache, computed once per distinct payload on a miss
+
+    compute(*args) runs on the feature executor, so it must be a module-level
+    function with picklable arguments when the executor uses processes.
+    `variant` names the feature set, keeping e.g. claim-window results apart.
+    """
+    async def run() -> Dict[str, Any]:
+        # Queueing plus computation, as seen from the event loop (in every executor mode)
+        with metrics.stage('execute'):
+            return await run_features(compute, *args)
+
+    if bypass_cache(cache_control) or not feature_cache.enabled:
+        return await run()
+    return await feature_cache.get_or_compute(payload_key(application_date, contracts, variant), run)
+
+def features_for_batch_record(record: Any) -> Dict[str, Any]:
+    """Calculate features for one batch record in either the structured or the CSV-style shape"""
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+    if isinstance(record.get('contracts'), list):
+        return features_for_application(ApplicationRequest(**record))
+    return features_for_json_application(record)
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a streamed body into non-empty lines, buffering at most one partial line"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+async def batch_feature_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compute features for each NDJSON record as it arrives, one output line per record"""
+    line_number = 0
+    async for line in iter_ndjson_lines(chunks):
+        line_number += 1
+        record = None
+        try:
+            record = json_codec.loads(line)
+            # Wait for a worker rather than fail: the stream itself is the backpressure
+            result = await run_features(features_for_batch_record, record, block=True, timeout=None)
+        except Exception as e:
+            result = {
+                "line": line_number,
+                "id": record.get('id') if isinstance(record, dict) else None,
+                "error": f"Error calculating features: {str(e)}"
+            }
+        yield json_codec.dumps(result) + b"\n"
+
+def feed_application_stream(parser: ApplicationStreamParser, data: bytes) -> ApplicationStreamParser:
+    """Fold a piece of the body in; returns the parser, since a process worker folds into a copy"""
+    parser.feed(data)
+    return parser
+
+def finish_application_stream(parser: ApplicationStreamParser, with_sentinels: bool
+                              ) -> Tuple[ApplicationStreamParser, Dict[str, Any], Optional[List[str]]]:
+    sentinels = [] if with_sentinels else None
+    features = parser.finish(sentinels)
+    return parser, features, sentinels
+
+async def streamed_application_response(chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """Feature response for an application body parsed and folded in while it arrives
+
+    The parse runs on the feature executor a STREAM_FEED_BYTES piece at a
+    time. Its state stays small however long the body is, so it can travel to
+    a process worker and back with each piece.
+    """
+    parser = ApplicationStreamParser()
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        if len(pending) >= STREAM_FEED_BYTES:
+            parser = await run_features(feed_application_stream, parser, pending)
+            pending = b""
+    if pending:
+        parser = await run_features(feed_application_stream, parser, pending)
+    parser, features, sentinels = await run_features(finish_application_stream, parser, metrics.enabled)
+    metrics.record_features(features, parser.accumulator.contracts, sentinels or ())
+    fields = parser.fields
+    if parser.csv_style:
+        return build_json_feature_response(fields.get('id'), fields['application_date'], features)
+    return build_feature_response(fields.get('id'), fields['application_date'], features)
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streaming response whose body generator also reads the request body
+
+    The stock StreamingResponse listens for client disconnects on the same
+    receive channel, which would swallow request body chunks mid-stream.
+    Disconnects surface through request.stream() instead.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    """Fail fast when the service is saturated so clients can retry elsewhere"""
+    return JSONResponse(status_code=503, content={"detail": f"Service overloaded: {exc}"},
+                        headers={"Retry-After": "1"})
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_handler(request: Request, exc: DeadlineExceededError):
+    return JSONResponse(status_code=504, content={"detail": f"Deadline exceeded: {exc}"})
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -138,18 +424,93 @@ async def root():
         "message": "ML Feature Engineering Service",
         "description": "Submit application data to calculate financial features",
         "endpoints": {
-            "POST /calculate-features": "Calculate features from application data",
-            "GET /health": "Health check endpoint"
+            "POST /calculate-features": "Calculate features from application data (?claim_windows=true adds the claim-count windows)",
+            "POST /calculate-features-from-json/raw": "Same as /calculate-features-from-json, decoding the raw body once",
+            "POST /calculate-features/stream": "Either scoring request shape, parsed incrementally for very large contract lists",
+            "POST /calculate-features/batch": "Calculate features for NDJSON applications, streamed back as NDJSON",
+            "POST /calculate-features/backfill": "Calculate point-in-time features of one contract history at many as-of dates",
+            "POST /applicants/{applicant_id}/calculate-features": "Calculate features from an applicant's stored history plus new contracts",
+            "GET /health": "Health check endpoint",
+            "GET /cache/stats": "Feature result cache counters",
+            "GET /executor/stats": "Feature executor load and backpressure counters",
+            "GET /metrics": "Per-stage latency histograms and counters (Prometheus text format)",
+            "POST /admin/profile": "Profile the next N requests or T seconds (admin token required)",
+            "POST /jobs": "Submit a CSV, NDJSON or JSON array of applications as an asynchronous scoring job",
+            "GET /jobs/{job_id}": "Job status, progress and throughput",
+            "GET /jobs/{job_id}/results": "Download a finished job's NDJSON results",
+            "DELETE /jobs/{job_id}": "Delete a job and its results"
         }
     }
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "service": "ML Feature Engineering Service"}
+    """Health check endpoint, reporting the worker process that answered
+
+    Answers 503 while the startup warm-up is still running.
+    """
+    health = {
+        "status": "healthy" if startup_state["ready"] else "warming_up",
+        "service": "ML Feature Engineering Service",
+        **worker_health(),
+        "in_flight": feature_executor.in_flight,
+        "startup": startup_state
+    }
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content=health)
+    return health
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Feature result cache counters (hits, misses, evictions, coalesced requests)"""
+    return feature_cache.stats()
+
+@app.get("/executor/stats")
+async def executor_stats():
+    """Feature executor load (in flight, queued) and backpressure counters (rejected, timed out)"""
+    return feature_executor.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency histograms and request counters in the Prometheus text format
+
+    404 when metrics are disabled (FEATURE_METRICS=0).
+    """
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled; unset FEATURE_METRICS=0")
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(requests: Optional[int] = None, seconds: Optional[float] = None,
+                        memory: bool = True, top: int = 30, sort: str = 'cumulative', wait: bool = True):
+    """
+    Profile the next `requests` feature computations or the next `seconds`, whichever ends first
+    
+    Computations run under cProfile and, with `memory=true`, tracemalloc
+    traces allocations. With `wait=true` (default) the aggregated report is
+    returned once the session is over; otherwise the session starts and its
+    report is available from `GET /admin/profile`. Only this worker process is
+    profiled. Requires `X-Admin-Token`.
+    """
+    try:
+        session = profiler.start(requests=requests, seconds=seconds, memory=memory, top=top, sort=sort)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not wait:
+        return JSONResponse(status_code=202, content=profiler.status())
+    await asyncio.to_thread(session.done.wait)
+    return session.report
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_status():
+    """Whether a profiling session is running, and the report of the last one"""
+    return profiler.status()
 
 @app.post("/calculate-features", response_model=FeatureResponse)
-async def calculate_application_features(request: ApplicationRequest):
+async def calculate_application_features(request: ApplicationRequest,
+                                         cache_control: Optional[str] = Header(None),
+                                         claim_windows: bool = False):
     """
     Calculate features from application data
     
@@ -157,30 +518,35 @@ async def calculate_application_features(request: ApplicationRequest):
     - tot_claim_cnt_l180d: Number of claims in last 180 days
     - disb_bank_loan_wo_tbc: Sum of disbursed loans excluding TBC banks
     - day_sinlastloan: Days since last loan
+    
+    With `?claim_windows=true` the response also carries claim counts over
+    7/30/90/180/365 days (`tot_claim_cnt_l{w}d`) and the same without TBC
+    banks (`tot_claim_cnt_l{w}d_wo_tbc`), all computed from one sort.
+    
+    Results are cached by (application_date, contracts); send
+    `Cache-Control: no-cache` to force a fresh computation.
     """
     try:
-        # Convert contracts to dict format
-        contracts_dict = [contract.dict() for contract in request.contracts]
-        
-        # Calculate features
-        features = calculate_features(request.application_date, contracts_dict)
-        
-        # Prepare response
-        response = FeatureResponse(
-            id=request.id,
-            application_date=request.application_date,
-            tot_claim_cnt_l180d=features['tot_claim_cnt_l180d'],
-            disb_bank_loan_wo_tbc=features['disb_bank_loan_wo_tbc'],
-            day_sinlastloan=features['day_sinlastloan']
+        features = await cached_features(
+            request.application_date, request.contracts.columns, cache_control,
+            calculate_typed_features, request.application_date, request.contracts, claim_windows,
+            variant=window_variant(claim_windows)
         )
+        response = build_feature_response(request.id, request.application_date, features)
+        # Already shaped like FeatureResponse; skip re-validating it on the way out
+        with metrics.stage('serialize'):
+            body = json_codec.dumps(response)
+        return Response(body, media_type="application/json")
         
-        return response
-        
+    except (OverloadedError, DeadlineExceededError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error calculating features: {str(e)}")
 
 @app.post("/calculate-features-from-json")
-async def calculate_features_from_json(data: Dict[str, Any]):
+async def calculate_features_from_json(data: Dict[str, Any],
+                                       cache_control: Optional[str] = Header(None),
+                                       claim_windows: bool = False):
     """
     Alternative endpoint that accepts data in the same format as the CSV file
     
@@ -190,44 +556,216 @@ async def calculate_features_from_json(data: Dict[str, Any]):
         "application_date": "2024-02-12 19:24:29.135000+00:00",
         "contracts": "[{\"contract_id\": 522530, \"bank\": \"003\", ...}]"
     }
+    
+    `?claim_windows=true` adds the claim-count windows, as in `/calculate-features`.
+    
+    Results are cached by (application_date, contracts); send
+    `Cache-Control: no-cache` to force a fresh computation.
     """
     try:
-        # Extract data
-        application_id = data.get('id')
-        application_date = data.get('application_date')
-        contracts_json = data.get('contracts', '')
-        
-        if not application_date:
-            raise ValueError("application_date is required")
+        application_date, contracts_json = json_application_inputs(data)
+        features = await cached_features(
+            application_date, contracts_json, cache_control,
+            calculate_json_features, application_date, contracts_json, claim_windows,
+            variant=window_variant(claim_windows)
+        )
+        return build_json_feature_response(data.get('id'), application_date, features)
         
-        # Parse contracts
-        if contracts_json and contracts_json != "":
+    except (OverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error calculating features: {str(e)}")
+
+@app.post("/calculate-features-from-json/raw")
+async def calculate_features_from_raw_json(request: Request,
+                                           cache_control: Optional[str] = Header(None),
+                                           claim_windows: bool = False):
+    """
+    Fast path for `/calculate-features-from-json` (same request and response shape)
+    
+    The raw request bytes are decoded once with the fastest available JSON
+    backend (orjson when installed) and the response is serialized directly,
+    skipping FastAPI's body validation and response encoding.
+    """
+    try:
+        body = await request.body()
+        with metrics.stage('body_decode'):
             try:
-                contracts = json.loads(contracts_json)
-                # Ensure all contracts are dictionaries
-                contracts = [c for c in contracts if isinstance(c, dict)]
-            except json.JSONDecodeError:
-                contracts = []
-        else:
-            contracts = []
-        
-        # Calculate features
-        features = calculate_features(application_date, contracts)
+                data = json_codec.loads(body)
+            except ValueError:
+                metrics.parse_failures.inc('body')
+                raise
+        if not isinstance(data, dict):
+            raise ValueError("request body must be a JSON object")
+        application_date, contracts_json = json_application_inputs(data)
+        features = await cached_features(
+            application_date, contracts_json, cache_control,
+            calculate_json_features, application_date, contracts_json, claim_windows,
+            variant=window_variant(claim_windows)
+        )
+        response = build_json_feature_response(data.get('id'), application_date, features)
+        with metrics.stage('serialize'):
+            body = json_codec.dumps(response)
+        return Response(body, media_type="application/json")
         
-        # Prepare response
-        response = {
-            "id": application_id,
-            "application_date": application_date,
-            "tot_claim_cnt_l180d": features['tot_claim_cnt_l180d'],
-            "disb_bank_loan_wo_tbc": features['disb_bank_loan_wo_tbc'],
-            "day_sinlastloan": features['day_sinlastloan']
-        }
+    except (OverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error calculating features: {str(e)}")
+
+@app.post("/calculate-features/backfill")
+async def calculate_backfill_features(request: BackfillRequest):
+    """
+    Point-in-time backfill: features of one contract history as of many dates
+    
+    The history is validated and sorted once, and every as-of date is answered
+    with a binary search. Only claims and contracts dated on or before an as-of
+    date count towards it, so no later information leaks into earlier rows:
+    
+        {"id": "...", "features": [{"as_of_date": "2023-01-01", "tot_claim_cnt_l180d": 3, ...}, ...]}
+    """
+    try:
+        features = await run_features(calculate_backfill, request.contracts, request.as_of_dates)
+        return Response(json_codec.dumps({"id": request.id, "features": features}), media_type="application/json")
         
-        return response
+    except (OverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error calculating features: {str(e)}")
+
+@app.post("/applicants/{applicant_id}/calculate-features", response_model=FeatureResponse)
+async def calculate_stored_applicant_features(applicant_id: str, request: ApplicationRequest,
+                                              replace: bool = False):
+    """
+    Calculate features for a repeat applicant from only their new contracts
+    
+    `contracts` holds the contracts added since the applicant's previous
+    application; they are merged into the applicant's stored history, and the
+    features are answered from the aggregated history. With `?replace=true` the
+    stored history is replaced by `contracts` instead. Requires the feature
+    store (`FEATURE_STORE_PATH`).
+    """
+    if not FEATURE_STORE_PATH:
+        raise HTTPException(status_code=404, detail="Feature store is disabled; set FEATURE_STORE_PATH")
+    try:
+        features = await run_features(
+            calculate_applicant_features, applicant_id, request.application_date, request.contracts, replace
+        )
+        response = build_feature_response(request.id, request.application_date, features)
+        with metrics.stage('serialize'):
+            body = json_codec.dumps(response)
+        return Response(body, media_type="application/json")
         
+    except (OverloadedError, DeadlineExceededError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error calculating features: {str(e)}")
 
+@app.post("/calculate-features/stream")
+async def calculate_streamed_features(request: Request):
+    """
+    Score one application whose contracts are parsed while the body is still arriving
+    
+    Accepts the `/calculate-features` shape (contracts as an array) or the
+    `/calculate-features-from-json` shape (contracts as a JSON string) and
+    answers like that endpoint. Contracts are decoded one at a time and folded
+    into the feature state in small slices, so memory per request stays flat
+    however many contracts the applicant has. Results are not cached.
+    
+    An invalid body is answered with 422. The folds run on the feature
+    executor, so a saturated service answers 503 and a slow parse 504.
+    """
+    try:
+        response = await streamed_application_response(request.stream())
+    except StreamParseError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request: {str(e)}")
+    return Response(json_codec.dumps(response), media_type="application/json")
+
+@app.post("/calculate-features/batch")
+async def calculate_features_batch(request: Request):
+    """
+    Batch endpoint: newline-delimited applications in, newline-delimited features out
+    
+    Each input line is either the structured `/calculate-features` shape (contracts
+    as a list) or the CSV-style `/calculate-features-from-json` shape (contracts as
+    a JSON string). Results are streamed back in input order as they are computed;
+    a record that fails produces an error line instead of failing the batch:
+    
+        {"line": 3, "id": "2925211.0", "error": "Error calculating features: ..."}
+    """
+    return NDJSONStreamingResponse(batch_feature_lines(request.stream()))
+
+@app.post("/jobs", status_code=202)
+async def submit_scoring_job(request: Request):
+    """
+    Submit a large scoring request as an asynchronous job; answers with the job id at once
+    
+    The body is a CSV file shaped like data.csv (`text/csv`), NDJSON records as
+    for `/calculate-features/batch` (`application/x-ndjson`) or a JSON array of
+    them (`application/json`). A multipart form with a `file` field works too,
+    with the format taken from the file's type or extension. The input is
+    written to disk as it arrives and scored by the service's job workers,
+    apart from the synchronous endpoints. Poll `GET /jobs/{job_id}` for
+    progress and fetch `GET /jobs/{job_id}/results` once it has succeeded.
+    Requires `SCORING_JOBS_DIR`.
+    """
+    jobs = require_scoring_jobs()
+    try:
+        job = await upload_job_input(jobs, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content=job, headers={"Location": f"/jobs/{job['id']}"})
+
+@app.get("/jobs")
+async def list_scoring_jobs(status: Optional[str] = None, limit: int = 100):
+    """The most recent jobs, newest first, optionally only those with `status`"""
+    jobs = require_scoring_jobs()
+    return {"jobs": await asyncio.to_thread(jobs.list, status, limit), **await asyncio.to_thread(jobs.stats)}
+
+@app.get("/jobs/{job_id}")
+async def scoring_job_status(job_id: str):
+    """
+    A job's status (queued, running, succeeded or failed), progress and throughput
+    
+        {"id": "...", "status": "running", "total": 250000, "done": 120000, "failed": 3,
+         "progress": 0.48, "throughput": {"queue_seconds": 0.4, "run_seconds": 13.1,
+         "busy_seconds": 12.9, "records_per_second": 9302.3, "eta_seconds": 14.0}, ...}
+    """
+    jobs = require_scoring_jobs()
+    try:
+        return await asyncio.to_thread(jobs.status, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+@app.get("/jobs/{job_id}/results")
+async def scoring_job_results(job_id: str):
+    """
+    A succeeded job's results: one NDJSON line per input record, in input order
+    
+    Lines are the `/calculate-features/batch` output, including its error lines
+    for records that could not be scored. 409 while the job is not done.
+    """
+    jobs = require_scoring_jobs()
+    try:
+        path = await asyncio.to_thread(jobs.results_path, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    except JobNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{job_id}.ndjson")
+
+@app.delete("/jobs/{job_id}", status_code=204)
+async def delete_scoring_job(job_id: str):
+    """Delete a job and its files; a running job stops after its current chunk"""
+    jobs = require_scoring_jobs()
+    try:
+        await asyncio.to_thread(jobs.delete, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return Response(status_code=204)
+
+mark_imported()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002) 
\ No newline at end of file
+    import server
+    server.main(app)
@@ -0,0 +1,267 @@
+"""
+In-process metrics for the feature service, rendered in the Prometheus text format.
+
+`metrics` is the process-wide `MetricsRegistry`. Request handlers time their
+stages with ``with metrics.stage('features'):`` and bump the counters below;
+`/metrics` renders everything. Updates take one lock and a bisect, and with
+``FEATURE_METRICS=0`` every update is a no-op and `/metrics` answers 404.
+
+Metrics are per process: with several server workers each one reports its
+own, and work done inside process-pool executor workers
+(``FEATURE_EXECUTOR=process``) is not seen by the server process.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; from 50µs kernels on small applications up to multi-second batches
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTRACT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self.registry.lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+
+class Gauge(_Metric):
+    """A value read from a callback when rendered (e.g. in-flight requests)"""
+    kind = 'gauge'
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, read: Callable[[], float]):
+        super().__init__(registry, name, help)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.read())}"]
+
+
+class CallbackCounter(Gauge):
+    """A counter maintained elsewhere (e.g. date parse failures), read when rendered"""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[str]:
+        with self.registry.lock:
+            snapshot = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        lines = []
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class _StageTimer:
+    __slots__ = ('histogram', 'stage', 'started')
+
+    def __init__(self, histogram: Histogram, stage: str):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self) -> "_StageTimer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, self.stage)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoTimer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class MetricsRegistry:
+    """The service's metrics; all updates are no-ops when disabled"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self._metrics: List[_Metric] = []
+        self.stages = self.histogram(
+            'feature_stage_seconds', "Time spent in each request processing stage", ('stage',))
+        self.requests = self.histogram(
+            'feature_request_seconds', "End-to-end request latency by route and status", ('route', 'status'))
+        self.contracts = self.histogram(
+            'feature_contracts_per_request', "Contracts per scored application", buckets=CONTRACT_BUCKETS)
+        self.sentinels = self.counter(
+            'feature_sentinel_total', "Features answered with their -1/-3 missing value (no contract matched)",
+            ('feature', 'value'))
+        self.parse_failures = self.counter(
+            'feature_parse_failures_total', "Inputs that could not be decoded or validated", ('kind',))
+        self.http_in_flight = 0
+
+    @classmethod
+    def from_env(cls) -> "MetricsRegistry":
+        """Enabled unless FEATURE_METRICS is 0 / false / off"""
+        return cls(enabled=os.environ.get('FEATURE_METRICS', '1').lower() not in ('0', 'false', 'off', 'no'))
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self._add(Gauge(self, name, help, read))
+
+    def callback_counter(self, name: str, help: str, read: Callable[[], float]) -> CallbackCounter:
+        return self._add(CallbackCounter(self, name, help, read))
+
+    def stage(self, name: str):
+        """Context manager timing one processing stage into feature_stage_seconds"""
+        return _StageTimer(self.stages, name) if self.enabled else _NO_TIMER
+
+    def record_features(self, features: Dict[str, object], contracts: Optional[int] = None,
+                        sentinels: Iterable[str] = ()) -> None:
+        """Count one application's sentinel outcomes and contract count
+
+        `sentinels` names the features answered with their missing value, as
+        reported by the kernel: a -1 can also be a genuine day_sinlastloan (a
+        loan dated the day after the application), so values are not compared.
+        """
+        if not self.enabled:
+            return
+        if contracts is not None:
+            self.contracts.observe(contracts)
+        for name in sentinels:
+            self.sentinels.inc(name, str(int(features[name])))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry.from_env()
+
+
+class MetricsMiddleware:
+    """Time every HTTP request by matched route template and status; tracks requests in flight
+
+    Warm-up requests (see startup.py) are not counted.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics, skip_clients: Sequence = ()):
+        self.app = app
+        self.registry = registry
+        self.skip_clients = tuple(skip_clients)
+
+    async def __call__(self, scope, receive, send) -> None:
+        registry = self.registry
+        if not registry.enabled or scope["type"] != "http" or scope.get("client") in self.skip_clients:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_and_record(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        registry.http_in_flight += 1
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            registry.http_in_flight -= 1
+            route = scope.get("route")
+            # Route templates keep the label set bounded (no applicant ids)
+            path = getattr(route, "path", None) or "unmatched"
+            registry.requests.observe(time.perf_counter() - started, path, str(status))
@@ -0,0 +1,154 @@
+"""
+Resumable offline feature jobs with partitioned, checkpointed output.
+
+The input is split into deterministic partitions: partition i holds
+applications ``[i * chunk_size, (i + 1) * chunk_size)``. Each partition's
+features are written to ``<job_dir>/part-00000.csv`` through a temporary file
+and an atomic rename, and then recorded in ``<job_dir>/manifest.json``, which
+is itself replaced atomically. A partition is done only once the manifest says
+so; a run that is killed loses at most the partitions in flight, and a rerun
+with the same job directory skips every partition already recorded. `merge`
+concatenates the partitions, in input order, into the final output file.
+
+The manifest also records the input file (size and modification time), the
+chunk size and the job settings. Resuming with any of them changed is refused,
+because the partitions would no longer line up.
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import pandas as pd
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _atomic_write(path: str, write) -> None:
+    """write(f) into a temporary sibling of path, fsync it, then rename it over path"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp, 'w', newline='') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def input_fingerprint(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class PartitionedJob:
+    """The manifest and partition files of one offline feature job"""
+
+    def __init__(self, job_dir: str, input_path: str, chunk_size: int,
+                 settings: Optional[Dict[str, Any]] = None):
+        self.job_dir = job_dir
+        self.input_path = input_path
+        self.chunk_size = chunk_size
+        os.makedirs(job_dir, exist_ok=True)
+        expected = {
+            "version": MANIFEST_VERSION,
+            "input": input_fingerprint(input_path),
+            "chunk_size": chunk_size,
+            "settings": settings or {},
+        }
+        self.manifest = self._load()
+        if self.manifest is None:
+            self.manifest = dict(expected, partitions={}, total_partitions=None, created=time.time())
+            self._save()
+        else:
+            for key, value in expected.items():
+                if self.manifest.get(key) != value:
+                    raise ValueError(f"Job {job_dir} was started with a different {key} "
+                                     f"({self.manifest.get(key)!r}, now {value!r}); use a new job directory")
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.job_dir, MANIFEST)
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save(self) -> None:
+        _atomic_write(self.manifest_path, lambda f: json.dump(self.manifest, f, indent=1))
+
+    @staticmethod
+    def part_name(index: int) -> str:
+        return f"part-{index:05d}.csv"
+
+    def part_path(self, index: int) -> str:
+        return os.path.join(self.job_dir, self.part_name(index))
+
+    def is_done(self, index: int) -> bool:
+        entry = self.manifest["partitions"].get(str(index))
+        return entry is not None and os.path.exists(self.part_path(index))
+
+    @property
+    def done(self) -> int:
+        return sum(1 for key in self.manifest["partitions"] if self.is_done(int(key)))
+
+    @property
+    def complete(self) -> bool:
+        total = self.manifest["total_partitions"]
+        return total is not None and all(self.is_done(i) for i in range(total))
+
+    def partitions(self) -> Iterator[Tuple[int, pd.DataFrame]]:
+        """(index, chunk) for every partition of the input, done or not; records the total at the end"""
+        from batch_runner import read_chunks  # imports this module
+
+        index = -1
+        for index, chunk in enumerate(read_chunks(self.input_path, self.chunk_size)):
+            yield index, chunk
+        if self.manifest["total_partitions"] != index + 1:
+            self.manifest["total_partitions"] = index + 1
+            self._save()
+
+    def pending(self) -> Iterator[Tuple[int, pd.DataFrame]]:
+        """partitions() without those already done"""
+        for index, chunk in self.partitions():
+            if not self.is_done(index):
+                yield index, chunk
+
+    def write(self, index: int, results: pd.DataFrame) -> None:
+        """Write one partition's features atomically, then mark it done in the manifest"""
+        _atomic_write(self.part_path(index), lambda f: results.to_csv(f, index=False))
+        self.manifest["partitions"][str(index)] = {
+            "file": self.part_name(index),
+            "rows": len(results),
+            "finished": time.time(),
+        }
+        self._save()
+
+    def read(self, index: int) -> pd.DataFrame:
+        """A finished partition's features, with ids and dates read back as text"""
+        return pd.read_csv(self.part_path(index), dtype={'id': str, 'application_date': str})
+
+    def merge(self, output_path: str) -> int:
+        """Concatenate every partition, in input order, into output_path; returns rows written"""
+        if not self.complete:
+            total = self.manifest["total_partitions"]
+            raise ValueError(f"Job {self.job_dir} is not complete ({self.done} of "
+                             f"{'?' if total is None else total} partitions done)")
+        total = self.manifest["total_partitions"]
+
+        def write(out) -> None:
+            for index in range(total):
+                with open(self.part_path(index), newline='') as part:
+                    header = part.readline()
+                    if index == 0:
+                        out.write(header)
+                    shutil.copyfileobj(part, out)
+
+        _atomic_write(output_path, write)
+        return sum(self.manifest["partitions"][str(i)]["rows"] for i in range(total))
@@ -0,0 +1,252 @@
+"""
+On-demand profiling of the feature hot path in a running process.
+
+A `ProfileSession` covers the next N profiled calls or the next T seconds,
+whichever ends first. Each call wrapped with `profiled_call` runs under
+cProfile (deterministic profiling of every Python function call) and the
+profiles are merged; with ``memory=True`` tracemalloc traces allocations for
+the session and the report lists the lines that allocated the most. Outside a
+session `profiled_call` is a plain call.
+
+A session is started by:
+    - the admin endpoint ``POST /admin/profile`` of the API, which answers
+      with the report once the session is over
+    - SIGUSR1 to an API worker or to ``python data_analysis.py``, which
+      profiles for PROFILE_SIGNAL_SECONDS (default 30) and writes the report
+      to PROFILE_DIR (default: the working directory)
+
+Profiled calls are serialized (one cProfile is active at a time), so expect
+lower throughput while a session is running. Calls that run in process-pool
+workers (FEATURE_EXECUTOR=process) are not profiled.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+# Upper bound on a session's length, so a forgotten session can't run forever
+MAX_SESSION_SECONDS = 600.0
+DEFAULT_TOP = 30
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a session is started while another one is running"""
+
+
+class ProfileSession:
+    """One profiling window: counts calls, merges their profiles, traces allocations"""
+
+    def __init__(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+                 memory: bool = True, top: int = DEFAULT_TOP, sort: str = 'cumulative'):
+        if requests is None and seconds is None:
+            raise ValueError("a profiling session needs a request count, a duration or both")
+        if requests is not None and requests < 1:
+            raise ValueError("requests must be at least 1")
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            raise ValueError(f"unknown sort key {sort!r}")
+        self.requests = requests
+        self.seconds = min(seconds, MAX_SESSION_SECONDS) if seconds is not None else MAX_SESSION_SECONDS
+        self.memory = memory
+        self.top = top
+        self.sort = sort
+        self.calls = 0
+        self.errors = 0
+        self.started = time.time()
+        self._deadline = time.monotonic() + self.seconds
+        self._stats: Optional[pstats.Stats] = None
+        self._run_lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self.report: Optional[Dict[str, Any]] = None
+        self.done = threading.Event()
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.take_snapshot()
+
+    @property
+    def active(self) -> bool:
+        return not self.done.is_set()
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self._deadline or (self.requests is not None and self.calls >= self.requests)
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._run_lock:
+            if not self.active or self.expired():
+                return fn(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            except Exception:
+                self.errors += 1
+                raise
+            finally:
+                self.calls += 1
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                if self.expired():
+                    self._finish()
+
+    def finish(self) -> Dict[str, Any]:
+        """End the session now (if still running) and return its report"""
+        with self._run_lock:
+            if self.active:
+                self._finish()
+        return self.report
+
+    def _finish(self) -> None:
+        report: Dict[str, Any] = {
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            "duration_seconds": round(time.time() - self.started, 3),
+            "pid": os.getpid(),
+            "calls": self.calls,
+            "errors": self.errors,
+            "profile": self._profile_text(),
+        }
+        if self.memory:
+            report.update(self._allocations())
+        self.report = report
+        self.done.set()
+
+    def _profile_text(self) -> str:
+        if self._stats is None:
+            return "no profiled calls"
+        out = io.StringIO()
+        self._stats.stream = out
+        self._stats.sort_stats(self.sort).print_stats(self.top)
+        return out.getvalue()
+
+    def _allocations(self) -> Dict[str, Any]:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, pstats.__file__),
+        ))
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        top: List[Dict[str, Any]] = []
+        for stat in snapshot.compare_to(self._baseline, 'lineno')[:self.top]:
+            frame = stat.traceback[0]
+            top.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size_diff_kib": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+                "size_kib": round(stat.size / 1024, 1),
+            })
+        return {"peak_traced_kib": round(peak / 1024, 1), "allocations": top}
+
+
+class Profiler:
+    """The process's profiling switch: at most one session at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.session: Optional[ProfileSession] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> bool:
+        session = self.session
+        return session is not None and session.active
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+              memory: bool = True, top: int = DEFAULT_TOP, sort: str = 'cumulative',
+              on_done: Optional[Callable[[Dict[str, Any]], None]] = None) -> ProfileSession:
+        """Begin a session; on_done(report) is called from a helper thread once it is over"""
+        with self._lock:
+            if self.active:
+                raise ProfilerBusyError("a profiling session is already running")
+            session = ProfileSession(requests, seconds, memory, top, sort)
+            self.session = session
+
+        self._watcher = threading.Thread(target=self._watch, args=(session, on_done), daemon=True)
+        self._watcher.start()
+        return session
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """End the running session early and wait for its on_done; returns the last report"""
+        session, watcher = self.session, self._watcher
+        if session is not None:
+            session.finish()
+        if watcher is not None:
+            watcher.join()
+        return self.last_report
+
+    def _watch(self, session: ProfileSession,
+               on_done: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        # Ends the session when its time is up even if no call comes in
+        session.done.wait(session.seconds)
+        report = session.finish()
+        self.last_report = report
+        if on_done is not None:
+            on_done(report)
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        session = self.session
+        if session is None or not session.active:
+            return fn(*args, **kwargs)
+        return session.call(fn, *args, **kwargs)
+
+    def status(self) -> Dict[str, Any]:
+        session = self.session
+        if session is None or not session.active:
+            return {"active": False, "last_report": self.last_report}
+        return {"active": True, "calls": session.calls, "requests": session.requests,
+                "seconds": session.seconds, "memory": session.memory}
+
+
+profiler = Profiler()
+
+
+def profiled_call(fn: Callable[..., Any], *args: Any) -> Any:
+    """fn(*args), profiled while a session is running in this process
+
+    Module-level so it can be handed to executors.
+    """
+    return profiler.call(fn, *args)
+
+
+def write_report(report: Dict[str, Any], directory: Optional[str] = None) -> str:
+    """Write a report as JSON to PROFILE_DIR (or `directory`); returns the path"""
+    directory = directory or os.environ.get('PROFILE_DIR', '.')
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, f"profile-{report['pid']}-{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Profile of {report['calls']} calls written to {path}")
+    return path
+
+
+def install_signal_handler(signum: Optional[int] = None) -> bool:
+    """Start a PROFILE_SIGNAL_SECONDS session on SIGUSR1; False where unavailable
+
+    Must be called from the main thread. The report is written with write_report.
+    """
+    signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(received: int, frame: Any) -> None:
+        seconds = float(os.environ.get('PROFILE_SIGNAL_SECONDS', '30'))
+        try:
+            profiler.start(seconds=seconds, on_done=write_report)
+            print(f"Profiling for {seconds:g}s (pid {os.getpid()})")
+        except ProfilerBusyError:
+            print("Profiling session already running; signal ignored")
+
+    signal.signal(signum, handle)
+    return True
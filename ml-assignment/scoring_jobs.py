@@ -0,0 +1,500 @@
+"""
+Asynchronous scoring jobs for submissions too large for one HTTP request.
+
+A job is submitted as a file (CSV like data.csv, NDJSON like
+`/calculate-features/batch`, or a JSON array of applications). The upload is
+written to ``<jobs_dir>/<job id>/`` and answered with the job id straight
+away. A pool of local worker threads then runs each job in two steps:
+
+    prepare  the input is normalized to ``records.ndjson``, one application
+             per line, and counted, so progress can be reported as done/total
+    score    records are scored `chunk_size` at a time; each chunk's result
+             lines are appended to ``results.ndjson`` (one line per record,
+             in input order, errors as ``{"line", "id", "error"}`` lines)
+
+Job state lives in ``<jobs_dir>/jobs.sqlite``. After every chunk the job's
+counters, its read offset in the records and the size of the results file
+are committed, so a job interrupted by a restart resumes from its last chunk.
+A running job holds a lease that it renews with every chunk; a job whose
+lease ran out (its process died, or a chunk stalled) is picked up again by any
+worker. Before appending a scored chunk a worker renews its lease, which
+fails if the job was taken over, so only the current owner ever writes the
+results file. Several server processes can share one jobs directory.
+
+Jobs never run on the request executor. By default (``executor='process'``)
+chunks are scored on a separate pool of `workers` processes, so a large job
+doesn't compete with the synchronous endpoints for the API process's
+interpreter; ``executor='thread'`` scores them on the job threads instead.
+Finished jobs and their results are kept until deleted.
+"""
+import csv
+import io
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import json_codec
+from metrics import metrics
+from streaming_ingest import ArrayItemScanner
+
+FORMATS = ('csv', 'ndjson', 'json')
+EXECUTORS = ('thread', 'process')
+STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+DEFAULT_CHUNK_SIZE = 1000
+# A running job's lease; renewed with every chunk, so it must outlast scoring one chunk
+LEASE_SECONDS = 120.0
+# Idle workers look for new jobs this often (submissions in-process wake them at once)
+POLL_SECONDS = 1.0
+# Records normalized between lease renewals while preparing
+PREPARE_HEARTBEAT = 10000
+# Longest single application in a JSON array input (characters)
+MAX_RECORD_CHARS = 1 << 26
+READ_SIZE = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    format TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    input_bytes INTEGER NOT NULL,
+    total INTEGER,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    input_offset INTEGER NOT NULL DEFAULT 0,
+    results_bytes INTEGER NOT NULL DEFAULT 0,
+    busy_seconds REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_until REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created);
+"""
+
+COLUMNS = ('id', 'status', 'format', 'created', 'started', 'finished', 'input_bytes', 'total', 'done',
+           'failed', 'input_offset', 'results_bytes', 'busy_seconds', 'attempts', 'owner', 'lease_until',
+           'error')
+
+_jobs_processed = metrics.counter(
+    'feature_job_records_total', "Records scored by asynchronous jobs, by outcome", ('outcome',))
+
+
+class JobNotFoundError(LookupError):
+    """Raised for a job id that does not exist (or was deleted)"""
+
+
+class JobNotReadyError(Exception):
+    """Raised when a job's results are asked for before it succeeded"""
+
+
+class _JobLost(Exception):
+    """The job was deleted, or its lease was taken over, while this worker ran it"""
+
+
+def input_format(content_type: Optional[str], filename: Optional[str] = None) -> str:
+    """The job input format for an upload's Content-Type or file name"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if content_type in ('text/csv', 'application/csv') or extension == 'csv':
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson') \
+            or extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if content_type == 'application/json' or extension == 'json':
+        return 'json'
+    raise ValueError("Unsupported job input; send text/csv, application/x-ndjson or application/json "
+                     "(or a file named *.csv, *.ndjson or *.json)")
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return None if value is None else time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(value))
+
+
+def job_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    """A job row as the API reports it, with progress and throughput"""
+    now = time.time()
+    total, done = job['total'], job['done']
+    rate = done / job['busy_seconds'] if job['busy_seconds'] > 0 else None
+    running = job['status'] == 'running'
+    end = job['finished'] or now
+    return {
+        "id": job['id'],
+        "status": job['status'],
+        "format": job['format'],
+        "created": _timestamp(job['created']),
+        "started": _timestamp(job['started']),
+        "finished": _timestamp(job['finished']),
+        "input_bytes": job['input_bytes'],
+        "total": total,
+        "done": done,
+        "failed": job['failed'],
+        "progress": round(done / total, 4) if total else (1.0 if total == 0 else 0.0),
+        "attempts": job['attempts'],
+        "error": job['error'],
+        "throughput": {
+            "queue_seconds": round((job['started'] or now) - job['created'], 3),
+            "run_seconds": round(end - job['started'], 3) if job['started'] else None,
+            "busy_seconds": round(job['busy_seconds'], 3),
+            "records_per_second": round(rate, 1) if rate else None,
+            "eta_seconds": round((total - done) / rate, 1) if running and rate and total is not None else None,
+        },
+    }
+
+
+class JobStore:
+    """SQLite-backed job rows; safe to share between threads and processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def add(self, job_id: str, format: str, input_bytes: int) -> None:
+        self._execute("INSERT INTO jobs (id, status, format, created, input_bytes) VALUES (?, 'queued', ?, ?, ?)",
+                      (job_id, format, time.time(), input_bytes))
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        row = self._execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise JobNotFoundError(job_id)
+        return dict(zip(COLUMNS, row))
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        where, params = ("WHERE status = ?", (status,)) if status else ("", ())
+        rows = self._execute(f"SELECT {', '.join(COLUMNS)} FROM jobs {where} ORDER BY created DESC LIMIT ?",
+                             (*params, limit)).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def delete(self, job_id: str) -> bool:
+        return self._execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job, or a running one whose lease ran out"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, attempts = attempts + 1, "
+                        "started = COALESCE(started, ?) WHERE id = ?", (owner, now + LEASE_SECONDS, now, row[0]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row[0])
+
+    def _owned(self, job_id: str, owner: str, assignments: str, params: Tuple) -> None:
+        cursor = self._execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ? AND status = 'running'",
+            (*params, job_id, owner))
+        if cursor.rowcount == 0:
+            raise _JobLost(job_id)
+
+    def heartbeat(self, job_id: str, owner: str) -> None:
+        self._owned(job_id, owner, "lease_until = ?", (time.time() + LEASE_SECONDS,))
+
+    def set_total(self, job_id: str, owner: str, total: int) -> None:
+        self._owned(job_id, owner, "total = ?, lease_until = ?", (total, time.time() + LEASE_SECONDS))
+
+    def progress(self, job_id: str, owner: str, done: int, failed: int, input_offset: int,
+                 results_bytes: int, busy_seconds: float) -> None:
+        """Commit a finished chunk and renew the lease"""
+        self._owned(job_id, owner,
+                    "done = ?, failed = ?, input_offset = ?, results_bytes = ?, busy_seconds = ?, lease_until = ?",
+                    (done, failed, input_offset, results_bytes, busy_seconds, time.time() + LEASE_SECONDS))
+
+    def finish(self, job_id: str, owner: str, status: str, error: Optional[str] = None) -> None:
+        self._owned(job_id, owner, "status = ?, error = ?, finished = ?, owner = NULL, lease_until = NULL",
+                    (status, error, time.time()))
+
+    def release(self, job_id: str, owner: str) -> None:
+        """Hand a running job back to the queue (worker shutdown); it resumes from its last chunk"""
+        self._owned(job_id, owner, "status = 'queued', owner = NULL, lease_until = NULL", ())
+
+
+def _read_records(path: str, format: str) -> Iterator[bytes]:
+    """One encoded JSON application per record of a CSV, NDJSON or JSON array file"""
+    if format == 'ndjson':
+        with open(path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    elif format == 'json':
+        scanner = ArrayItemScanner(max_item_chars=MAX_RECORD_CHARS)
+        with open(path, 'rb') as raw:
+            text = io.TextIOWrapper(raw, encoding='utf-8-sig')
+            while not scanner.closed:
+                piece = text.read(READ_SIZE)
+                if not piece:
+                    raise ValueError("JSON input ended before its closing ']'")
+                for item in scanner.feed(piece):
+                    yield json_codec.dumps(item)
+            if scanner.rest.strip() or text.read(READ_SIZE).strip():
+                raise ValueError("unexpected content after the JSON array")
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            missing = {'application_date', 'contracts'} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"CSV input is missing the {', '.join(sorted(missing))} column(s)")
+            for row in reader:
+                yield json_codec.dumps({"id": row.get('id') or None,
+                                        "application_date": row['application_date'],
+                                        "contracts": row['contracts'] or ''})
+
+
+def score_lines(score: Callable[[Any], Dict[str, Any]], lines: List[bytes], first_line: int) -> Tuple[bytes, int]:
+    """Result lines for a chunk of encoded records, and how many failed
+
+    Module-level so it can run on a process pool; `score` must be picklable there.
+    """
+    out = []
+    failed = 0
+    for number, line in enumerate(lines, first_line):
+        record = None
+        try:
+            record = json_codec.loads(line)
+            result = score(record)
+        except Exception as e:
+            failed += 1
+            result = {
+                "line": number,
+                "id": record.get('id') if isinstance(record, dict) else None,
+                "error": f"Error calculating features: {str(e)}"
+            }
+        out.append(json_codec.dumps(result))
+    return b"\n".join(out) + b"\n", failed
+
+
+class JobUpload:
+    """A job's input being written to disk; `JobManager.submit` queues it"""
+
+    def __init__(self, directory: str, format: str):
+        self.id = uuid.uuid4().hex
+        self.format = format
+        self.directory = os.path.join(directory, self.id)
+        os.makedirs(self.directory)
+        self.path = os.path.join(self.directory, f"input.{format}")
+        self.size = 0
+        self._file = open(self.path, 'wb')
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def abort(self) -> None:
+        self._file.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class JobManager:
+    """Accepts scoring jobs and runs them on a pool of local workers
+
+    `score(record)` turns one decoded application into its result dict (the
+    `/calculate-features/batch` record handler). With executor='process' it
+    must be a module-level function.
+    """
+
+    def __init__(self, directory: str, score: Callable[[Any], Dict[str, Any]], workers: int = 1,
+                 executor: str = 'process', chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown job executor {executor!r}; expected one of {EXECUTORS}")
+        if workers < 1 or chunk_size < 1:
+            raise ValueError("workers and chunk_size must be at least 1")
+        self.directory = directory
+        self.score = score
+        self.workers = workers
+        self.executor = executor
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        self.store = JobStore(os.path.join(directory, 'jobs.sqlite'))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @classmethod
+    def from_env(cls, directory: str, score: Callable[[Any], Dict[str, Any]]) -> "JobManager":
+        """Configure from SCORING_JOB_WORKERS, SCORING_JOB_EXECUTOR and SCORING_JOB_CHUNK_SIZE"""
+        env = os.environ.get
+        return cls(directory, score,
+                   workers=int(env('SCORING_JOB_WORKERS', '1')),
+                   executor=env('SCORING_JOB_EXECUTOR', 'process'),
+                   chunk_size=int(env('SCORING_JOB_CHUNK_SIZE', str(DEFAULT_CHUNK_SIZE))))
+
+    # --- submission and queries ----------------------------------------------
+
+    def upload(self, format: str) -> JobUpload:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown job input format {format!r}; expected one of {FORMATS}")
+        return JobUpload(self.directory, format)
+
+    def submit(self, upload: JobUpload) -> Dict[str, Any]:
+        """Queue a completely written upload; returns the job's summary"""
+        upload.close()
+        self.store.add(upload.id, upload.format, upload.size)
+        self._wake.set()
+        return self.status(upload.id)
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        return job_summary(self.store.get(job_id))
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        return [job_summary(job) for job in self.store.list(status, limit)]
+
+    def results_path(self, job_id: str) -> str:
+        """Path of a succeeded job's results.ndjson"""
+        job = self.store.get(job_id)
+        if job['status'] != 'succeeded':
+            raise JobNotReadyError(f"Job {job_id} is {job['status']}; results are available once it succeeded")
+        return self._path(job_id, 'results.ndjson')
+
+    def delete(self, job_id: str) -> None:
+        """Remove a job and its files; a running job stops after its current chunk"""
+        if not self.store.delete(job_id):
+            raise JobNotFoundError(job_id)
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "executor": self.executor, "chunk_size": self.chunk_size,
+                **{status: self.store.count(status) for status in STATUSES}}
+
+    # --- workers -----------------------------------------------------------------
+
+    def start(self) -> None:
+        if self.executor == 'process':
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Unique per manager, so two managers in one process never pass for each other
+        prefix = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{prefix}-{n}",),
+                                      name=f"scoring-job-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, timeout: Optional[float] = 30.0) -> None:
+        """Stop the workers; running jobs are handed back to the queue after their current chunk"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self.store.close()
+
+    def _work(self, owner: str) -> None:
+        while not self._stop.is_set():
+            job = self.store.claim(owner)
+            if job is None:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+            try:
+                self._run(job, owner)
+            except _JobLost:
+                pass
+            except Exception as e:
+                try:
+                    self.store.finish(job['id'], owner, 'failed', f"{type(e).__name__}: {e}")
+                except _JobLost:
+                    pass
+
+    def _path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.directory, job_id, name)
+
+    def _prepare(self, job: Dict[str, Any], owner: str) -> int:
+        """Normalize the input into records.ndjson; returns the record count"""
+        path = self._path(job['id'], 'records.ndjson')
+        tmp = f"{path}.tmp"
+        total = 0
+        with open(tmp, 'wb') as out:
+            for record in _read_records(self._path(job['id'], f"input.{job['format']}"), job['format']):
+                out.write(record + b"\n")
+                total += 1
+                if total % PREPARE_HEARTBEAT == 0:
+                    self.store.heartbeat(job['id'], owner)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+        self.store.set_total(job['id'], owner, total)
+        return total
+
+    def _score_chunk(self, lines: List[bytes], first_line: int) -> Tuple[bytes, int]:
+        if self._pool is not None:
+            return self._pool.submit(score_lines, self.score, lines, first_line).result()
+        return score_lines(self.score, lines, first_line)
+
+    def _run(self, job: Dict[str, Any], owner: str) -> None:
+        job_id = job['id']
+        if job['total'] is None:
+            self._prepare(job, owner)
+        done, failed, busy = job['done'], job['failed'], job['busy_seconds']
+        results_path = self._path(job_id, 'results.ndjson')
+        with open(self._path(job_id, 'records.ndjson'), 'rb') as records, \
+                open(results_path, 'r+b' if os.path.exists(results_path) else 'w+b') as results:
+            # Resume after the last committed chunk; anything written after it is redone
+            records.seek(job['input_offset'])
+            results.truncate(job['results_bytes'])
+            results.seek(job['results_bytes'])
+            while True:
+                if self._stop.is_set():
+                    self.store.release(job_id, owner)
+                    return
+                lines = []
+                while len(lines) < self.chunk_size:
+                    line = records.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                if not lines:
+                    break
+                started = time.perf_counter()
+                with metrics.stage('job_chunk'):
+                    out, chunk_failed = self._score_chunk(lines, done + 1)
+                    # A chunk that outlasted the lease may have lost the job to another
+                    # worker, which owns the results file now: raises _JobLost before writing
+                    self.store.heartbeat(job_id, owner)
+                    results.write(out)
+                    results.flush()
+                    os.fsync(results.fileno())
+                busy += time.perf_counter() - started
+                done += len(lines)
+                failed += chunk_failed
+                _jobs_processed.inc('ok', amount=len(lines) - chunk_failed)
+                _jobs_processed.inc('error', amount=chunk_failed)
+                self.store.progress(job_id, owner, done, failed, records.tell(), results.tell(), busy)
+        self.store.finish(job_id, owner, 'succeeded')
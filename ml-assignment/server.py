@@ -0,0 +1,185 @@
+"""
+Pre-fork multi-worker server for the API.
+
+The parent process imports the app once (models, compiled feature kernels),
+binds the listening socket and forks `workers` children that all accept on it,
+so a container uses every core it is given. Each worker runs uvicorn on the
+fastest event loop and HTTP parser installed (uvloop / httptools, both in
+`uvicorn[standard]`). SIGTERM or SIGINT stops accepting connections and drains
+in-flight requests for up to `graceful_timeout` seconds; workers that die
+unexpectedly are replaced, after an exponential backoff when they die soon
+after starting. A worker that keeps failing to start (a bad deploy, a port
+or a model that can't be loaded) makes the supervisor stop the others and
+exit non-zero, so the orchestrator sees the failure instead of a restart loop.
+Where fork isn't available, or with one worker, the app is served in-process.
+
+Usage:
+    python main.py --workers 4
+    API_WORKERS=0 python main.py      # one worker per available CPU
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:  # imported lazily at run time, to keep startup light
+    import uvicorn
+
+# A worker exiting within MIN_UPTIME seconds of its start counts as a failed start;
+# it is respawned after RESTART_BACKOFF seconds, doubled per consecutive failure up to
+# MAX_BACKOFF, and after MAX_FAILED_STARTS in a row the supervisor gives up
+MIN_UPTIME = 10.0
+RESTART_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+MAX_FAILED_STARTS = 5
+
+# Identity of the current process, reported by /health
+worker_state: Dict[str, Any] = {"worker": 0, "pid": os.getpid(), "started": time.time()}
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container cpusets)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def fastest_loop() -> str:
+    return 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+
+
+def fastest_http() -> str:
+    return 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+
+def worker_health() -> Dict[str, Any]:
+    """This worker's index, pid and uptime"""
+    return {
+        "worker": worker_state["worker"],
+        "pid": worker_state["pid"],
+        "uptime_seconds": round(time.time() - worker_state["started"], 3),
+    }
+
+
+def _config(app: Any, host: str, port: int, graceful_timeout: int) -> "uvicorn.Config":
+    import uvicorn
+    return uvicorn.Config(app, host=host, port=port, loop=fastest_loop(), http=fastest_http(),
+                          timeout_graceful_shutdown=graceful_timeout)
+
+
+def _run_worker(config: "uvicorn.Config", sock: Any, index: int) -> None:
+    import uvicorn
+    worker_state.update(worker=index, pid=os.getpid(), started=time.time())
+    # Restore default handlers; uvicorn installs its own graceful ones in serve()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 1
+    try:
+        server = uvicorn.Server(config)
+        server.run(sockets=[sock])
+        # uvicorn returns without raising when the app fails to start up
+        code = 0 if server.started else 1
+    finally:
+        os._exit(code)
+
+
+def serve(app: Any, host: str = "0.0.0.0", port: int = 8002, workers: Optional[int] = 1,
+          graceful_timeout: int = 30) -> None:
+    """Serve app with `workers` pre-forked processes (0 or None: one per CPU)"""
+    import uvicorn
+    workers = workers or available_cpus()
+    config = _config(app, host, port, graceful_timeout)
+    if workers == 1 or not hasattr(os, 'fork'):
+        uvicorn.Server(config).run()
+        return
+
+    sock = config.bind_socket()
+    children: Dict[int, int] = {}
+    started: Dict[int, float] = {}
+    failed_starts: Dict[int, int] = {}
+    respawn_at: Dict[int, float] = {}
+    stopping = False
+    gave_up = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock, index)
+        children[pid] = index
+        started[index] = time.monotonic()
+
+    def signal_children(signum: int) -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        signal_children(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving on http://{host}:{port} with {workers} workers "
+          f"(loop={config.loop}, http={config.http}), supervisor pid {os.getpid()}")
+    for index in range(workers):
+        spawn(index)
+
+    deadline = None
+    while children or (respawn_at and not stopping):
+        if stopping and deadline is None:
+            deadline = time.monotonic() + graceful_timeout + 5
+        now = time.monotonic()
+        if not stopping:
+            for index in [i for i, at in respawn_at.items() if at <= now]:
+                del respawn_at[index]
+                spawn(index)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid == 0:
+            if deadline is not None and now > deadline:
+                signal_children(signal.SIGKILL)
+                deadline = float('inf')
+            time.sleep(0.2 if children else 0.05)
+            continue
+        index = children.pop(pid)
+        if stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if now - started[index] >= MIN_UPTIME:
+            failed_starts[index] = 0
+        else:
+            failed_starts[index] = failed_starts.get(index, 0) + 1
+        failures = failed_starts[index]
+        if failures >= MAX_FAILED_STARTS:
+            print(f"Worker {index} (pid {pid}) exited with status {code}, {failures} times in a row "
+                  f"within {MIN_UPTIME:g}s of starting; stopping")
+            gave_up = True
+            stop(signal.SIGTERM, None)
+            continue
+        delay = min(RESTART_BACKOFF * 2 ** (failures - 1), MAX_BACKOFF) if failures else 0.0
+        print(f"Worker {index} (pid {pid}) exited with status {code}; restarting in {delay:g}s")
+        respawn_at[index] = now + delay
+    sock.close()
+    if gave_up:
+        sys.exit(1)
+
+
+def main(app: Any, argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the ML Feature Engineering API")
+    parser.add_argument('--host', default=os.environ.get('API_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', '8002')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('API_WORKERS', '1')),
+                        help="worker processes; 0 means one per available CPU")
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=int(os.environ.get('API_GRACEFUL_TIMEOUT', '30')),
+                        help="seconds to drain in-flight requests on shutdown")
+    args = parser.parse_args(argv)
+    serve(app, args.host, args.port, args.workers, args.graceful_timeout)
@@ -0,0 +1,168 @@
+"""
+Cold-start tracking, readiness and warm-up for the API.
+
+`startup_state` records how long the app took to import, how long the optional
+warm-up took, when the app became ready and when the first successful real
+response went out after that. The warm-up sends
+synthetic applications through the app's full ASGI request path (routing,
+validation, feature kernels, executor pools, JSON encoding) before `/health`
+reports ready, so the first real requests don't pay for any of it.
+Warm-up requests bypass the result cache and are not counted as the first
+response, nor is anything answered before ready (such as a `/health` 503 probe).
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_codec
+
+# client address carried by warm-up requests, so they can be told apart
+WARMUP_CLIENT = ('warmup', 0)
+
+# Contract counts of the synthetic applications, small to large
+WARMUP_SIZES = (0, 1, 10, 100, 1000)
+
+WARMUP_ENDPOINTS = (
+    '/calculate-features',
+    '/calculate-features-from-json',
+    '/calculate-features-from-json/raw',
+)
+
+startup_state: Dict[str, Any] = {
+    "ready": False,
+    "import_seconds": None,
+    "warmup_seconds": None,
+    "warmup_requests": 0,
+    "ready_seconds": None,
+    "time_to_first_response_seconds": None,
+}
+_launched = time.perf_counter()
+
+
+def mark_imported() -> None:
+    """Record the time from process launch (first import of this module) to app import"""
+    startup_state["import_seconds"] = round(time.perf_counter() - _launched, 4)
+
+
+def mark_ready() -> None:
+    """Mark the app ready and record the time from process launch to ready"""
+    startup_state["ready_seconds"] = round(time.perf_counter() - _launched, 4)
+    startup_state["ready"] = True
+
+
+def synthetic_application(n_contracts: int, seed: int = 0) -> Dict[str, Any]:
+    """A structured application with n_contracts varied contracts"""
+    banks = ('003', '007', 'LIZ', 'MKO', '')
+    contracts = []
+    for i in range(n_contracts):
+        k = seed + i
+        contracts.append({
+            "contract_id": str(100000 + k),
+            "bank": banks[k % len(banks)],
+            "summa": str(1000 * (k % 7)) if k % 3 else "",
+            "loan_summa": str(500 * (k % 11)),
+            "claim_date": f"{1 + k % 28:02d}.{1 + k % 12:02d}.{2019 + k % 5}",
+            "claim_id": str(k) if k % 4 else "",
+            "contract_date": f"{2018 + k % 6}-{1 + k % 12:02d}-{1 + k % 28:02d}" if k % 5 else "",
+        })
+    return {"id": f"warmup-{seed}", "application_date": "2024-02-12 19:24:29.135000+00:00",
+            "contracts": contracts}
+
+
+def warmup_requests(rounds: int) -> List[Tuple[str, bytes]]:
+    """(path, JSON body) pairs covering every scoring endpoint and contract count"""
+    requests = []
+    for round_ in range(rounds):
+        for size in WARMUP_SIZES:
+            application = synthetic_application(size, seed=round_)
+            csv_style = dict(application, contracts=json_codec.dumps(application["contracts"]).decode())
+            for path in WARMUP_ENDPOINTS:
+                body = application if path == '/calculate-features' else csv_style
+                requests.append((path, json_codec.dumps(body)))
+    return requests
+
+
+async def asgi_post(app: Any, path: str, body: bytes, use_cache: bool = False,
+                    client: Tuple[str, int] = WARMUP_CLIENT) -> int:
+    """POST body to path through the ASGI app in-process; returns the status code"""
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if not use_cache:
+        headers.append((b"cache-control", b"no-cache"))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": client, "server": ("in-process", 0),
+        "headers": headers,
+    }
+    sent = False
+    status = 0
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal sent
+        if sent:
+            await asyncio.Event().wait()  # no disconnect until the response is done
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def warm_up(app: Any, rounds: int) -> None:
+    """Run the warm-up requests, then mark the app ready"""
+    started = time.perf_counter()
+    try:
+        for path, body in warmup_requests(rounds):
+            status = await asgi_post(app, path, body)
+            if status != 200:
+                print(f"Warm-up request to {path} returned {status}")
+            startup_state["warmup_requests"] += 1
+    finally:
+        startup_state["warmup_seconds"] = round(time.perf_counter() - started, 4)
+        mark_ready()
+        print(f"Ready after {startup_state['warmup_requests']} warm-up requests "
+              f"in {startup_state['warmup_seconds']}s (import {startup_state['import_seconds']}s)")
+
+
+def start_warm_up(app: Any, rounds: Optional[int] = None) -> Optional[asyncio.Task]:
+    """Begin warm-up in the background (API_WARMUP rounds, 0 = off); ready at once when off"""
+    rounds = int(os.environ.get('API_WARMUP', '0')) if rounds is None else rounds
+    if rounds <= 0:
+        mark_ready()
+        return None
+    return asyncio.ensure_future(warm_up(app, rounds))
+
+
+class FirstResponseMiddleware:
+    """Record the time from process launch to the first successful response to a real client
+
+    Only responses started once the app is ready count, so `/health` probes
+    answered 503 during warm-up don't stand in for the first real response.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if (startup_state["time_to_first_response_seconds"] is not None or not startup_state["ready"]
+                or scope["type"] != "http" or scope.get("client") == WARMUP_CLIENT):
+            await self.app(scope, receive, send)
+            return
+        status = 0
+
+        async def send_and_record(message: Dict[str, Any]) -> None:
+            nonlocal status
+            await send(message)
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                if status < 400 and startup_state["time_to_first_response_seconds"] is None:
+                    startup_state["time_to_first_response_seconds"] = round(time.perf_counter() - _launched, 4)
+
+        await self.app(scope, receive, send_and_record)
@@ -0,0 +1,502 @@
+"""
+Incremental parsing of application bodies with very large contracts arrays.
+
+`ApplicationStreamParser` is fed the request body in arbitrary pieces while it
+is still arriving. It reads the top-level object, decodes the contracts array
+one contract at a time and folds the contracts into a `StreamingFeatures`
+accumulator in small slices. No contract outlives its slice, so memory per
+request does not grow with the number of contracts:
+
+    count_in_window  claims per day ordinal, only for days inside the widest
+                     window once the application date is known; before that at
+                     most MAX_UNDATED_DAYS distinct days are kept
+    sum              running total and whether any contract matched
+    days_since_max   latest matching day
+    has_claims       whether any contract is a claim
+
+Both request shapes are accepted. Contracts given as an array are validated
+strictly, as in `/calculate-features`. Contracts given as a JSON string are
+unescaped on the fly and treated like the CSV-style path: values of the wrong
+type count as empty, non-object entries are skipped and a malformed array
+means no contracts. In both shapes an unparseable date or amount is never
+counted or summed, but it still satisfies a `required` filter. The typed
+columns carry the raw presence of every date and amount (see ingestion.py), so
+the results match the dict kernel behind `/calculate-features-from-json`.
+
+Keys may come in any order, but a body whose contracts precede its
+application_date and span more than MAX_UNDATED_DAYS distinct claim days is
+rejected: without the date no day can be dropped from the histogram. Every
+invalid body raises StreamParseError.
+"""
+import codecs
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import json_codec
+from dates import parse_application_day
+from feature_registry import CLAIM_FIELD, FeatureRegistry, default_registry
+from ingestion import ContractColumns
+
+# Contracts validated and folded in at a time
+SLICE_SIZE = 256
+# Longest single contract or top-level scalar (characters) before the body is rejected
+MAX_VALUE_CHARS = 1 << 20
+# Distinct claim days held per windowed count while the application date is still unknown
+MAX_UNDATED_DAYS = 4096
+
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+_SPACE = re.compile(r'\s*')
+_ESCAPES = re.compile(r'(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))+')
+
+
+class StreamParseError(ValueError):
+    """Raised for a body that is not a valid scoring request"""
+
+
+class StreamingFeatures:
+    """Feature state folded contract slice by contract slice (typed contract schema)"""
+
+    def __init__(self, registry: Optional[FeatureRegistry] = None):
+        self.registry = registry or default_registry()
+        self.app_day: Optional[int] = None
+        self.longest = max((int(spec.window_days) for spec in self.registry.specs
+                            if spec.aggregation == 'count_in_window'), default=0)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every contract folded in so far"""
+        self.has_claims = False
+        self.contracts = 0
+        # count_in_window: Counter of day ordinals; sum: [total, found]; days_since_max: day or None
+        self.state: Dict[str, Any] = {}
+        for spec in self.registry.specs:
+            if spec.aggregation == 'count_in_window':
+                self.state[spec.name] = Counter()
+            elif spec.aggregation == 'sum':
+                self.state[spec.name] = [0, False]
+            else:
+                self.state[spec.name] = None
+
+    def set_application_day(self, app_day: int) -> None:
+        """Known application date: from now on only days inside the windows are kept"""
+        self.app_day = app_day
+        for spec in self.registry.specs:
+            if spec.aggregation == 'count_in_window':
+                days = self.state[spec.name]
+                for day in [day for day in days if not 0 <= app_day - day <= self.longest]:
+                    del days[day]
+
+    def add(self, columns: ContractColumns) -> None:
+        """Fold one slice of validated contracts in"""
+        if not self.has_claims and any(value != '' for value in columns[CLAIM_FIELD]):
+            self.has_claims = True
+        app_day = self.app_day
+        for spec in self.registry.specs:
+            values = columns[spec.field]
+            matched = [values[k] for k in range(columns.size)
+                       if values[k] is not None and spec.matches(columns, k)]
+            if not matched:
+                continue
+            if spec.aggregation == 'count_in_window':
+                days = self.state[spec.name]
+                if app_day is not None:
+                    matched = [day for day in matched if 0 <= app_day - day <= self.longest]
+                days.update(matched)
+                if app_day is None and len(days) > MAX_UNDATED_DAYS:
+                    raise StreamParseError(f"contracts span more than {MAX_UNDATED_DAYS} claim days before "
+                                           "application_date; send application_date before contracts")
+            elif spec.aggregation == 'sum':
+                state = self.state[spec.name]
+                # Added one by one, in body order, so rounding matches the kernels
+                for value in matched:
+                    state[0] += value
+                state[1] = True
+            else:
+                latest = max(matched)
+                current = self.state[spec.name]
+                self.state[spec.name] = latest if current is None else max(current, latest)
+        self.contracts += columns.size
+
+    def features(self, app_day: int, sentinels: Optional[List[str]] = None) -> Dict[str, Any]:
+        features = {}
+        for spec in self.registry.specs:
+            if spec.if_no_claims is not None and not self.has_claims:
+                missing = spec.if_no_claims
+            else:
+                missing = spec.if_missing
+            state = self.state[spec.name]
+            if spec.aggregation == 'count_in_window':
+                window = int(spec.window_days)
+                value = sum(n for day, n in state.items() if 0 <= app_day - day <= window)
+                found = value > 0
+            elif spec.aggregation == 'sum':
+                value, found = state
+            else:
+                found = state is not None
+                value = app_day - state if found else None
+            features[spec.name] = value if found else missing
+            if sentinels is not None and not found:
+                sentinels.append(spec.name)
+        return features
+
+
+class _ValueScanner:
+    """Finds where one JSON value ends in a growing buffer, resuming where it stopped"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.pos: Optional[int] = None
+        self.depth = 0
+        self.in_string = False
+        self.scalar = False
+
+    def shift(self, offset: int) -> None:
+        """The buffer lost its first `offset` characters"""
+        if self.pos is not None:
+            self.pos -= offset
+
+    def scan(self, buf: str, start: int) -> Optional[int]:
+        """End (exclusive) of the value starting at buf[start], or None if the buffer ends first"""
+        if self.pos is None:
+            self.pos = start
+            self.scalar = buf[start] not in '[{"'
+        i = self.pos
+        if self.scalar:
+            match = _SCALAR_END.search(buf, i)
+            if match is None:
+                self.pos = len(buf)
+                return None
+            return self._done(match.start())
+        while True:
+            if self.in_string:
+                match = _STRING_SPECIAL.search(buf, i)
+                if match is None:
+                    self.pos = len(buf)
+                    return None
+                j = match.start()
+                if buf[j] == '\\':
+                    if j + 1 == len(buf):
+                        self.pos = j  # escape split across pieces: look at it again
+                        return None
+                    i = j + 2
+                    continue
+                self.in_string = False
+                i = j + 1
+                if self.depth == 0:
+                    return self._done(i)
+                continue
+            match = _STRUCTURE.search(buf, i)
+            if match is None:
+                self.pos = len(buf)
+                return None
+            j = match.start()
+            char = buf[j]
+            if char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return self._done(j + 1)
+            i = j + 1
+
+    def _done(self, end: int) -> int:
+        self.reset()
+        return end
+
+
+class ArrayItemScanner:
+    """Splits a JSON array, fed as text in arbitrary pieces, into decoded items
+
+    Only the item being read is buffered. After the closing bracket, `closed`
+    is set and any text that followed it is kept in `rest`.
+    """
+
+    def __init__(self, max_item_chars: int = MAX_VALUE_CHARS):
+        self.max_item_chars = max_item_chars
+        self._buf = ''
+        self._state = 'open'
+        self._value = _ValueScanner()
+        self.closed = False
+        self.rest = ''
+
+    def feed(self, text: str) -> List[Any]:
+        if self.closed:
+            self.rest += text
+            return []
+        buf = self._buf + text
+        items = []
+        i = 0
+        while True:
+            i = _SPACE.match(buf, i).end()
+            if i == len(buf):
+                break
+            if self._state == 'open':
+                if buf[i] != '[':
+                    raise ValueError(f"expected a JSON array, got {buf[i]!r}")
+                i += 1
+                self._state = 'first'
+            elif self._state in ('first', 'item'):
+                if buf[i] == ']' and self._state == 'first':
+                    i += 1
+                    self._close(buf[i:])
+                    return items
+                end = self._value.scan(buf, i)
+                if end is None:
+                    if len(buf) - i > self.max_item_chars:
+                        raise ValueError(f"array item longer than {self.max_item_chars} characters")
+                    break
+                items.append(json_codec.loads(buf[i:end]))
+                i = end
+                self._state = 'separator'
+            else:
+                char = buf[i]
+                i += 1
+                if char == ']':
+                    self._close(buf[i:])
+                    return items
+                if char != ',':
+                    raise ValueError(f"expected ',' or ']' in array, got {char!r}")
+                self._state = 'item'
+        self._value.shift(i)
+        self._buf = buf[i:]
+        return items
+
+    def _close(self, rest: str) -> None:
+        self.closed = True
+        self.rest = rest
+        self._buf = ''
+
+    @property
+    def started(self) -> bool:
+        return self._state != 'open'
+
+
+class _StringUnescaper:
+    """Decodes the body of a JSON string fed in pieces; `closed` once its closing quote is read"""
+
+    def __init__(self):
+        self._pending = ''
+        self.closed = False
+        self.rest = ''
+
+    def feed(self, text: str) -> str:
+        buf = self._pending + text
+        out = []
+        i = 0
+        while i < len(buf):
+            match = _STRING_SPECIAL.search(buf, i)
+            if match is None:
+                out.append(buf[i:])
+                i = len(buf)
+                break
+            j = match.start()
+            out.append(buf[i:j])
+            if buf[j] == '"':
+                self.closed = True
+                self.rest = buf[j + 1:]
+                self._pending = ''
+                return ''.join(out)
+            escapes = _ESCAPES.match(buf, j)
+            if escapes is None or escapes.end() == len(buf):
+                # Incomplete escape, or a run that may continue (surrogate pairs)
+                if len(buf) - j > 12 and escapes is None:
+                    raise ValueError(f"invalid escape in JSON string: {buf[j:j + 6]!r}")
+                i = j
+                break
+            out.append(json.loads(f'"{escapes.group()}"'))
+            i = escapes.end()
+        self._pending = buf[i:]
+        return ''.join(out)
+
+
+class ApplicationStreamParser:
+    """Parses `{"id": ..., "application_date": ..., "contracts": ...}` while the body arrives
+
+    Keys may come in any order. Call `feed` with each body chunk (bytes) and
+    `finish` at the end to get (fields, features, csv_style), where fields
+    holds the id and application_date.
+    """
+
+    def __init__(self, registry: Optional[FeatureRegistry] = None, slice_size: int = SLICE_SIZE):
+        self.accumulator = StreamingFeatures(registry)
+        self.slice_size = slice_size
+        self.fields: Dict[str, Any] = {}
+        self.csv_style = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._state = 'open'
+        self._key: Optional[str] = None
+        self._value = _ValueScanner()
+        self._contracts: Optional[ArrayItemScanner] = None
+        self._unescaper: Optional[_StringUnescaper] = None
+        self._contracts_invalid = False
+        self._slice: List[Any] = []
+        self._seen = 0
+
+    # --- contracts ---------------------------------------------------------
+
+    def _add_items(self, items: List[Any]) -> None:
+        if self.csv_style:
+            items = [item for item in items if isinstance(item, dict)]
+        self._slice.extend(items)
+        if len(self._slice) >= self.slice_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._slice:
+            columns = ContractColumns.from_contracts(self._slice, start=self._seen, strict=not self.csv_style)
+            self._seen += len(self._slice)
+            self._slice = []
+            self.accumulator.add(columns)
+
+    def _feed_contracts(self, text: str) -> str:
+        """Route text to the contracts value; returns what follows it once it is complete"""
+        if self._unescaper is not None:
+            decoded = self._unescaper.feed(text)
+            if not self._contracts_invalid:
+                try:
+                    self._add_items(self._contracts.feed(decoded))
+                    if self._unescaper.closed:
+                        self._end_embedded_contracts()
+                except StreamParseError:
+                    raise
+                except ValueError:
+                    # A malformed contracts string means no contracts, as in the CSV-style path
+                    self._contracts_invalid = True
+                    self._slice = []
+                    self.accumulator.reset()
+            if not self._unescaper.closed:
+                return ''
+            rest = self._unescaper.rest
+        else:
+            self._add_items(self._contracts.feed(text))
+            if not self._contracts.closed:
+                return ''
+            rest = self._contracts.rest
+        self._flush()
+        self._contracts = self._unescaper = None
+        self._state = 'separator'
+        return rest
+
+    def _end_embedded_contracts(self) -> None:
+        scanner = self._contracts
+        if scanner.started and (not scanner.closed or scanner.rest.strip()):
+            raise ValueError("contracts string is not a complete JSON array")
+
+    # --- top-level object --------------------------------------------------
+
+    def feed(self, chunk: bytes) -> None:
+        try:
+            self._parse(self._decoder.decode(chunk))
+        except StreamParseError:
+            raise
+        except ValueError as e:  # undecodable bytes, bad JSON, invalid contracts or dates
+            raise StreamParseError(str(e)) from e
+
+    def _parse(self, text: str) -> None:
+        if self._contracts is not None:
+            text = self._feed_contracts(text)
+            if self._contracts is not None:
+                return
+        buf = self._buf + text
+        i = 0
+        while True:
+            i = _SPACE.match(buf, i).end()
+            if i == len(buf):
+                break
+            state = self._state
+            char = buf[i]
+            if state == 'open':
+                if char != '{':
+                    raise ValueError("request body must be a JSON object")
+                i += 1
+                self._state = 'first_key'
+            elif state in ('first_key', 'key'):
+                if char == '}' and state == 'first_key':
+                    i += 1
+                    self._state = 'done'
+                    continue
+                if char != '"':
+                    raise ValueError(f"expected an object key, got {char!r}")
+                end = self._value.scan(buf, i)
+                if end is None:
+                    break
+                self._key = json.loads(buf[i:end])
+                i = end
+                self._state = 'colon'
+            elif state == 'colon':
+                if char != ':':
+                    raise ValueError(f"expected ':' after key {self._key!r}")
+                i += 1
+                self._state = 'value'
+            elif state == 'value':
+                if self._key == 'contracts' and char in '["':
+                    self._start_contracts(char == '"')
+                    rest = self._feed_contracts(buf[i + (char == '"'):])
+                    if self._contracts is not None:
+                        self._buf = ''
+                        return
+                    buf, i = rest, 0
+                    continue
+                end = self._value.scan(buf, i)
+                if end is None:
+                    if len(buf) - i > MAX_VALUE_CHARS:
+                        raise ValueError(f"value of {self._key!r} longer than {MAX_VALUE_CHARS} characters")
+                    break
+                self._set_field(self._key, json_codec.loads(buf[i:end]))
+                i = end
+                self._state = 'separator'
+            elif state == 'separator':
+                i += 1
+                if char == '}':
+                    self._state = 'done'
+                elif char == ',':
+                    self._state = 'key'
+                else:
+                    raise ValueError(f"expected ',' or '}}' after {self._key!r}, got {char!r}")
+            else:
+                raise ValueError("unexpected data after the request object")
+        self._value.shift(i)
+        self._buf = buf[i:]
+
+    def _start_contracts(self, embedded: bool) -> None:
+        if 'contracts' in self.fields or self._seen or self._slice:
+            raise ValueError("duplicate contracts key")
+        self.fields['contracts'] = None
+        self.csv_style = embedded
+        self._contracts = ArrayItemScanner()
+        self._unescaper = _StringUnescaper() if embedded else None
+
+    def _set_field(self, key: str, value: Any) -> None:
+        if key == 'contracts':
+            # Empty / null contracts; anything else in the structured shape is invalid
+            if value not in (None, ''):
+                raise ValueError("contracts must be a list of objects or a JSON string")
+            self.csv_style = value == ''
+        elif key == 'application_date' and isinstance(value, str) and value:
+            self.accumulator.set_application_day(parse_application_day(value))
+        self.fields[key] = value
+
+    def finish(self, sentinels: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Complete the parse; returns the features of the application (see StreamingFeatures.features)"""
+        try:
+            self._parse(self._decoder.decode(b'', final=True))
+            if self._state != 'done':
+                raise ValueError("request body ended before the JSON object was complete")
+            application_date = self.fields.get('application_date')
+            if not application_date:
+                raise ValueError("application_date is required")
+            app_day = parse_application_day(application_date)
+        except StreamParseError:
+            raise
+        except ValueError as e:
+            raise StreamParseError(str(e)) from e
+        return self.accumulator.features(app_day, sentinels)
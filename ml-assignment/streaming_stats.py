@@ -0,0 +1,164 @@
+"""
+Bounded-memory statistics for the analyze_data report.
+
+Every accumulator here is updated chunk by chunk and keeps a fixed amount of
+state no matter how many values it sees:
+
+- `RunningStats`: count, mean (Welford), min, max and a count of negative
+  sentinel values (-1 / -3)
+- `QuantileSketch`: approximate quantiles with bounded rank error from a
+  hierarchy of sorted, halved buffers (KLL-style compactors)
+- `BoundedCounter`: Space-Saving heavy-hitter counts; exact while the number
+  of distinct keys stays within its capacity
+"""
+import math
+import random
+import re
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+# Distinct keys a BoundedCounter tracks before it starts evicting
+DEFAULT_COUNTER_CAPACITY = 1024
+# Values per QuantileSketch level; rank error shrinks as this grows
+DEFAULT_SKETCH_CAPACITY = 1024
+
+_DIGITS = re.compile(r'\d')
+
+
+def date_shape(value: str) -> str:
+    """Layout of a date string with every digit replaced by 'D', e.g. 'DD.DD.DDDD'"""
+    return _DIGITS.sub('D', value)
+
+
+class RunningStats:
+    """Streaming count, mean, min, max and negative-value count"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.negative = 0
+
+    def update(self, values: Iterable[float]) -> None:
+        """Fold a chunk of values in; NaN values are skipped"""
+        for value in values:
+            if value != value:
+                continue
+            self.count += 1
+            self.mean += (value - self.mean) / self.count
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            if value < 0:
+                self.negative += 1
+
+
+class QuantileSketch:
+    """Streaming quantiles with bounded rank error (randomized compactor hierarchy)
+
+    Values enter a buffer of `capacity` entries; a full buffer is sorted and
+    every other entry (random offset) is promoted to the next level, where
+    each entry stands for twice as many values. Memory is about
+    capacity * log2(n / capacity) entries, and the rank error of a quantile is
+    roughly log2(n / capacity) / capacity of n. Unlike P-square estimates it
+    stays accurate when most values are tied, as with the -1/-3 sentinels.
+    While fewer than `capacity` values were seen the answers are exact.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_SKETCH_CAPACITY, seed: int = 0):
+        if capacity < 2 or capacity % 2:
+            raise ValueError("capacity must be an even number of at least 2")
+        self.capacity = capacity
+        self.count = 0
+        self._levels: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+
+    def update(self, values: Iterable[float]) -> None:
+        """Fold a chunk of values in; NaN values are skipped"""
+        base = self._levels[0]
+        for value in values:
+            if value != value:
+                continue
+            base.append(value)
+            self.count += 1
+            if len(base) >= self.capacity:
+                self._compact(0)
+                base = self._levels[0]
+
+    def _compact(self, level: int) -> None:
+        buffer = sorted(self._levels[level])
+        self._levels[level] = []
+        if level + 1 == len(self._levels):
+            self._levels.append([])
+        self._levels[level + 1].extend(buffer[self._random.randint(0, 1)::2])
+        if len(self._levels[level + 1]) >= self.capacity:
+            self._compact(level + 1)
+
+    def quantile(self, p: float) -> float:
+        """Estimated p-quantile; exact (linear interpolation) before the first compaction"""
+        if not 0 <= p <= 1:
+            raise ValueError(f"quantile must be in [0, 1], got {p}")
+        if self.count == 0:
+            return math.nan
+        if len(self._levels) == 1:
+            values = sorted(self._levels[0])
+            rank = p * (len(values) - 1)
+            low = int(rank)
+            high = min(low + 1, len(values) - 1)
+            return values[low] + (rank - low) * (values[high] - values[low])
+        weighted = sorted((value, 1 << level) for level, buffer in enumerate(self._levels) for value in buffer)
+        target = p * sum(weight for _, weight in weighted)
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+    @property
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+
+class BoundedCounter:
+    """Counts per key in at most `capacity` entries (Space-Saving)
+
+    While there are no more distinct keys than `capacity` the counts are exact.
+    Beyond that the least counted key is replaced by the new one, which
+    inherits its count; a tracked count then overestimates the true one by at
+    most total / capacity, and every key more frequent than that is tracked.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_COUNTER_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self.evictions = 0
+        self._counts: Dict[Hashable, int] = {}
+
+    @property
+    def exact(self) -> bool:
+        return self.evictions == 0
+
+    def update(self, keys: Iterable[Hashable], count: int = 1) -> None:
+        """Count each key `count` times"""
+        counts = self._counts
+        for key in keys:
+            self.total += count
+            if key in counts:
+                counts[key] += count
+            elif len(counts) < self.capacity:
+                counts[key] = count
+            else:
+                smallest = min(counts, key=counts.__getitem__)
+                counts[key] = counts.pop(smallest) + count
+                self.evictions += 1
+
+    def keys(self) -> List[Hashable]:
+        return list(self._counts)
+
+    def most_common(self, n: Optional[int] = None) -> List[Any]:
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked if n is None else ranked[:n]
@@ -1,10 +1,11 @@
 import requests
 import json
+import os
 import pandas as pd
 from typing import Dict, Any
 
-# API base URL
-BASE_URL = "http://localhost:5002"
+# API base URL (the API itself, not the documentation server on 5002)
+BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8002")
 
 def test_health_check():
     """Test the health check endpoint"""
@@ -98,6 +99,34 @@ def test_calculate_features_from_csv():
         print(f"Error: {response.text}")
     print()
 
+def test_calculate_features_batch():
+    """Test the NDJSON batch endpoint with rows from the CSV file"""
+    df = pd.read_csv('ml-assignment/data.csv').head(5)
+    
+    lines = []
+    for _, row in df.iterrows():
+        lines.append(json.dumps({
+            "id": str(row['id']),
+            "application_date": row['application_date'],
+            "contracts": row['contracts'] if pd.notna(row['contracts']) else ""
+        }))
+    # A malformed record should produce an error line, not fail the batch
+    lines.append("not json")
+    
+    response = requests.post(
+        f"{BASE_URL}/calculate-features/batch",
+        data="\n".join(lines),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    print("Batch Endpoint Test:")
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        for line in response.text.splitlines():
+            print(f"  {json.loads(line)}")
+    else:
+        print(f"Error: {response.text}")
+    print()
+
 def test_edge_cases():
     """Test edge cases"""
     print("Testing Edge Cases:")
@@ -143,6 +172,7 @@ def main():
         test_health_check()
         test_calculate_features_structured()
         test_calculate_features_from_csv()
+        test_calculate_features_batch()
         test_edge_cases()
         print("All tests completed!")
         
@@ -0,0 +1,84 @@
+"""
+Point-in-time backfill: only records dated on or before the as-of date are visible.
+
+Runs under pytest, or directly: python test_backfill.py
+"""
+import random
+from datetime import date
+
+from backfill import ContractHistory, backfill_features
+from feature_registry import default_registry, window_registry
+
+FIRST_DAY = date(2022, 1, 1).toordinal()
+LAST_DAY = date(2024, 6, 30).toordinal()
+
+
+def dated_history(rng: random.Random, n: int) -> list:
+    """Contracts whose claim and contract dates are one day, or missing; None marks undated"""
+    contracts = []
+    for _ in range(n):
+        day = rng.randint(FIRST_DAY, LAST_DAY) if rng.random() < 0.9 else None
+        text = '' if day is None else date.fromordinal(day).strftime('%d.%m.%Y')
+        contracts.append({
+            "claim_date": text,
+            "contract_date": text,
+            "claim_id": rng.choice(['', 'X']),
+            "bank": rng.choice(['003', 'LIZ', '', 'TBC']),
+            "summa": rng.choice(['', '100', '2.5']),
+            "loan_summa": rng.choice(['', '10', '0.25']),
+        })
+    return contracts
+
+
+def visible(contracts: list, as_of: int) -> list:
+    """What an application on as_of could have seen: dated records up to that day"""
+    return [c for c in contracts if c["contract_date"]
+            and date(*map(int, reversed(c["contract_date"].split('.')))).toordinal() <= as_of]
+
+
+def test_as_of_visibility_matches_kernel_over_visible_history():
+    rng = random.Random(4)
+    for registry in (default_registry(), window_registry()):
+        kernel = registry.compile()
+        for _ in range(200):
+            contracts = dated_history(rng, rng.randint(0, 12))
+            as_of_days = sorted(rng.randint(FIRST_DAY - 30, LAST_DAY + 30) for _ in range(8))
+            as_of_dates = [date.fromordinal(day).isoformat() for day in as_of_days]
+            features = ContractHistory(contracts, registry).features(as_of_dates)
+            for i, day in enumerate(as_of_days):
+                row = {name: values[i].item() for name, values in features.items()}
+                assert row == kernel(day, visible(contracts, day)), (contracts, as_of_dates[i])
+
+
+def test_future_records_do_not_leak():
+    contracts = [
+        {"claim_date": "01.01.2024", "claim_id": "1", "contract_date": "01.01.2024", "summa": "1",
+         "loan_summa": "10", "bank": "003"},
+        {"claim_date": "01.03.2024", "claim_id": "2", "contract_date": "01.03.2024", "summa": "1",
+         "loan_summa": "99", "bank": "003"},
+    ]
+    results = backfill_features(contracts, ['2023-12-31', '2024-02-01', '2024-03-01'])
+    assert results['tot_claim_cnt_l180d'].tolist() == [-3, 1, 2]
+    assert results['disb_bank_loan_wo_tbc'].tolist() == [-1, 10.0, 109.0]
+    assert results['day_sinlastloan'].tolist() == [-1, 31, 0]
+
+
+def test_equals_calculate_features_without_future_contracts():
+    kernel = default_registry().compile()
+    rng = random.Random(8)
+    for _ in range(100):
+        contracts = [c for c in dated_history(rng, 10) if c["contract_date"]]
+        app_day = LAST_DAY + 1
+        features = ContractHistory(contracts).features([date.fromordinal(app_day).isoformat()])
+        assert {name: values[0].item() for name, values in features.items()} == kernel(app_day, contracts)
+
+
+def main():
+    for test in (test_as_of_visibility_matches_kernel_over_visible_history, test_future_records_do_not_leak,
+                 test_equals_calculate_features_without_future_contracts):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
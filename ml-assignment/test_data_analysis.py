@@ -0,0 +1,100 @@
+"""
+Offline batch engine: bad rows stay local to their application.
+
+Runs under pytest, or directly: python test_data_analysis.py
+"""
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from batch_runner import run_batch
+from data_analysis import analyze_data, calculate_features, calculate_features_batch
+
+try:
+    import pytest
+except ImportError:  # run as a script
+    pytest = None
+
+CONTRACTS = json.dumps([{"claim_date": "01.02.2024", "claim_id": "1", "contract_date": "01.01.2024",
+                         "summa": "5", "loan_summa": "7", "bank": "003"}])
+GOOD_DATE = '2024-02-12T10:00:00'
+
+
+def read_features(path: str) -> pd.DataFrame:
+    return pd.read_csv(path, dtype={'id': str, 'application_date': str})
+
+
+def chunk_with(bad_date) -> pd.DataFrame:
+    return pd.DataFrame({
+        'id': ['1', '2', '3'],
+        'application_date': [GOOD_DATE, bad_date, '2024-02-13 08:00:00+04:00'],
+        'contracts': [CONTRACTS] * 3,
+    })
+
+
+def test_bad_application_date_fails_only_its_row():
+    for bad_date in ('not a date', None, ''):
+        results = calculate_features_batch(chunk_with(bad_date))
+        assert len(results) == 3
+        for i, application_date in ((0, GOOD_DATE), (2, '2024-02-13 08:00:00+04:00')):
+            expected = calculate_features(application_date, CONTRACTS)
+            assert {name: results[name].iloc[i] for name in expected} == expected, bad_date
+        assert results.iloc[1, 2:].isna().all(), bad_date
+
+
+def test_bad_application_date_in_a_run():
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'applications.csv')
+        chunk_with('not a date').to_csv(input_path, index=False)
+        for run in (lambda out: run_batch(input_path, out, workers=1, chunk_size=2),
+                    lambda out: analyze_data(input_path, out, chunk_size=2)):
+            output_path = os.path.join(tmp, 'features.csv')
+            run(output_path)
+            results = pd.read_csv(output_path)
+            assert len(results) == 3
+            assert results.iloc[1, 2:].isna().all()
+            assert results['day_sinlastloan'].iloc[0] == 42
+
+
+def test_columnar_dataset_input():
+    """analyze_data and the columnar CLI read datasets chunk by chunk, bad dates included"""
+    if pytest is not None:
+        pytest.importorskip('pyarrow')
+    import columnar_io
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'applications.csv')
+        pd.concat([chunk_with('not a date')] * 5, ignore_index=True).to_csv(input_path, index=False)
+        expected_path = os.path.join(tmp, 'expected.csv')
+        analyze_data(input_path, expected_path, chunk_size=4)
+        expected = read_features(expected_path)
+        for fmt in columnar_io.FORMATS:
+            dataset = os.path.join(tmp, f'dataset-{fmt}')
+            columnar_io.convert_csv(input_path, dataset, fmt, chunk_size=3)
+            output_path = os.path.join(tmp, f'features-{fmt}.csv')
+            analyze_data(dataset, output_path, chunk_size=4)
+            pd.testing.assert_frame_equal(read_features(output_path), expected)
+            output_path = os.path.join(tmp, f'features{columnar_io.FORMATS[fmt]}')
+            columnar_io.main(['features', '--input', dataset, '--output', output_path, '--chunk-size', '4'])
+            results = columnar_io.read_table(output_path, expected.columns.tolist()).to_pandas()
+            pd.testing.assert_frame_equal(results, expected, check_dtype=False)
+
+
+def main():
+    tests = [test_bad_application_date_fails_only_its_row, test_bad_application_date_in_a_run,
+             test_columnar_dataset_input]
+    # Tests needing optional packages are skipped when they are missing
+    skipped = (ImportError,) if pytest is None else (ImportError, pytest.skip.Exception)
+    for test in tests:
+        try:
+            test()
+        except skipped as e:
+            print(f"{test.__name__}: skipped ({e})")
+            continue
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Shared date parser: formats, and the failure counter under threads.
+
+Runs under pytest, or directly: python test_dates.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from dates import clear_date_cache, date_parse_stats, parse_application_day, parse_day
+
+
+def test_formats():
+    assert parse_day('01.02.2024') == parse_day('2024-02-01') == parse_day('1.2.2024') == 738917
+    for value in ('', None, 'abc', '31.02.2024', '2024/02/01', 20240201):
+        assert parse_day(value) is None
+    assert parse_application_day('2024-02-12 19:24:29.135000+00:00') == 738928
+
+
+def test_failures_counted_across_threads():
+    clear_date_cache()
+    threads, per_thread = 8, 5000
+
+    def parse_bad(_):
+        for _ in range(per_thread):
+            parse_day('not a date')
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(parse_bad, range(threads)))
+    assert date_parse_stats()["failures"] == threads * per_thread
+    clear_date_cache()
+
+
+def main():
+    for test in (test_formats, test_failures_counted_across_threads):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Feature executor: overload rejection, deadlines and slot accounting.
+
+Runs under pytest, or directly: python test_execution.py
+"""
+import asyncio
+import threading
+import time
+
+from execution import DeadlineExceededError, FeatureExecutor, OverloadedError
+
+try:
+    import pytest
+except ImportError:  # run as a script
+    pytest = None
+
+
+def blocking(release: threading.Event, value=None):
+    release.wait(5)
+    return value
+
+
+def test_inline_runs_on_the_caller():
+    executor = FeatureExecutor(mode='inline')
+    assert asyncio.run(executor.run(threading.get_ident)) == threading.get_ident()
+    assert executor.stats()["completed"] == 1
+
+
+def test_overload_rejected_at_once():
+    executor = FeatureExecutor(mode='thread', workers=1, max_in_flight=1, max_queue=1, timeout=5)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(blocking, release, 'a'))
+        queued = asyncio.ensure_future(executor.run(blocking, release, 'b'))
+        await asyncio.sleep(0.05)
+        assert (executor.in_flight, executor.queued) == (1, 1)
+        started = time.monotonic()
+        try:
+            await executor.run(blocking, release, 'c')
+        except OverloadedError:
+            assert time.monotonic() - started < 0.5
+        else:
+            raise AssertionError("third call was not rejected")
+        # block=True waits for a slot instead of being rejected
+        blocked = asyncio.ensure_future(executor.run(blocking, release, 'd', block=True))
+        release.set()
+        return await asyncio.gather(running, queued, blocked)
+
+    try:
+        assert asyncio.run(main()) == ['a', 'b', 'd']
+    finally:
+        release.set()
+        executor.shutdown()
+    stats = executor.stats()
+    assert (stats["rejected"], stats["completed"], stats["in_flight"], stats["queued"]) == (1, 3, 0, 0)
+
+
+def test_deadline_while_running_keeps_the_slot():
+    executor = FeatureExecutor(mode='thread', workers=1, max_in_flight=1, max_queue=10, timeout=0.1)
+    release = threading.Event()
+
+    async def main():
+        try:
+            await executor.run(blocking, release)
+        except DeadlineExceededError:
+            pass
+        else:
+            raise AssertionError("deadline did not fire")
+        # The thread can't be interrupted, so its slot stays taken until it ends
+        assert executor.in_flight == 1
+        try:
+            await executor.run(blocking, release)
+        except DeadlineExceededError as e:
+            assert "waiting" in str(e)
+        else:
+            raise AssertionError("queued call did not time out")
+        release.set()
+        await asyncio.sleep(0.05)
+        assert executor.in_flight == 0
+        return await executor.run(blocking, release, 'done', timeout=None)
+
+    try:
+        assert asyncio.run(main()) == 'done'
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.stats()["timed_out"] == 2
+
+
+def test_errors_reach_the_caller():
+    executor = FeatureExecutor(mode='thread', workers=1)
+
+    async def main():
+        try:
+            await executor.run(int, 'not a number')
+        except ValueError:
+            return executor.in_flight
+        raise AssertionError("error was swallowed")
+
+    try:
+        assert asyncio.run(main()) == 0
+    finally:
+        executor.shutdown()
+
+
+def test_endpoint_status_codes():
+    """Overload answers 503 and a missed deadline 504"""
+    if pytest is not None:
+        pytest.importorskip('fastapi.testclient')
+    from fastapi.testclient import TestClient
+    import main
+
+    body = {"id": "1", "application_date": "2024-02-12T10:00:00", "contracts": []}
+    headers = {"Cache-Control": "no-cache"}
+    original = main.feature_executor
+
+    async def overloaded(*args, **kwargs):
+        raise OverloadedError("full")
+
+    async def late(*args, **kwargs):
+        raise DeadlineExceededError("too slow")
+
+    client = TestClient(main.app)
+    try:
+        for run, status in ((overloaded, 503), (late, 504)):
+            main.feature_executor = FeatureExecutor(mode='thread')
+            main.feature_executor.run = run
+            response = client.post('/calculate-features', json=body, headers=headers)
+            assert response.status_code == status, response.text
+            # The streaming endpoint folds its body on the executor too
+            response = client.post('/calculate-features/stream', json=body)
+            assert response.status_code == status, response.text
+    finally:
+        main.feature_executor = original
+
+
+def main():
+    tests = [test_inline_runs_on_the_caller, test_overload_rejected_at_once,
+             test_deadline_while_running_keeps_the_slot, test_errors_reach_the_caller, test_endpoint_status_codes]
+    # Tests needing optional packages are skipped when they are missing
+    skipped = (ImportError,) if pytest is None else (ImportError, pytest.skip.Exception)
+    for test in tests:
+        try:
+            test()
+        except skipped as e:
+            print(f"{test.__name__}: skipped ({e})")
+            continue
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Result cache: TTL expiry, LRU eviction and single-flight computation.
+
+Runs under pytest, or directly: python test_feature_cache.py
+"""
+import asyncio
+
+from feature_cache import _MISSING, FeatureCache, payload_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def constant(value):
+    async def compute():
+        return value
+    return compute
+
+
+def test_payload_key():
+    contracts = [{"bank": "003", "summa": "1"}]
+    assert payload_key('2024-02-12', contracts) == payload_key('2024-02-12', [{"summa": "1", "bank": "003"}])
+    assert payload_key('2024-02-12', contracts) != payload_key('2024-02-13', contracts)
+    assert payload_key('2024-02-12', contracts) != payload_key('2024-02-12', contracts, 'claim_windows')
+    # The JSON-string and decoded shapes never share a key
+    assert payload_key('2024-02-12', '[]') != payload_key('2024-02-12', [])
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = FeatureCache(maxsize=10, ttl=5.0, clock=clock)
+    assert run(cache.get_or_compute('k', constant(1))) == 1
+    clock.now = 4.9
+    assert run(cache.get_or_compute('k', constant(2))) == 1
+    clock.now = 5.0
+    assert run(cache.get_or_compute('k', constant(3))) == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_lru_eviction():
+    cache = FeatureCache(maxsize=2, ttl=60.0, clock=FakeClock())
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # a is now the most recently used
+    cache.put('c', 3)
+    assert cache.get('b') is _MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 2
+
+
+def test_disabled_cache_always_computes():
+    cache = FeatureCache(maxsize=0)
+    assert run(cache.get_or_compute('k', constant(1))) == 1
+    assert run(cache.get_or_compute('k', constant(2))) == 2
+    assert cache.stats()["size"] == 0
+
+
+def test_single_flight():
+    cache = FeatureCache(maxsize=10, ttl=60.0)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute('k', compute) for _ in range(20)))
+
+    results = run(main())
+    assert calls == 1
+    assert all(result == {"value": 1} for result in results)
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["inflight"]) == (1, 19, 0)
+
+
+def test_single_flight_failure_is_not_cached():
+    cache = FeatureCache(maxsize=10, ttl=60.0)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad input")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute('k', fail) for _ in range(5)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in run(main()))
+    assert run(cache.get_or_compute('k', constant(7))) == 7
+
+
+def main():
+    for test in (test_payload_key, test_ttl_expiry, test_lru_eviction, test_disabled_cache_always_computes,
+                 test_single_flight, test_single_flight_failure_is_not_cached):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Feature store: incremental updates give the features of a full recompute.
+
+Runs under pytest, or directly: python test_feature_store.py
+"""
+import os
+import random
+import tempfile
+
+from feature_registry import default_registry, window_registry
+from feature_store import FeatureStore
+from test_kernel_parity import APP_DAY, APPLICATION_DATE, random_applications
+
+LATER_DATE = '2024-08-30T09:00:00'
+LATER_DAY = 739128
+
+
+def test_incremental_equals_full_recompute():
+    rng = random.Random(3)
+    for registry in (default_registry(), window_registry()):
+        kernel = registry.compile()
+        store = FeatureStore(':memory:', registry)
+        for n, history in enumerate(random_applications(400, seed=5)):
+            applicant = f"applicant-{n}"
+            seen = []
+            # The history arrives over several applications, a few contracts at a time
+            while True:
+                batch = history[len(seen):len(seen) + rng.randint(0, 3)]
+                seen += batch
+                assert store.score(applicant, APPLICATION_DATE, batch) == kernel(APP_DAY, seen), seen
+                if len(seen) == len(history):
+                    break
+            # Stored state answers any later application date too
+            assert store.calculate_features(applicant, LATER_DATE) == kernel(LATER_DAY, history)
+        store.close()
+
+
+def test_replace_and_delete():
+    kernel = default_registry().compile()
+    old, new = random_applications(2, seed=9)
+    store = FeatureStore(':memory:')
+    store.score('a', APPLICATION_DATE, old)
+    assert store.score('a', APPLICATION_DATE, new, replace=True) == kernel(APP_DAY, new)
+    store.delete('a')
+    assert store.calculate_features('a', APPLICATION_DATE) == kernel(APP_DAY, [])
+    assert store.stats()["applicants"] == 0
+
+
+def test_state_survives_reopen():
+    kernel = default_registry().compile()
+    history = [contracts for contracts in random_applications(50, seed=2) if contracts][0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'store.db')
+        store = FeatureStore(path)
+        store.add_contracts('a', history[:1])
+        store.close()
+        store = FeatureStore(path)
+        assert store.score('a', APPLICATION_DATE, history[1:]) == kernel(APP_DAY, history)
+        store.close()
+        # A store built for other feature definitions is refused
+        try:
+            FeatureStore(path, window_registry())
+        except ValueError as e:
+            assert "different feature definitions" in str(e)
+        else:
+            raise AssertionError("store opened with a different registry")
+
+
+def main():
+    for test in (test_incremental_equals_full_recompute, test_replace_and_delete, test_state_survives_reopen):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
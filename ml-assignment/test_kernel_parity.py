@@ -0,0 +1,280 @@
+"""
+Parity of the typed feature paths with the dict kernel behind /calculate-features-from-json.
+
+The dict kernel is the reference: "present" means truthy and dates/amounts
+are parsed on the fly, so an unparseable date or amount still satisfies a
+`required` filter while never being counted or summed. Applications are
+generated with clean, malformed and oddly typed values and every path must
+give the same features.
+
+Runs under pytest, or directly: python test_kernel_parity.py
+"""
+import csv
+import json
+import os
+import random
+import tempfile
+from datetime import date
+
+from feature_registry import default_registry, window_registry
+from ingestion import ContractColumns
+from streaming_ingest import MAX_UNDATED_DAYS, ApplicationStreamParser, StreamParseError
+
+try:
+    import pytest
+except ImportError:  # run as a script
+    pytest = None
+
+APP_DAY = 738928  # 2024-02-12
+APPLICATION_DATE = '2024-02-12T10:00:00'
+DATES = ['', None, '01.02.2024', '15.12.2023', '2024-01-20', '2023-09-01', '1.2.2024',
+         'abc', '2024/01/01', '31.02.2024', '13.13.2023', '01.02.24', ' ']
+AMOUNTS = ['', None, '0', '100', '250.5', '1e3', 'abc', '1,5', '-', ' ', 0, 0.0, 12, 7.5]
+BANKS = ['', None, '003', 'LIZ', 'MKO', '014', 'TBC']
+CLAIM_IDS = ['', None, 'X', '609965']
+
+# Malformed values that still satisfy a `required` filter: (contracts, feature, dict-kernel value).
+# A loan with an unparseable summa still dates day_sinlastloan; one with an
+# unparseable contract_date still counts towards disb_bank_loan_wo_tbc.
+REGRESSIONS = [
+    ([{"contract_date": "01.02.2024", "summa": "abc", "claim_id": "X"}], 'day_sinlastloan', 11),
+    ([{"contract_date": "abc", "loan_summa": "100", "bank": "003"}], 'disb_bank_loan_wo_tbc', 100.0),
+]
+
+
+def random_contract(rng: random.Random) -> dict:
+    contract = {}
+    for name, values in (('contract_date', DATES), ('claim_date', DATES), ('summa', AMOUNTS),
+                         ('loan_summa', AMOUNTS), ('bank', BANKS), ('claim_id', CLAIM_IDS)):
+        # Leave some fields out entirely: missing is empty
+        if rng.random() < 0.9:
+            contract[name] = rng.choice(values)
+    return contract
+
+
+def random_applications(n: int = 3000, seed: int = 7):
+    rng = random.Random(seed)
+    return [[random_contract(rng) for _ in range(rng.randint(0, 8))] for _ in range(n)]
+
+
+def test_regressions():
+    kernel = default_registry().compile()
+    typed_kernel = default_registry().compile_typed()
+    for contracts, feature, expected in REGRESSIONS:
+        assert kernel(APP_DAY, contracts)[feature] == expected
+        for strict in (True, False):
+            columns = ContractColumns.from_contracts(contracts, strict=strict)
+            assert typed_kernel(APP_DAY, columns)[feature] == expected, (contracts, feature)
+
+
+def test_typed_kernel_parity():
+    for registry in (default_registry(), window_registry()):
+        kernel, typed_kernel = registry.compile(), registry.compile_typed()
+        for contracts in random_applications():
+            expected = kernel(APP_DAY, contracts)
+            for strict in (True, False):
+                columns = ContractColumns.from_contracts(contracts, strict=strict)
+                assert typed_kernel(APP_DAY, columns) == expected, (contracts, strict)
+
+
+def test_spec_matches_parity():
+    # FeatureSpec.matches drives the feature store, backfill and streaming paths
+    registry = default_registry()
+    for contracts in random_applications(500):
+        columns = ContractColumns.from_contracts(contracts)
+        for spec in registry.specs:
+            for k, contract in enumerate(contracts):
+                raw = all(contract.get(name, '') for name in spec.required) and \
+                    all(contract.get(name, '') not in values for name, values in spec.exclude)
+                assert spec.matches(columns, k) == bool(raw), (spec.name, contract)
+
+
+def test_sentinel_reports():
+    """Sentinels are features where nothing matched, not values that happen to be -1/-3"""
+    from metrics import MetricsRegistry
+
+    registry = default_registry()
+    kernel, typed_kernel = registry.compile(), registry.compile_typed()
+    for contracts in random_applications(1000):
+        expected = []
+        features = kernel(APP_DAY, contracts, expected)
+        assert all(features[name] in (-1, -3) for name in expected)
+        typed, streamed = [], []
+        typed_kernel(APP_DAY, ContractColumns.from_contracts(contracts), typed)
+        parser = ApplicationStreamParser()
+        parser.feed(application_body(contracts, csv_style=False))
+        parser.finish(streamed)
+        assert typed == streamed == expected, contracts
+
+    # A loan dated the day after the application is a genuine -1
+    contracts = [{"contract_date": "13.02.2024", "summa": "100"}]
+    sentinels = []
+    assert kernel(APP_DAY, contracts, sentinels)['day_sinlastloan'] == -1
+    assert 'day_sinlastloan' not in sentinels
+    service_metrics = MetricsRegistry(enabled=True)
+    service_metrics.record_features(kernel(APP_DAY, contracts), 1, sentinels)
+    assert 'feature="day_sinlastloan"' not in service_metrics.render()
+
+
+def application_body(contracts: list, csv_style: bool) -> bytes:
+    """A scoring request body in the CSV-style (contracts as a JSON string) or structured shape"""
+    return json.dumps({
+        "id": "parity",
+        "application_date": APPLICATION_DATE,
+        "contracts": json.dumps(contracts) if csv_style else contracts,
+    }).encode()
+
+
+def test_streaming_parity():
+    kernel = default_registry().compile()
+    rng = random.Random(11)
+    for contracts in random_applications(1000):
+        expected = kernel(APP_DAY, contracts)
+        for csv_style in (True, False):
+            body = application_body(contracts, csv_style)
+            parser = ApplicationStreamParser(slice_size=3)
+            step = rng.choice((1, 7, 64, len(body)))
+            for i in range(0, len(body), step):
+                parser.feed(body[i:i + step])
+            assert parser.finish() == expected, (contracts, csv_style)
+
+
+def test_json_endpoint_parity():
+    """/calculate-features and /calculate-features/stream answer like /calculate-features-from-json"""
+    if pytest is not None:
+        pytest.importorskip('fastapi.testclient')
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    headers = {"Cache-Control": "no-cache", "Content-Type": "application/json"}
+    applications = random_applications(300) + [contracts for contracts, _, _ in REGRESSIONS]
+    for contracts in applications:
+        response = client.post('/calculate-features-from-json', headers=headers,
+                               json=json.loads(application_body(contracts, csv_style=True)))
+        assert response.status_code == 200, response.text
+        expected = response.json()
+        for path, csv_style in (('/calculate-features', False), ('/calculate-features/stream', True),
+                                ('/calculate-features/stream', False)):
+            response = client.post(path, headers=headers, content=application_body(contracts, csv_style))
+            assert response.status_code == 200, (path, response.text)
+            assert response.json() == expected, (path, contracts)
+
+
+def claims_over_days(days: int) -> list:
+    """One claim per day, on `days` consecutive days ending on the application day"""
+    return [{"claim_date": date.fromordinal(APP_DAY - n).strftime('%d.%m.%Y'), "claim_id": str(n)}
+            for n in range(days)]
+
+
+def test_streaming_contracts_before_date():
+    """Contracts may precede application_date; the claim-day histogram stays bounded either way"""
+    kernel = default_registry().compile()
+    longest = 180
+    for days in (400, MAX_UNDATED_DAYS):
+        contracts = claims_over_days(days)
+        for csv_style in (True, False):
+            body = json.dumps({
+                "contracts": json.dumps(contracts) if csv_style else contracts,
+                "application_date": APPLICATION_DATE,
+            }).encode()
+            parser = ApplicationStreamParser(slice_size=64)
+            parser.feed(body)
+            assert parser.finish() == kernel(APP_DAY, contracts)
+            # Days outside the windows were dropped once the date arrived
+            assert len(parser.accumulator.state['tot_claim_cnt_l180d']) == longest + 1
+
+    # Past the limit the date must come first; in that order the same contracts are fine
+    contracts = claims_over_days(MAX_UNDATED_DAYS + 1)
+    for csv_style in (True, False):
+        value = json.dumps(contracts) if csv_style else contracts
+        parser = ApplicationStreamParser()
+        try:
+            parser.feed(json.dumps({"contracts": value, "application_date": APPLICATION_DATE}).encode())
+            parser.finish()
+        except StreamParseError as e:
+            assert "send application_date before contracts" in str(e)
+        else:
+            raise AssertionError("unbounded histogram before the application date")
+        parser = ApplicationStreamParser()
+        parser.feed(json.dumps({"application_date": APPLICATION_DATE, "contracts": value}).encode())
+        assert parser.finish() == kernel(APP_DAY, contracts)
+        assert len(parser.accumulator.state['tot_claim_cnt_l180d']) == longest + 1
+
+
+def test_streaming_endpoint_errors():
+    """An invalid body is a 422, like a request that fails validation"""
+    if pytest is not None:
+        pytest.importorskip('fastapi.testclient')
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    too_many_days = json.dumps({"contracts": claims_over_days(MAX_UNDATED_DAYS + 1),
+                                "application_date": APPLICATION_DATE})
+    for body in ('{"application_date": "2024-02-12T10:00:00", "contracts": [', '[]', '{"contracts": []}',
+                 '{"application_date": "not a date", "contracts": []}',
+                 '{"application_date": "2024-02-12T10:00:00", "contracts": [{"summa": [1]}]}', too_many_days):
+        response = client.post('/calculate-features/stream', content=body.encode())
+        assert response.status_code == 422, (body[:80], response.text)
+        assert response.json()["detail"].startswith("Invalid request: ")
+
+
+def write_applications_csv(path: str, applications: list) -> None:
+    """An applications file in the data.csv layout (contracts as JSON strings)"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'application_date', 'contracts'])
+        for i, contracts in enumerate(applications):
+            writer.writerow([f"{i}.0", APPLICATION_DATE, json.dumps(contracts) if contracts else ''])
+
+
+def assert_frame_parity(results, applications: list, registry) -> None:
+    kernel = registry.compile()
+    assert len(results) == len(applications)
+    for i, contracts in enumerate(applications):
+        row = {name: results[name].iloc[i].item() for name in registry.names}
+        assert row == kernel(APP_DAY, contracts), (i, contracts)
+
+
+def test_columnar_parity():
+    """Parquet / Arrow datasets and the vectorized CSV engine agree with the dict kernel"""
+    if pytest is not None:
+        pytest.importorskip('pyarrow')
+    import columnar_io
+    from batch_runner import read_chunks
+    from data_analysis import calculate_features_batch
+
+    applications = random_applications(1000) + [contracts for contracts, _, _ in REGRESSIONS]
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'applications.csv')
+        write_applications_csv(csv_path, applications)
+        for registry in (default_registry(), window_registry()):
+            chunk = next(read_chunks(csv_path, len(applications)))
+            assert_frame_parity(calculate_features_batch(chunk, registry), applications, registry)
+            for fmt in columnar_io.FORMATS:
+                dataset = os.path.join(tmp, f'dataset-{fmt}')
+                if not os.path.exists(dataset):
+                    columnar_io.convert_csv(csv_path, dataset, fmt, chunk_size=300)
+                for chunk_size in (10000, 97):
+                    results = columnar_io.calculate_features_dataset(dataset, registry, chunk_size)
+                    assert_frame_parity(results, applications, registry)
+
+
+def main():
+    tests = [test_regressions, test_typed_kernel_parity, test_spec_matches_parity, test_sentinel_reports,
+             test_streaming_parity, test_json_endpoint_parity, test_streaming_contracts_before_date,
+             test_streaming_endpoint_errors, test_columnar_parity]
+    # Tests needing optional packages are skipped when they are missing
+    skipped = (ImportError,) if pytest is None else (ImportError, pytest.skip.Exception)
+    for test in tests:
+        try:
+            test()
+        except skipped as e:
+            print(f"{test.__name__}: skipped ({e})")
+            continue
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Partitioned offline jobs: resume after an interruption, refuse changed settings.
+
+Runs under pytest, or directly: python test_partitioned_job.py
+"""
+import os
+import tempfile
+
+import pandas as pd
+
+from batch_runner import process_chunk, run_batch
+from partitioned_job import PartitionedJob
+from test_data_analysis import read_features
+from test_kernel_parity import random_applications, write_applications_csv
+
+CHUNK_SIZE = 25
+
+
+def interrupted_job(job_dir: str, input_path: str, finished: int) -> None:
+    """A run killed after `finished` partitions, with one more written but never recorded"""
+    job = PartitionedJob(job_dir, input_path, CHUNK_SIZE, {"claim_windows": False})
+    for index, chunk in job.pending():
+        if index == finished:
+            # Killed between writing the partition file and recording it in the manifest
+            process_chunk(chunk).iloc[:1].to_csv(job.part_path(index), index=False)
+            return
+        job.write(index, process_chunk(chunk))
+
+
+def test_resume_gives_the_uninterrupted_output():
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'applications.csv')
+        write_applications_csv(input_path, random_applications(110, seed=1))
+        expected_path = os.path.join(tmp, 'expected.csv')
+        run_batch(input_path, expected_path, workers=1, chunk_size=CHUNK_SIZE)
+
+        job_dir = os.path.join(tmp, 'job')
+        interrupted_job(job_dir, input_path, finished=2)
+        job = PartitionedJob(job_dir, input_path, CHUNK_SIZE, {"claim_windows": False})
+        assert (job.done, job.complete) == (2, False)
+        try:
+            job.merge(os.path.join(tmp, 'partial.csv'))
+        except ValueError as e:
+            assert "not complete" in str(e)
+        else:
+            raise AssertionError("merged an incomplete job")
+        finished = {i: os.stat(job.part_path(i)).st_mtime_ns for i in range(2)}
+
+        output_path = os.path.join(tmp, 'features.csv')
+        assert run_batch(input_path, output_path, workers=2, chunk_size=CHUNK_SIZE, job_dir=job_dir) == 110
+        pd.testing.assert_frame_equal(read_features(output_path), read_features(expected_path))
+        # Recorded partitions were reused, not recomputed
+        assert {i: os.stat(job.part_path(i)).st_mtime_ns for i in range(2)} == finished
+        assert PartitionedJob(job_dir, input_path, CHUNK_SIZE, {"claim_windows": False}).complete
+
+
+def test_changed_settings_are_refused():
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'applications.csv')
+        write_applications_csv(input_path, random_applications(60, seed=2))
+        job_dir = os.path.join(tmp, 'job')
+        output_path = os.path.join(tmp, 'features.csv')
+        run_batch(input_path, output_path, workers=1, chunk_size=CHUNK_SIZE, job_dir=job_dir)
+
+        changed = [
+            ("settings", dict(chunk_size=CHUNK_SIZE, claim_windows=True)),
+            ("chunk_size", dict(chunk_size=CHUNK_SIZE + 1)),
+        ]
+        for key, options in changed:
+            try:
+                run_batch(input_path, output_path, workers=1, job_dir=job_dir, **options)
+            except ValueError as e:
+                assert f"different {key}" in str(e), e
+            else:
+                raise AssertionError(f"resumed with a different {key}")
+
+        with open(input_path, 'a') as f:
+            f.write('extra,2024-02-12T10:00:00,\n')
+        try:
+            run_batch(input_path, output_path, workers=1, chunk_size=CHUNK_SIZE, job_dir=job_dir)
+        except ValueError as e:
+            assert "different input" in str(e), e
+        else:
+            raise AssertionError("resumed over a changed input file")
+
+
+def main():
+    for test in (test_resume_gives_the_uninterrupted_output, test_changed_settings_are_refused):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
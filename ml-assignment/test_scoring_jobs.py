@@ -0,0 +1,136 @@
+"""
+Scoring jobs: results in input order, resume, and lease takeover.
+
+Runs under pytest, or directly: python test_scoring_jobs.py
+"""
+import json
+import tempfile
+import threading
+import time
+
+from scoring_jobs import JobManager
+
+RECORDS = 9
+
+
+def score_id(record):
+    """Module-level, so it also runs on the process pool"""
+    if record.get('fail'):
+        raise ValueError("bad record")
+    return {"id": record['id']}
+
+
+def submit(jobs: JobManager, records: int = RECORDS) -> str:
+    upload = jobs.upload('ndjson')
+    for n in range(1, records + 1):
+        record = {"id": str(n), "fail": n == 4}
+        upload.write(json.dumps(record).encode() + b"\n")
+    return jobs.submit(upload)["id"]
+
+
+def wait_for(condition, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def results(jobs: JobManager, job_id: str) -> list:
+    with open(jobs.results_path(job_id), 'rb') as f:
+        return [json.loads(line) for line in f]
+
+
+def expected_results(records: int = RECORDS) -> list:
+    return [{"line": 4, "id": "4", "error": "Error calculating features: bad record"} if n == 4
+            else {"id": str(n)} for n in range(1, records + 1)]
+
+
+def test_job_runs_to_completion():
+    for executor in ('thread', 'process'):
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = JobManager(tmp, score_id, executor=executor, chunk_size=2)
+            jobs.start()
+            try:
+                job_id = submit(jobs)
+                wait_for(lambda: jobs.status(job_id)["status"] == 'succeeded')
+                status = jobs.status(job_id)
+                assert (status["total"], status["done"], status["failed"]) == (RECORDS, RECORDS, 1)
+                assert results(jobs, job_id) == expected_results()
+            finally:
+                jobs.shutdown()
+
+
+def test_stale_worker_does_not_write_after_takeover():
+    """A chunk outlasting the lease loses the job; the stale worker must not append its results"""
+    entered, release = threading.Event(), threading.Event()
+    stalled = []
+
+    def stalling_score(record):
+        # The first chunk of the first worker stalls until the job was taken over
+        if not stalled:
+            stalled.append(threading.current_thread().name)
+            entered.set()
+            release.wait(20)
+        # Marked, so any line the stale worker writes shows in the results
+        return dict(score_id(record), worker='stale')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stale = JobManager(tmp, stalling_score, executor='thread', chunk_size=2)
+        stale.start()
+        job_id = submit(stale)
+        assert entered.wait(20)
+        # The lease runs out while the chunk is still being scored
+        stale.store._execute("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job_id,))
+        current = JobManager(tmp, score_id, executor='thread', chunk_size=2)
+        current.start()
+        try:
+            wait_for(lambda: current.status(job_id)["status"] == 'succeeded')
+            # Let the stale worker finish its chunk; shutdown waits for its thread
+            release.set()
+            stale.shutdown()
+            assert results(current, job_id) == expected_results()
+            assert current.status(job_id)["attempts"] == 2
+        finally:
+            release.set()
+            current.shutdown()
+
+
+def test_shutdown_hands_the_job_back():
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_score(record):
+        entered.set()
+        release.wait(20)
+        return score_id(record)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        first = JobManager(tmp, slow_score, executor='thread', chunk_size=2)
+        first.start()
+        job_id = submit(first)
+        assert entered.wait(20)
+        stopping = threading.Thread(target=first.shutdown)
+        stopping.start()
+        release.set()
+        stopping.join(20)
+        second = JobManager(tmp, score_id, executor='thread', chunk_size=2)
+        try:
+            status = second.status(job_id)
+            # The chunk in flight was committed, then the job went back to the queue
+            assert (status["status"], status["done"]) == ('queued', 2)
+            second.start()
+            wait_for(lambda: second.status(job_id)["status"] == 'succeeded')
+            assert results(second, job_id) == expected_results()
+        finally:
+            second.shutdown()
+
+
+def main():
+    for test in (test_job_runs_to_completion, test_stale_worker_does_not_write_after_takeover,
+                 test_shutdown_hands_the_job_back):
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
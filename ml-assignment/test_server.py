@@ -0,0 +1,61 @@
+"""
+Pre-fork supervisor: workers that keep failing to start stop the server.
+
+Runs under pytest, or directly: python test_server.py
+"""
+import os
+import signal
+import time
+
+import server
+
+try:
+    import pytest
+except ImportError:  # run as a script
+    pytest = None
+
+
+async def failing_app(scope, receive, send):
+    """An app whose startup always fails, like one that can't load its models"""
+    if scope['type'] == 'lifespan':
+        await receive()
+        await send({'type': 'lifespan.startup.failed', 'message': 'cannot start'})
+
+
+def test_failed_starts_back_off_then_exit():
+    if pytest is not None:
+        pytest.importorskip('uvicorn')
+    if not hasattr(os, 'fork'):
+        return
+    settings = {name: getattr(server, name) for name in ('RESTART_BACKOFF', 'MAX_FAILED_STARTS')}
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    server.RESTART_BACKOFF, server.MAX_FAILED_STARTS = 0.2, 3
+    started = time.monotonic()
+    try:
+        server.serve(failing_app, '127.0.0.1', 0, workers=2, graceful_timeout=1)
+    except SystemExit as e:
+        assert e.code == 1
+    else:
+        raise AssertionError("supervisor kept restarting failing workers")
+    finally:
+        for name, value in settings.items():
+            setattr(server, name, value)
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    # Waited 0.2s, then 0.4s before the third start, rather than respawning at once
+    assert time.monotonic() - started >= 0.6
+
+
+def main():
+    skipped = (ImportError,) if pytest is None else (ImportError, pytest.skip.Exception)
+    for test in (test_failed_starts_back_off_then_exit,):
+        try:
+            test()
+        except skipped as e:
+            print(f"{test.__name__}: skipped ({e})")
+            continue
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()